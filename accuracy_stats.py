@@ -0,0 +1,343 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import signal_store
+from market_data import get_provider
+from trading_calendar import get_calendar
+from stock_signals import adjust_prices
+from logger_config import log_stock_analysis
+
+
+# 准确率统计表与历史信号放在同一个持久化卷上
+DEFAULT_STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'accuracy_stats.db')
+
+# 默认的后续观察窗口（交易日）
+DEFAULT_WINDOW = 5
+
+# 看涨信号，其余为看跌信号
+BULLISH_SIGNALS = {"主升", "底成立", "底结构", "底背离", "底钝化"}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stock_results (
+    date TEXT NOT NULL,
+    window_days INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT,
+    close REAL,
+    signals TEXT NOT NULL,
+    forward_return REAL NOT NULL,
+    hit INTEGER NOT NULL,
+    PRIMARY KEY (date, window_days, code)
+);
+CREATE TABLE IF NOT EXISTS accuracy_by_date (
+    date TEXT NOT NULL,
+    window_days INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    up INTEGER NOT NULL,
+    down INTEGER NOT NULL,
+    sum_return REAL NOT NULL,
+    source_mtime REAL NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (date, window_days)
+);
+CREATE TABLE IF NOT EXISTS accuracy_by_signal (
+    signal TEXT NOT NULL,
+    window_days INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    sum_return REAL NOT NULL,
+    PRIMARY KEY (signal, window_days)
+);
+'''
+
+
+def is_prediction_correct(signals, forward_return):
+    """有看涨信号时上涨、只有看跌信号时下跌视为预测正确"""
+    has_bullish_signal = any(signals.get(signal, False) for signal in BULLISH_SIGNALS)
+    return (forward_return > 0 and has_bullish_signal) or (forward_return < 0 and not has_bullish_signal)
+
+
+def is_signal_correct(signal, forward_return):
+    """单个信号的方向与后续涨跌是否一致"""
+    return forward_return > 0 if signal in BULLISH_SIGNALS else forward_return < 0
+
+
+# 已经定型的后续价格窗口不会再变化，缓存后不再请求
+_final_price_windows = {}
+
+
+def get_stock_prices_after_days(stock_code, signal_date_obj, days=DEFAULT_WINDOW):
+    """获取股票在信号日期后N个交易日内每天的价格"""
+    try:
+        # 确保股票代码格式正确
+        if not isinstance(stock_code, str):
+            stock_code = str(stock_code)
+
+        # 确保股票代码是6位数字格式
+        if len(stock_code) != 6 or not stock_code.isdigit():
+            log_stock_analysis(f"股票代码格式错误: {stock_code}", 'error')
+            return None
+
+        key = (stock_code, signal_date_obj.date(), days)
+        if key in _final_price_windows:
+            return _final_price_windows[key]
+
+        # 只请求信号日之后、已经有K线的交易日；还没有任何K线时不发起请求
+        calendar = get_calendar()
+        window = calendar.trading_days_after(signal_date_obj, days)
+        available = [day for day in window if day <= calendar.latest_available_day()]
+        if not available:
+            return None
+
+        start_date = available[0].strftime('%Y%m%d')
+        end_date = available[-1].strftime('%Y%m%d')
+
+        # 获取股票数据
+        df = get_provider().get_daily_bars(stock_code, start_date, end_date)
+
+        if df.empty:
+            log_stock_analysis(f"股票 {stock_code} 数据为空", 'warning')
+            return None
+
+        # 按日期排序；以信号日为基准前复权，与信号日的不复权收盘价可比，窗口内的除权除息不计入涨跌
+        df = adjust_prices(stock_code, df.sort_index(), adjust='qfq', base_date=signal_date_obj)
+
+        # 只返回实际存在的交易日数据，不进行错误填充
+        daily_prices = []
+        for i in range(len(df)):
+            daily_prices.append({
+                'date': df.index[i].date(),
+                'close': df['close'].iloc[i],
+                'day': i + 1
+            })
+
+        if calendar.is_window_final(signal_date_obj, days):
+            _final_price_windows[key] = daily_prices
+        return daily_prices
+
+    except Exception as e:
+        log_stock_analysis(f"获取股票 {stock_code} 后续价格失败: {e}", 'error')
+        return None
+
+
+class AccuracyStats:
+    """
+    预计算的准确率统计
+
+    每个信号日的后续观察窗口全部定型后，计算一次该日每只股票的后续涨幅并写入，
+    同时把增量累加到按日期、按信号类型汇总的小表中；读取统计时只查询汇总表。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_STATS_PATH
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接，成功时提交，结束后关闭"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def materialized_dates(self, window=DEFAULT_WINDOW):
+        """已经写入统计的信号日及其来源文件的修改时间"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT date, source_mtime FROM accuracy_by_date WHERE window_days = ?",
+                                (window,)).fetchall()
+        return {row['date']: row['source_mtime'] for row in rows}
+
+    def store_date(self, date, results, source_mtime, window=DEFAULT_WINDOW):
+        """
+        写入一个信号日的结果，并更新汇总表
+
+        同一信号日已经写入过时先扣除旧结果（历史文件被重写的情况）；
+        来源文件没有变化时不重复写入，多个进程同时更新也不会重复累加。
+
+        Args:
+            date: 信号日（YYYY-MM-DD）
+            results: 每只股票的结果列表（code/name/close/signals/forward_return）
+            source_mtime: 历史信号文件的修改时间
+            window: 后续观察窗口（交易日）
+
+        Returns:
+            是否写入
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT source_mtime FROM accuracy_by_date WHERE date = ? AND window_days = ?",
+                               (date, window)).fetchone()
+            if row is not None:
+                if row['source_mtime'] == source_mtime:
+                    return False
+                self._apply_signal_deltas(conn, self._load_results(conn, date, window), window, sign=-1)
+                conn.execute("DELETE FROM stock_results WHERE date = ? AND window_days = ?", (date, window))
+
+            conn.executemany(
+                "INSERT INTO stock_results (date, window_days, code, name, close, signals, forward_return, hit) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(date, window, r['code'], r['name'], r['close'],
+                  json.dumps([name for name, value in r['signals'].items() if value], ensure_ascii=False),
+                  r['forward_return'], int(is_prediction_correct(r['signals'], r['forward_return'])))
+                 for r in results]
+            )
+            self._apply_signal_deltas(conn, self._load_results(conn, date, window), window, sign=1)
+            conn.execute(
+                "INSERT OR REPLACE INTO accuracy_by_date "
+                "(date, window_days, total, hits, up, down, sum_return, source_mtime, updated_at) "
+                "SELECT ?, ?, COUNT(*), COALESCE(SUM(hit), 0), COALESCE(SUM(forward_return > 0), 0), "
+                "COALESCE(SUM(forward_return < 0), 0), COALESCE(SUM(forward_return), 0), ?, ? "
+                "FROM stock_results WHERE date = ? AND window_days = ?",
+                (date, window, source_mtime, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), date, window)
+            )
+        return True
+
+    @staticmethod
+    def _load_results(conn, date, window):
+        return conn.execute("SELECT signals, forward_return FROM stock_results WHERE date = ? AND window_days = ?",
+                            (date, window)).fetchall()
+
+    @staticmethod
+    def _apply_signal_deltas(conn, rows, window, sign):
+        """把一批股票结果按信号类型累加（sign=-1 时扣除）到汇总表"""
+        deltas = {}
+        for row in rows:
+            for signal in json.loads(row['signals']):
+                total, hits, sum_return = deltas.get(signal, (0, 0, 0.0))
+                deltas[signal] = (total + 1, hits + int(is_signal_correct(signal, row['forward_return'])),
+                                  sum_return + row['forward_return'])
+        conn.executemany(
+            "INSERT INTO accuracy_by_signal (signal, window_days, total, hits, sum_return) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(signal, window_days) DO UPDATE SET total = total + excluded.total, "
+            "hits = hits + excluded.hits, sum_return = sum_return + excluded.sum_return",
+            [(signal, window, sign * total, sign * hits, sign * sum_return)
+             for signal, (total, hits, sum_return) in deltas.items()]
+        )
+
+    def get_summary(self, window=DEFAULT_WINDOW):
+        """
+        读取汇总统计
+
+        Returns:
+            包含 window/overall/by_date/by_signal 的字典，准确率为0-1之间的小数，平均涨幅为百分比
+        """
+        with self._connect() as conn:
+            dates = conn.execute("SELECT * FROM accuracy_by_date WHERE window_days = ? ORDER BY date DESC",
+                                 (window,)).fetchall()
+            signals = conn.execute("SELECT * FROM accuracy_by_signal WHERE window_days = ? AND total > 0 "
+                                   "ORDER BY signal", (window,)).fetchall()
+
+        def rate(hits, total):
+            return hits / total if total else None
+
+        by_date = [{
+            'date': row['date'],
+            'total': row['total'],
+            'hits': row['hits'],
+            'up': row['up'],
+            'down': row['down'],
+            'accuracy': rate(row['hits'], row['total']),
+            'avg_return': rate(row['sum_return'], row['total'])
+        } for row in dates]
+        total = sum(item['total'] for item in by_date)
+        return {
+            'window': window,
+            'overall': {
+                'dates': len(by_date),
+                'total': total,
+                'hits': sum(item['hits'] for item in by_date),
+                'up': sum(item['up'] for item in by_date),
+                'down': sum(item['down'] for item in by_date),
+                'accuracy': rate(sum(item['hits'] for item in by_date), total),
+                'avg_return': rate(sum(row['sum_return'] for row in dates), total)
+            },
+            'by_date': by_date,
+            'by_signal': [{
+                'signal': row['signal'],
+                'total': row['total'],
+                'hits': row['hits'],
+                'accuracy': rate(row['hits'], row['total']),
+                'avg_return': rate(row['sum_return'], row['total'])
+            } for row in signals]
+        }
+
+
+def evaluate_signal_date(date, df, window=DEFAULT_WINDOW):
+    """计算一个信号日每只有信号的股票在后续窗口内的累计涨幅（百分比）"""
+    signal_columns = [col for col in df.columns if col not in ['code', 'name', 'date', 'close']]
+    date_obj = datetime.strptime(date, '%Y-%m-%d')
+    results = []
+    for row in df.to_dict('records'):
+        signals = {name: bool(row[name]) for name in signal_columns}
+        if not any(signals.values()):
+            continue
+        daily_prices = get_stock_prices_after_days(str(row['code']).zfill(6), date_obj, window)
+        if not daily_prices:
+            continue
+        results.append({
+            'code': str(row['code']).zfill(6),
+            'name': row['name'],
+            'close': float(row['close']),
+            'signals': signals,
+            'forward_return': float((daily_prices[-1]['close'] - row['close']) / row['close'] * 100)
+        })
+    return results
+
+
+_update_lock = threading.Lock()
+
+
+def update_accuracy_stats(stats=None, window=DEFAULT_WINDOW, now=None):
+    """
+    增量更新准确率统计
+
+    只处理后续窗口已经全部定型、且尚未写入（或历史文件在写入后被重写）的信号日，
+    没有新完成的窗口时不发起任何行情请求。
+
+    Returns:
+        本次写入的信号日列表
+    """
+    stats = stats or AccuracyStats()
+    history_dir = signal_store.HISTORY_DIR
+    if not os.path.exists(history_dir):
+        return []
+
+    calendar = get_calendar()
+    with _update_lock:
+        materialized = stats.materialized_dates(window)
+        updated = []
+        for csv_file in sorted(os.listdir(history_dir)):
+            if not (csv_file.startswith('signals_') and csv_file.endswith('.csv')):
+                continue
+            date = datetime.strptime(csv_file[len('signals_'):-len('.csv')], '%Y%m%d').strftime('%Y-%m-%d')
+            path = os.path.join(history_dir, csv_file)
+            mtime = os.path.getmtime(path)
+            if materialized.get(date) == mtime or not calendar.is_window_final(date, window, now):
+                continue
+            try:
+                df = pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str})
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame(columns=['code', 'name', 'date', 'close'])
+            except Exception as e:
+                log_stock_analysis(f"读取历史信号文件 {csv_file} 失败: {e}", 'error')
+                continue
+            if stats.store_date(date, evaluate_signal_date(date, df, window), mtime, window):
+                updated.append(date)
+        if updated:
+            log_stock_analysis(f"准确率统计已更新: {', '.join(updated)}")
+        return updated
@@ -1,5 +1,6 @@
-from flask import Flask, render_template, jsonify, request
-from stock_signals import get_all_stock_signals
+from flask import Flask, render_template, jsonify, request, redirect, g, Response
+from stock_signals import (get_all_stock_signals, get_intraday_signals, retry_failed_stocks, merge_signals,
+                           summarize_outcomes)
 import threading
 import time
 import json
@@ -7,7 +8,18 @@ from datetime import datetime, timedelta
 import os
 import webbrowser
 import pandas as pd
-import akshare as ak
+from scan_checkpoint import get_checkpoint
+from refresh_lease import RefreshLease
+import signal_store
+from event_stream import start_event_server, notify_snapshot_published
+from trading_calendar import get_calendar
+from indicator_cache import get_indicator_cache, INDICATOR_COLUMNS
+from signal_query import build_signal_index, QueryError
+from metrics import counter, gauge, histogram, render_metrics
+from compact_payload import (PayloadCache, encode_signals_columns, encode_history_columns, FORMATS,
+                             FORMAT_ROWS, FORMAT_COLUMNS)
+from timeframes import TIMEFRAMES, DAILY, select_timeframe
+from accuracy_stats import AccuracyStats, DEFAULT_WINDOW, update_accuracy_stats, get_stock_prices_after_days, is_prediction_correct
 from logger_config import setup_flask_logging, log_system_info, log_api_request, get_unified_logger, cleanup_old_logs
 
 app = Flask(__name__)
@@ -19,156 +31,207 @@ setup_flask_logging(app)
 global_signals = []
 last_update_time = None
 update_lock = threading.Lock()
+# 最近一次刷新（完整扫描或盘中增量刷新）中每只股票的处理结果
+global_outcomes = []
+# 最近一次完整扫描在检查点中的扫描ID，重试结果写回该扫描；盘中增量刷新没有检查点，为None
+global_run_id = None
+# /api/refresh/retry 允许的最大重试轮数
+MAX_RETRY_ROUNDS = 5
 
-def update_signals():
-    """更新股票信号数据"""
-    global global_signals, last_update_time
+# 信号快照发布在共享的history卷上，多个进程/容器之间只由持有刷新租约的进程扫描，其余进程读取快照
+# 已加载快照文件的修改时间，用于发现其他进程发布的新快照
+snapshot_mtime = None
+# 当前快照的版本号，每次发布新快照加1，客户端据此增量获取变化
+snapshot_version = 0
+# 按code索引的当前快照（版本号, 索引），增量请求只查找变化的股票
+_signal_index = (None, {})
+# 组合条件选股的位图索引（版本号, SignalIndex），每个快照版本构建一次
+_query_index = (None, None)
+query_index_lock = threading.Lock()
+# 编码并预压缩好的 /api/signals、/api/history 响应体，按快照版本缓存
+payload_cache = PayloadCache()
+# 设为off时Web进程只读取快照，不自行扫描（由 scan.py 定时任务负责更新）
+WEB_REFRESH_ENABLED = os.environ.get('WEB_REFRESH', 'on').lower() != 'off'
+# 快照推送（SSE）服务的端口，由单独的事件循环线程服务，不占用Flask请求线程
+EVENTS_PORT = int(os.environ.get('EVENTS_PORT', '5001'))
+
+# 指标：刷新耗时、快照新旧程度和各接口的请求耗时
+REFRESH_DURATION = histogram('signal_refresh_duration_seconds', '信号刷新耗时（秒）', labels=('mode',),
+                             buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+REFRESH_TOTAL = counter('signal_refresh_total', '信号刷新次数', labels=('mode',))
+HTTP_LATENCY = histogram('http_request_duration_seconds', '接口请求耗时（秒）', labels=('route', 'method', 'status'))
+gauge('signal_snapshot_age_seconds', '当前信号快照距上次更新的时间（秒）').set_function(
+    lambda: (datetime.now() - last_update_time).total_seconds() if last_update_time else None)
+gauge('signal_snapshot_version', '当前信号快照的版本号').set_function(lambda: snapshot_version)
+gauge('signal_snapshot_stocks', '当前信号快照中的股票数量').set_function(lambda: len(global_signals))
+
+def update_signals(intraday=False):
+    """更新股票信号数据
+    
+    Args:
+        intraday: 是否优先使用盘中增量刷新（一次实时快照修补本地日线缓存），不可用时退回完整扫描
+    """
+    global global_signals, last_update_time, global_outcomes, global_run_id
     logger = get_unified_logger('flask_app')
     
-    with update_lock:
+    lease = RefreshLease()
+    with update_lock, lease.hold() as is_leader:
+        if not is_leader:
+            logger.info("其他进程正在刷新股票信号，本进程使用其发布的快照")
+            sync_published_snapshot()
+            return
+        # 拿到租约后再检查一次，其他进程可能刚刚发布了新快照
+        sync_published_snapshot()
+        if not should_update():
+            logger.info("已有其他进程发布的最新快照，跳过本次刷新")
+            return
+        
         logger.info("开始更新股票信号...")
-        signals = get_all_stock_signals()
+        refresh_start = time.time()
+        mode = 'intraday'
+        signals = None
+        outcomes = []
+        run_id = None
+        if intraday:
+            signals = get_intraday_signals(outcomes=outcomes)
+        if signals is None:
+            mode = 'full'
+            checkpoint = get_checkpoint()
+            signals, outcomes, run_id = get_all_stock_signals(return_outcomes=True, checkpoint=checkpoint,
+                                                              return_run_id=True)
+            # 失败的股票单独再跑一轮，结果合并进本次快照并写回检查点
+            if summarize_outcomes(outcomes)['failed']:
+                retried, outcomes = retry_failed_stocks(outcomes, max_rounds=1, checkpoint=checkpoint, run_id=run_id)
+                signals = merge_signals(signals, retried)
+        if not lease.is_held():
+            logger.error("刷新租约已被其他进程接管，放弃发布本次刷新结果")
+            return
+        global_outcomes = outcomes
+        global_run_id = run_id
         global_signals = signals
         last_update_time = datetime.now()
         
         # 保存数据到文件
-        with open('stock_signals.json', 'w', encoding='utf-8') as f:
-            json.dump({'signals': signals, 'update_time': last_update_time.strftime('%Y-%m-%d %H:%M:%S')}, f, ensure_ascii=False)
+        save_snapshot()
         
         # 保存为CSV文件
         save_signals_to_csv(signals)
+        REFRESH_DURATION.observe(time.time() - refresh_start, mode=mode)
+        REFRESH_TOTAL.inc(mode=mode)
         logger.info("股票信号更新完成")
+    
+    # 有新完成的观察窗口时在后台更新准确率统计
+    refresh_accuracy_async()
+
+def retry_failed_signals(max_rounds=1, backoff=0):
+    """只重试最近一次扫描中失败的股票，并把结果合并进当前快照，成功的股票不重新计算"""
+    global global_signals, global_outcomes
+    logger = get_unified_logger('flask_app')
+    
+    lease = RefreshLease()
+    with update_lock, lease.hold() as is_leader:
+        if not is_leader:
+            logger.info("其他进程正在刷新股票信号，暂不重试")
+            return summarize_outcomes(global_outcomes)
+        failed = summarize_outcomes(global_outcomes)['failed']
+        if not failed:
+            return summarize_outcomes(global_outcomes)
+        logger.info(f"开始重试失败的股票: {len(failed)} 只")
+        retried, outcomes = retry_failed_stocks(global_outcomes, max_rounds=max_rounds, backoff=backoff,
+                                                checkpoint=get_checkpoint() if global_run_id else None,
+                                                run_id=global_run_id)
+        if not lease.is_held():
+            logger.error("刷新租约已被其他进程接管，放弃发布本次重试结果")
+            return summarize_outcomes(global_outcomes)
+        global_outcomes = outcomes
+        global_signals = merge_signals(global_signals, retried)
+        save_snapshot()
+        save_signals_to_csv(global_signals)
+        logger.info(f"重试完成，合并 {len(retried)} 只股票的信号")
+        return summarize_outcomes(global_outcomes)
+
+def save_snapshot():
+    """将当前信号快照发布到共享目录"""
+    global snapshot_mtime, snapshot_version
+    snapshot_mtime, snapshot_version = signal_store.save_snapshot(global_signals, last_update_time)
+    notify_snapshot_published()
 
 def save_signals_to_csv(signals):
     """将信号数据保存为CSV文件"""
     if not signals:
         return
 
-    # 时间校验：如果当前时间在15:31之前，则不保存
+    # 只有交易日收盘数据定型（15:31）之后才保存
     current_time = datetime.now()
     logger = get_unified_logger('flask_app')
     
-    if current_time.hour < 15 or (current_time.hour == 15 and current_time.minute < 31):
-        logger.info(f"当前时间 {current_time.strftime('%H:%M')} 在15:31之前，暂不保存信号")
-        return 
+    saved_history = signal_store.save_finalized_history(signals, current_time, now=current_time)
+    if saved_history is None:
+        logger.info(f"{current_time.strftime('%Y-%m-%d %H:%M')} 不是交易日收盘定型之后，暂不保存信号")
+        return
 
-    # 获取当前文件所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    history_dir = os.path.join(current_dir, 'history')
-    
-    # 创建history目录
-    if not os.path.exists(history_dir):
-        os.makedirs(history_dir)
-    
-    # 只保存有信号的股票
-    csv_data = []
-    for signal in signals:
-        # 检查是否有任何信号为True
-        if any(signal['signals'].values()):
-            row = {
-                'code': signal['code'],
-                'name': signal['name'],
-                'date': signal['date'],
-                'close': signal['close']
-            }
-            # 添加所有信号
-            for signal_name, signal_value in signal['signals'].items():
-                row[signal_name] = signal_value
-            csv_data.append(row)
-    
-    # 创建DataFrame并保存
-    df = pd.DataFrame(csv_data)
-    today = datetime.now().strftime('%Y%m%d')
-    csv_filename = os.path.join(history_dir, f'signals_{today}.csv')
-    df.to_csv(csv_filename, index=False, encoding='utf-8-sig')
-    
-    logger = get_unified_logger('flask_app')
-    logger.info(f"信号数据已保存到: {csv_filename}，共保存 {len(csv_data)} 只有信号的股票")
+    csv_filename, saved = saved_history
+    logger.info(f"信号数据已保存到: {csv_filename}，共保存 {saved} 只有信号的股票")
 
 def load_cached_signals():
     """从缓存文件加载信号数据"""
-    global global_signals, last_update_time
+    global global_signals, last_update_time, snapshot_mtime, snapshot_version
     logger = get_unified_logger('flask_app')
     
     try:
-        if os.path.exists('stock_signals.json'):
-            with open('stock_signals.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                global_signals = data['signals']
-                last_update_time = datetime.strptime(data['update_time'], '%Y-%m-%d %H:%M:%S')
-                logger.info("已从缓存加载股票信号数据")
+        snapshot = signal_store.load_snapshot()
+        if snapshot is not None:
+            global_signals, last_update_time, snapshot_mtime, snapshot_version = snapshot
+            logger.info("已从缓存加载股票信号数据")
     except Exception as e:
         logger.error(f"加载缓存数据出错: {e}")
 
+def sync_published_snapshot():
+    """共享目录中的快照被其他进程更新过时重新加载"""
+    mtime = signal_store.get_snapshot_mtime()
+    if mtime is not None and mtime != snapshot_mtime:
+        load_cached_signals()
+
+def is_trading_time(now=None):
+    """判断是否处于交易时间（交易日的9:30-15:00）"""
+    now = now or datetime.now()
+    if not get_calendar().is_trading_day(now):
+        return False
+    return (now.hour > 9 or (now.hour == 9 and now.minute >= 30)) and now.hour < 15
+
 def should_update():
     """判断是否需要更新数据"""
     if last_update_time is None:
         return True
     now = datetime.now()
     # 如果是交易时间（9:30-15:00）且距离上次更新超过5分钟，则更新
-    if (now.hour > 9 or (now.hour == 9 and now.minute >= 30)) and now.hour < 15:
+    if is_trading_time(now):
         return (now - last_update_time).seconds >= 1800
-    # 非交易时间，每天更新一次
-    return (now - last_update_time).days >= 1
+    # 非交易时间：最近一个交易日的收盘数据定型后更新过就不再刷新（周末、节假日不刷新）
+    return last_update_time < get_calendar().finalized_time(now)
 
-def get_stock_prices_after_days(stock_code, signal_date_obj, days=5):
-    """获取股票在信号日期后N天内每天的价格"""
-    try:
-        # 确保股票代码格式正确
-        if not isinstance(stock_code, str):
-            stock_code = str(stock_code)
-        
-        # 确保股票代码是6位数字格式
-        if len(stock_code) != 6 or not stock_code.isdigit():
-            logger = get_unified_logger('flask_app')
-            logger.error(f"股票代码格式错误: {stock_code}")
-            return None
-        
-        days_diff = (datetime.now().date() - signal_date_obj.date()).days
+accuracy_lock = threading.Lock()
 
-        start_date = (signal_date_obj + timedelta(days=1)).strftime('%Y%m%d')
-        gap = min(days, days_diff)
-        end_date = (signal_date_obj + timedelta(days=gap)).strftime('%Y%m%d')
-        
-        # 获取股票数据
-        df = ak.stock_zh_a_hist(symbol=stock_code, period="daily", 
-                               start_date=start_date,
-                               end_date=end_date,
-                               adjust="")
-        
-        if df.empty:
-            logger = get_unified_logger('flask_app')
-            logger.warning(f"股票 {stock_code} 数据为空")
-            return None
-        
-        # 处理日期列并排序
-        df['date'] = pd.to_datetime(df['日期'])
-        df = df.sort_values('date')
-        
-        # 只返回实际存在的交易日数据，不进行错误填充
-        daily_prices = []
-        for i in range(len(df)):
-            row = df.iloc[i]
-            daily_prices.append({
-                'date': row['日期'],
-                'close': row['收盘'],
-                'day': i + 1
-            })
-        
-        return daily_prices
-            
-    except Exception as e:
-        logger = get_unified_logger('flask_app')
-        logger.error(f"获取股票 {stock_code} 后续价格失败: {e}")
-        return None
+def refresh_accuracy_async():
+    """在后台线程中增量更新准确率统计，已有更新在进行时直接返回"""
+    if not accuracy_lock.acquire(blocking=False):
+        return
+    
+    def run():
+        try:
+            update_accuracy_stats()
+        except Exception as e:
+            get_unified_logger('flask_app').error(f"更新准确率统计失败: {e}")
+        finally:
+            accuracy_lock.release()
+    
+    threading.Thread(target=run, daemon=True).start()
 
 def load_signals_from_csv():
     """从CSV文件加载信号数据"""
     signals_by_date = {}
     
-    # 获取当前文件所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    history_dir = os.path.join(current_dir, 'history')
+    history_dir = signal_store.HISTORY_DIR
     
     # 查找history目录下的所有信号CSV文件
     logger = get_unified_logger('flask_app')
@@ -210,6 +273,25 @@ def load_signals_from_csv():
     
     return signals_by_date
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    """按路由模板（而不是具体URL）记录请求耗时，避免股票代码等参数产生大量序列"""
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method,
+                             status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus文本格式的指标"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """主页"""
@@ -220,47 +302,217 @@ def history():
     """历史信号页面"""
     return render_template('history.html')
 
+@app.route('/api/events')
+def get_events():
+    """快照推送：没有经过nginx转发时重定向到推送服务的端口"""
+    host = request.host.rsplit(':', 1)[0] if not request.host.endswith(']') else request.host
+    return redirect(f"{request.scheme}://{host}:{EVENTS_PORT}/api/events", code=307)
+
+def encoded_response(body):
+    """按 Accept-Encoding 返回预压缩的响应体"""
+    data, encoding = body.negotiate(request.headers.get('Accept-Encoding', ''))
+    response = Response(data, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def matches_signal_filter(stock, signal_type):
+    """指定信号类型时只保留该信号为真的股票，否则保留有任何信号的股票"""
+    if signal_type:
+        return stock['signals'].get(signal_type, False)
+    return any(stock['signals'].values())
+
+def get_signal_index():
+    """当前快照按code的索引，快照版本变化时重建"""
+    global _signal_index
+    if _signal_index[0] != (snapshot_version, id(global_signals)):
+        _signal_index = ((snapshot_version, id(global_signals)), {stock['code']: stock for stock in global_signals})
+    return _signal_index[1]
+
 @app.route('/api/signals')
 def get_signals():
-    """获取股票信号API"""
+    """获取股票信号API
+    
+    带 since=<版本号> 参数时只返回该版本之后变化的股票：upserts 为新增或内容变化且符合筛选条件的股票，
+    removed 为不再符合筛选条件（或已从快照中删除）的股票代码；版本过旧时返回 reload=true 和全量数据。
+    全量数据带 format=columns 参数时按列返回（见 compact_payload），响应体每个快照版本只编码压缩一次。
+    timeframe=weekly/monthly/60min 时返回该周期的信号（默认 daily），记录中另有 timeframe 和 partial（周期尚未走完）。
+    """
     # 获取筛选条件
     signal_type = request.args.get('signal_type', '')
+    since = request.args.get('since', None, type=int)
+    fmt = request.args.get('format', FORMAT_ROWS)
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format 只能是 {', '.join(FORMATS)}"}), 400
+    timeframe = request.args.get('timeframe', DAILY)
+    if timeframe not in TIMEFRAMES:
+        return jsonify({'error': f"timeframe 只能是 {', '.join(TIMEFRAMES)}"}), 400
     
-    if should_update():
-        update_signals()
+    sync_published_snapshot()
+    if WEB_REFRESH_ENABLED and should_update():
+        update_signals(intraday=is_trading_time())
     
-    filtered_signals = []
-    for stock in global_signals:
-        if signal_type:
-            if stock['signals'].get(signal_type, False):
-                filtered_signals.append(stock)
+    response = {
+        'version': snapshot_version,
+        'update_time': last_update_time.strftime('%Y-%m-%d %H:%M:%S') if last_update_time else None
+    }
+    changed = signal_store.get_changed_codes(since, snapshot_version) if since is not None else None
+    if changed is not None:
+        index = get_signal_index()
+        selected = [select_timeframe(index[code], timeframe) for code in sorted(changed) if code in index]
+        upserts = [stock for stock in selected if stock is not None and matches_signal_filter(stock, signal_type)]
+        upsert_codes = {stock['code'] for stock in upserts}
+        response['delta'] = {
+            'upserts': upserts,
+            'removed': sorted(code for code in changed if code not in upsert_codes)
+        }
+        log_api_request('/api/signals', {'signal_type': signal_type, 'since': since, 'timeframe': timeframe},
+                        len(upserts))
+        return jsonify(response)
+    
+    def build():
+        selected = (select_timeframe(stock, timeframe) for stock in global_signals)
+        filtered_signals = [stock for stock in selected
+                            if stock is not None and matches_signal_filter(stock, signal_type)]
+        if fmt == FORMAT_COLUMNS:
+            payload = encode_signals_columns(filtered_signals, response['version'], response['update_time'])
         else:
-            # 如果没有指定信号类型，返回所有有任何信号的股票
-            if any(stock['signals'].values()):
-                filtered_signals.append(stock)
+            payload = dict(response, signals=filtered_signals)
+        if since is not None:
+            payload['reload'] = True
+        return payload, len(filtered_signals)
+    
+    key = ('signals', snapshot_version, id(global_signals), response['update_time'], signal_type, fmt, timeframe,
+           since is not None)
+    body = payload_cache.get(key, build)
     
     # 记录API请求日志
-    log_api_request('/api/signals', {'signal_type': signal_type}, len(filtered_signals))
+    log_api_request('/api/signals', {'signal_type': signal_type, 'format': fmt, 'timeframe': timeframe}, body.count)
+    return encoded_response(body)
+
+def get_query_index():
+    """当前快照的选股位图索引，快照版本变化时重建"""
+    global _query_index
+    key = (snapshot_version, id(global_signals))
+    with query_index_lock:
+        if _query_index[0] != key:
+            _query_index = (key, build_signal_index(global_signals, version=snapshot_version))
+        return _query_index[1]
+
+@app.route('/api/query')
+def query_signals():
+    """组合条件选股API
     
+    参数：q 布尔表达式（如 "底背离 AND 底结构 AND NOT 顶钝化 AND close < 50"、"ANY(主升, 3)"），
+    limit 最多返回的股票数量。
+    """
+    expression = request.args.get('q', '')
+    limit = request.args.get('limit', None, type=int)
+    if 'limit' in request.args and (limit is None or limit < 1):
+        return jsonify({'error': 'limit 应为不小于1的整数'}), 400
+    
+    sync_published_snapshot()
+    index = get_query_index()
+    start_time = time.perf_counter()
+    try:
+        matched = index.query(expression, limit=limit)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    
+    log_api_request('/api/query', {'q': expression, 'limit': limit}, len(matched))
     return jsonify({
-        'signals': filtered_signals,
+        'query': expression,
+        'version': index.version,
+        'dates': index.dates,
+        'missing_dates': index.missing_dates,
+        'signals': matched,
+        'elapsed_ms': round(elapsed_ms, 3),
         'update_time': last_update_time.strftime('%Y-%m-%d %H:%M:%S') if last_update_time else None
     })
 
-@app.route('/api/history')
-def get_history():
-    # """获取历史信号数据API"""
-    # days = request.args.get('days', 5, type=int)
-    days = 5
+@app.route('/api/refresh/status')
+def get_refresh_status():
+    """最近一次扫描的处理结果统计API（progress为检查点中的实时进度，扫描进行中也可读取）"""
+    log_api_request('/api/refresh/status')
+    return jsonify({
+        'update_time': last_update_time.strftime('%Y-%m-%d %H:%M:%S') if last_update_time else None,
+        'outcomes': summarize_outcomes(global_outcomes),
+        'progress': get_checkpoint().get_progress()
+    })
+
+@app.route('/api/refresh/retry', methods=['POST'])
+def retry_refresh():
+    """重试最近一次扫描中失败的股票API，rounds 为重试轮数（1到 MAX_RETRY_ROUNDS）"""
+    max_rounds = request.args.get('rounds', None, type=int)
+    if 'rounds' in request.args and (max_rounds is None or not 1 <= max_rounds <= MAX_RETRY_ROUNDS):
+        return jsonify({'error': f'rounds 应为1到{MAX_RETRY_ROUNDS}之间的整数'}), 400
+    max_rounds = max_rounds or 1
+    summary = retry_failed_signals(max_rounds=max_rounds)
+    log_api_request('/api/refresh/retry', {'rounds': max_rounds}, len(summary['failed']))
+    return jsonify({'outcomes': summary})
+
+@app.route('/api/accuracy')
+def get_accuracy():
+    """按信号日、按信号类型预计算的准确率与平均涨幅API（只包含后续观察窗口已定型的信号日）
+
+    只预计算 DEFAULT_WINDOW 个交易日的观察窗口，days 为其他值时返回400
+    """
+    days = request.args.get('days', DEFAULT_WINDOW, type=int)
+    if days != DEFAULT_WINDOW:
+        return jsonify({'error': f"days 只能是 {DEFAULT_WINDOW}（只预计算了该观察窗口）"}), 400
+    summary = AccuracyStats().get_summary(window=days)
+    refresh_accuracy_async()
+    log_api_request('/api/accuracy', {'days': days}, len(summary['by_date']))
+    return jsonify(summary)
+
+@app.route('/api/stock/<code>/indicators')
+def get_stock_indicators(code):
+    """个股指标序列API（列式JSON）
+    
+    参数：start/end 起止日期（YYYY-MM-DD，含），columns 逗号分隔的列名（默认 close,DIF,DEA,MACD），
+    max_points 最多返回的点数（超过时降采样，用于绘图）。
+    序列由本地日线缓存计算并缓存在内存中，不访问行情接口。
+    """
+    columns = [c for c in request.args.get('columns', '').split(',') if c] or None
+    unknown = [c for c in columns or [] if c not in INDICATOR_COLUMNS]
+    if not code.isalnum() or unknown:
+        return jsonify({'error': f"不支持的股票代码或列: {unknown or code}", 'columns': INDICATOR_COLUMNS}), 400
+    try:
+        start = pd.Timestamp(request.args['start']) if request.args.get('start') else None
+        end = pd.Timestamp(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': '日期格式应为YYYY-MM-DD'}), 400
+    max_points = request.args.get('max_points', None, type=int)
+    if 'max_points' in request.args and (max_points is None or max_points < 1):
+        return jsonify({'error': 'max_points 应为不小于1的整数'}), 400
+    
+    series = get_indicator_cache().get(code)
+    if series is None:
+        return jsonify({'error': f"没有 {code} 的本地日线数据"}), 404
+    result = series.select(start=start, end=end, columns=columns, max_points=max_points)
+    log_api_request(f'/api/stock/{code}/indicators',
+                    {'start': request.args.get('start'), 'end': request.args.get('end'), 'columns': columns},
+                    len(result['dates']))
+    return jsonify(result)
+
+def get_history_signature():
+    """history目录下信号CSV文件的（文件名, 修改时间），用于判断历史响应体是否需要重新生成"""
+    history_dir = signal_store.HISTORY_DIR
+    if not os.path.exists(history_dir):
+        return ()
+    return tuple(sorted((f, os.path.getmtime(os.path.join(history_dir, f))) for f in os.listdir(history_dir)
+                        if f.startswith('signals_') and f.endswith('.csv')))
+
+def compute_history(days):
+    """读取历史信号并计算每只有信号的股票之后每天的涨幅（不含今天的信号）"""
     signals_by_date = load_signals_from_csv()
     
     # 过滤掉今天的数据
     today = datetime.now().date()
     filtered_signals_by_date = {}
     
-    # 记录API请求
-    log_api_request('/api/history', {'days': days})
-    
     # 为每个股票计算后续每天的涨幅
     for date_str, stocks in signals_by_date.items():
         date_obj = datetime.strptime(date_str, '%Y-%m-%d')
@@ -295,14 +547,7 @@ def get_history():
                         last_price = daily_prices[-1]['close']
                         accumulate_number = float(((last_price - stock['close']) / stock['close']) * 100)
 
-                        bullish_signals = {"主升", "底成立", "底结构", "底背离", "底钝化"}
-                        signals = stock['signals']
-
-                        has_bullish_signal = any(signals.get(signal, False) for signal in bullish_signals)
-                        has_bear_signal = not has_bullish_signal
-
-                        status = (accumulate_number > 0 and has_bullish_signal) or (
-                                    accumulate_number < 0 and has_bear_signal)
+                        status = is_prediction_correct(stock['signals'], accumulate_number)
                         
                         stock['accumulate'] = {
                             "number": accumulate_number,
@@ -318,10 +563,31 @@ def get_history():
                     stock['daily_changes'] = None
                     stock['accumulate'] = None
     
-    return jsonify({
-        'signals_by_date': filtered_signals_by_date,
-        'days': days
-    })
+    return filtered_signals_by_date
+
+@app.route('/api/history')
+def get_history():
+    """获取历史信号数据API
+
+    响应体按历史CSV文件、快照版本和日期缓存（新快照可能带来新的后续行情），format=columns 时返回按列组织的格式
+    """
+    # days = request.args.get('days', 5, type=int)
+    days = 5
+    fmt = request.args.get('format', FORMAT_ROWS)
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format 只能是 {', '.join(FORMATS)}"}), 400
+    
+    # 记录API请求
+    log_api_request('/api/history', {'days': days, 'format': fmt})
+    
+    def build():
+        signals_by_date = compute_history(days)
+        if fmt == FORMAT_COLUMNS:
+            return encode_history_columns(signals_by_date, days), None
+        return {'signals_by_date': signals_by_date, 'days': days}, None
+    
+    key = ('history', snapshot_version, get_history_signature(), datetime.now().date(), days, fmt)
+    return encoded_response(payload_cache.get(key, build))
 
 def open_browser():
     """在新线程中打开浏览器"""
@@ -331,11 +597,15 @@ def open_browser():
 if __name__ == '__main__':
     # 清理旧日志文件
     cleanup_old_logs(keep_days=30)
+    # 清理旧的扫描检查点
+    get_checkpoint().prune(keep_days=7)
     
     # 启动时加载缓存数据
     load_cached_signals()
+    # 启动快照推送服务
+    start_event_server(port=EVENTS_PORT)
     # 如果需要更新，则更新数据
-    if should_update():
+    if WEB_REFRESH_ENABLED and should_update():
         update_signals()
     
     logger = get_unified_logger('flask_app')
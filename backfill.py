@@ -0,0 +1,193 @@
+"""
+历史信号回填
+
+对日期区间内的每只股票一次计算出逐日信号：信号在每根K线上只依赖该K线及之前的数据。
+前复权（qfq）时，某日收盘后扫描以该日为复权基准，而指标的数量级取整与价格尺度有关，
+所以按复权因子把区间切成若干段，每段以段内的日期为基准复权后计算一次（区间内没有除权除息时只算一次），
+得到的逐日信号与当天收盘后扫描的结果一致。按日期拆分后批量写入 history/signals_YYYYMMDD.csv，
+补齐没有触发过刷新的交易日。
+
+    python backfill.py --start 2025-06-01 --end 2025-07-22
+
+默认只补缺失的日期，已有文件的日期保持不变（--overwrite 时重写）；重复运行结果相同。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+import bar_cache
+import signal_store
+from bar_cache import load_bars, adjust_bars, factors_at
+from stock_signals import (get_all_stocks, fetch_stock_data, get_adjust_factors, calculate_lean_signals,
+                           SIGNAL_NAMES, MIN_BARS, COMPUTE_WORKERS, FETCH_WORKERS, STATUS_OK)
+from logger_config import log_stock_analysis, get_log_queue, init_worker_logging
+from accuracy_stats import update_accuracy_stats
+
+
+def extract_signal_history(args):
+    """
+    计算出单只股票在日期区间内每天的信号
+
+    Args:
+        args: (code, name, df, start, end, factors, adjust) 元组：df 为不复权日线，start/end 为 Timestamp，
+            factors 为复权因子（None时不复权），adjust 为复权方式
+
+    Returns:
+        有信号的记录列表，格式与扫描结果相同（code/name/date/close/signals）
+    """
+    stock_code, stock_name, df, start, end, factors, adjust = args
+    # 与收盘后扫描一致：K线数量不足 MIN_BARS 的日期不计算信号，收盘前的临时K线不回填
+    eligible = pd.Series(range(len(df)), index=df.index) >= MIN_BARS - 1
+    eligible &= (df.index >= start) & (df.index <= end)
+    if 'provisional' in df.columns:
+        eligible &= ~df['provisional'].astype(bool)
+    eligible = eligible.to_numpy()
+
+    # 收盘后扫描某日时前复权的基准是该日：生效因子相同的日期基准相同，每段只计算一次
+    if adjust == 'qfq' and factors is not None and not factors.empty:
+        segment_keys = factors_at(factors, df.index)
+    else:
+        segment_keys = pd.Series(0.0, index=df.index).to_numpy()
+
+    records = []
+    for key in pd.unique(segment_keys[eligible]):
+        in_segment = eligible & (segment_keys == key)
+        last = in_segment.nonzero()[0][-1]
+        bars = adjust_bars(df.iloc[:last + 1], factors, adjust)
+        frame = calculate_lean_signals(bars, outputs=SIGNAL_NAMES)
+        hits = in_segment[:last + 1] & frame[SIGNAL_NAMES].any(axis=1).to_numpy()
+        for i in hits.nonzero()[0]:
+            records.append({
+                'code': stock_code,
+                'name': stock_name,
+                'date': df.index[i].strftime('%Y-%m-%d'),
+                # 与收盘后扫描一致（前复权时段内的基准因子与当日相同，收盘价即不复权收盘价）
+                'close': float(bars['close'].iloc[i]),
+                'signals': {name: bool(frame[name].iloc[i]) for name in SIGNAL_NAMES}
+            })
+    return sorted(records, key=lambda record: record['date'])
+
+
+def load_history_bars(stock_code, end):
+    """
+    优先使用本地日线缓存，缓存没有覆盖截止日期时从数据源获取
+
+    Returns:
+        (不复权日线, 复权因子)，复权因子不可用或不复权时为None；获取失败时返回None
+    """
+    raw = load_bars(stock_code)
+    if raw is not None and len(raw) and raw.index[-1] >= end and not raw['provisional'].iloc[-1]:
+        raw = raw[raw.index <= end]
+    else:
+        raw, outcome = fetch_stock_data(stock_code, end_date=end.strftime('%Y%m%d'), adjust='none')
+        if outcome['status'] != STATUS_OK:
+            return None
+    factors = get_adjust_factors(stock_code) if bar_cache.PRICE_ADJUST != 'none' else None
+    return raw, factors
+
+
+def list_history_dates():
+    """history目录中已有信号文件的日期（YYYYMMDD）"""
+    if not os.path.exists(signal_store.HISTORY_DIR):
+        return set()
+    return {f[len('signals_'):-len('.csv')] for f in os.listdir(signal_store.HISTORY_DIR)
+            if f.startswith('signals_') and f.endswith('.csv')}
+
+
+def backfill_history(start_date, end_date, stock_list=None, max_workers=COMPUTE_WORKERS,
+                     fetch_workers=FETCH_WORKERS, overwrite=False):
+    """
+    回填日期区间内的历史信号
+
+    Args:
+        start_date: 起始日期（YYYY-MM-DD）
+        end_date: 截止日期（YYYY-MM-DD）
+        stock_list: (code, name) 列表，默认使用 get_all_stocks 的股票池
+        max_workers: 指标计算进程数
+        fetch_workers: 读取/请求日线的并发数
+        overwrite: 是否重写已有信号文件的日期
+
+    Returns:
+        回填统计：stocks/failed/dates_written/dates_skipped/records/elapsed_seconds
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if stock_list is None:
+        stocks = get_all_stocks()
+        stock_list = list(zip(stocks['code'], stocks['name'])) if stocks is not None else []
+
+    start_time = time.time()
+    records_by_date = defaultdict(list)
+    failed = []
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher, \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging,
+                                initargs=(get_log_queue(),)) as executor:
+        loads = [(code, name, fetcher.submit(load_history_bars, code, end)) for code, name in stock_list]
+        pending = []
+        for code, name, load in loads:
+            loaded = load.result()
+            if loaded is None or len(loaded[0]) < MIN_BARS:
+                failed.append(code)
+                continue
+            df, factors = loaded
+            pending.append((code, executor.submit(extract_signal_history,
+                                                  (code, name, df, start, end, factors, bar_cache.PRICE_ADJUST))))
+        for code, future in pending:
+            try:
+                for record in future.result():
+                    records_by_date[record['date']].append(record)
+            except Exception as e:
+                log_stock_analysis(f"回填 {code} 信号失败: {e}", 'error')
+                failed.append(code)
+
+    # 按股票池顺序写入，重复运行得到相同的文件
+    order = {code: i for i, (code, _) in enumerate(stock_list)}
+    existing = list_history_dates()
+    written, skipped, total_records = [], [], 0
+    for date in sorted(records_by_date):
+        trade_date = pd.Timestamp(date)
+        if trade_date.strftime('%Y%m%d') in existing and not overwrite:
+            skipped.append(date)
+            continue
+        records = sorted(records_by_date[date], key=lambda item: order[item['code']])
+        signal_store.save_history_csv(records, trade_date)
+        written.append(date)
+        total_records += len(records)
+
+    elapsed = time.time() - start_time
+    log_stock_analysis(f"历史信号回填完成: {len(written)} 个交易日，{total_records} 条记录，"
+                       f"跳过已有 {len(skipped)} 个交易日，失败 {len(failed)} 只股票，用时 {elapsed:.1f} 秒")
+    return {
+        'stocks': len(stock_list),
+        'failed': failed,
+        'dates_written': written,
+        'dates_skipped': skipped,
+        'records': total_records,
+        'elapsed_seconds': round(elapsed, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从日线数据一次性回填历史信号')
+    parser.add_argument('--start', required=True, help='起始日期（YYYY-MM-DD）')
+    parser.add_argument('--end', default=None, help='截止日期（YYYY-MM-DD），默认为昨天')
+    parser.add_argument('--workers', type=int, default=COMPUTE_WORKERS, help='指标计算进程数')
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS, help='读取/请求日线的并发数')
+    parser.add_argument('--overwrite', action='store_true', help='重写已有信号文件的日期')
+    args = parser.parse_args(argv)
+
+    end = args.end or (pd.Timestamp.now().normalize() - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    summary = backfill_history(args.start, end, max_workers=args.workers, fetch_workers=args.fetch_workers,
+                               overwrite=args.overwrite)
+    summary['accuracy_updated'] = update_accuracy_stats()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
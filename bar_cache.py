@@ -0,0 +1,227 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from market_data import BAR_COLUMNS
+
+
+# 本地日线缓存目录，每只股票一个CSV文件
+BAR_CACHE_DIR = os.environ.get(
+    'BAR_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datas', 'cache', 'bars')
+)
+
+# 复权方式：qfq 前复权（默认），hfq 后复权，none 不复权。
+# 缓存中始终保存不复权的日线和复权因子，读取时再复权：除权除息只会增加一行复权因子，
+# 不需要重新下载整段历史
+PRICE_ADJUST = os.environ.get('PRICE_ADJUST', 'qfq')
+ADJUST_MODES = ('qfq', 'hfq', 'none')
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+def _bar_path(stock_code):
+    return os.path.join(BAR_CACHE_DIR, f'{stock_code}.csv')
+
+
+def _minute_path(stock_code):
+    return os.path.join(BAR_CACHE_DIR, 'minute', f'{stock_code}.csv')
+
+
+def _factor_path(stock_code):
+    return os.path.join(BAR_CACHE_DIR, 'factors', f'{stock_code}.csv')
+
+
+def has_bars(stock_code):
+    """判断本地是否缓存了该股票的日线"""
+    return os.path.exists(_bar_path(stock_code))
+
+
+def get_bars_mtime(stock_code):
+    """本地日线缓存文件的修改时间，没有缓存时返回None"""
+    try:
+        return os.path.getmtime(_bar_path(stock_code))
+    except FileNotFoundError:
+        return None
+
+
+def load_bars(stock_code):
+    """
+    读取本地缓存的日线
+
+    Returns:
+        以date为索引的DataFrame，包含 open/high/low/close/volume 和 provisional 列；
+        没有缓存时返回None
+    """
+    path = _bar_path(stock_code)
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, parse_dates=['date'], index_col='date')
+    if 'provisional' not in df.columns:
+        df['provisional'] = False
+    return df
+
+
+def save_bars(stock_code, df, provisional_date=None):
+    """
+    写入本地日线缓存（先写临时文件再替换，读者不会看到写了一半的文件）
+
+    Args:
+        stock_code: 股票代码
+        df: 以date为索引的日线DataFrame
+        provisional_date: 盘中临时K线的日期，该日的K线会被标记为provisional
+    """
+    if not os.path.exists(BAR_CACHE_DIR):
+        os.makedirs(BAR_CACHE_DIR, exist_ok=True)
+
+    out = df[BAR_COLUMNS].copy()
+    out.index.name = 'date'
+    if provisional_date is not None:
+        out['provisional'] = out.index == pd.Timestamp(provisional_date)
+    elif 'provisional' in df.columns:
+        out['provisional'] = df['provisional'].astype(bool)
+    else:
+        out['provisional'] = False
+
+    path = _bar_path(stock_code)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    out.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_minute_bars(stock_code):
+    """读取本地缓存的5分钟线（不复权，以截止时刻time为索引），没有缓存时返回None"""
+    path = _minute_path(stock_code)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, parse_dates=['time'], index_col='time')
+
+
+def save_minute_bars(stock_code, df):
+    """写入本地5分钟线缓存（先写临时文件再替换）"""
+    path = _minute_path(stock_code)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    out = df[BAR_COLUMNS].copy()
+    out.index.name = 'time'
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    out.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def get_factors_mtime(stock_code):
+    """本地复权因子文件的修改时间（即上次向数据源核对的时间），没有缓存时返回None"""
+    try:
+        return os.path.getmtime(_factor_path(stock_code))
+    except FileNotFoundError:
+        return None
+
+
+def load_factors(stock_code):
+    """
+    读取本地缓存的复权因子
+
+    Returns:
+        以date为索引、factor列为后复权累计因子的DataFrame（自该日起生效）；没有缓存时返回None
+    """
+    path = _factor_path(stock_code)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, parse_dates=['date'], index_col='date')
+
+
+def save_factors(stock_code, factors):
+    """写入本地复权因子缓存（先写临时文件再替换）"""
+    path = _factor_path(stock_code)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    out = factors[['factor']].sort_index()
+    out.index.name = 'date'
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    out.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def merge_factors(cached, fetched):
+    """
+    合并缓存的复权因子和数据源返回的复权因子
+
+    Returns:
+        (合并后的DataFrame, 新增或变化的行数)；同一天以数据源为准
+    """
+    fetched = fetched[['factor']].astype(float)
+    if cached is None or cached.empty:
+        return fetched.sort_index(), len(fetched)
+    merged = fetched.combine_first(cached[['factor']]).sort_index()
+    previous = cached['factor'].reindex(merged.index)
+    changed = int((previous.isna() | ~np.isclose(previous.fillna(0), merged['factor'])).sum())
+    return merged, changed
+
+
+def factors_at(factors, dates):
+    """每个日期生效的后复权累计因子（不晚于该日的最近一行，早于第一行的日期使用第一行），返回numpy数组"""
+    factor = factors['factor'].sort_index()
+    values = factor.to_numpy(dtype=float)
+    positions = np.searchsorted(factor.index.to_numpy(), pd.DatetimeIndex(dates).to_numpy(), side='right') - 1
+    return values[np.clip(positions, 0, None)]
+
+
+def adjust_bars(df, factors, adjust=None, base_date=None):
+    """
+    按复权因子复权（向量化），成交量不变
+
+    Args:
+        df: 不复权的日线
+        factors: load_factors 格式的后复权累计因子，None或为空时原样返回
+        adjust: qfq/hfq/none，默认为 PRICE_ADJUST
+        base_date: 前复权的基准日，该日的价格与不复权价格相同，默认为最后一根K线
+
+    Returns:
+        复权后的新DataFrame（不复权时返回df本身）
+    """
+    adjust = adjust or PRICE_ADJUST
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"未知的复权方式: {adjust}")
+    if adjust == 'none' or factors is None or factors.empty or df is None or df.empty:
+        return df
+    ratios = factors_at(factors, df.index)
+    if adjust == 'qfq':
+        base = df.index[-1] if base_date is None else pd.Timestamp(base_date)
+        ratios = ratios / factors_at(factors, [base])[0]
+    out = df.copy()
+    out[PRICE_COLUMNS] = df[PRICE_COLUMNS].to_numpy(dtype=float) * ratios[:, None]
+    return out
+
+
+def load_adjusted_bars(stock_code, adjust=None):
+    """读取本地缓存的日线并用本地缓存的复权因子复权（不访问数据源），没有缓存时返回None"""
+    df = load_bars(stock_code)
+    if df is None:
+        return None
+    return adjust_bars(df, load_factors(stock_code), adjust)
+
+
+def patch_last_bar(df, quote, trade_date):
+    """
+    用实时行情修补最后一根K线
+
+    如果缓存中已有trade_date当天的K线则覆盖，否则追加一根临时K线；
+    之前交易日遗留的临时K线（当天没有完整扫描定型）一并去掉，不当作真实的日线。
+
+    Args:
+        df: 缓存的日线DataFrame
+        quote: 包含 open/high/low/close/volume 的实时行情（Series或dict）
+        trade_date: 行情所属交易日
+
+    Returns:
+        修补后的新DataFrame
+    """
+    trade_date = pd.Timestamp(trade_date).normalize()
+    bar = pd.DataFrame([{col: float(quote[col]) for col in BAR_COLUMNS}],
+                       index=pd.DatetimeIndex([trade_date], name='date'))
+    bar['provisional'] = True
+
+    history = df[df.index < trade_date]
+    if 'provisional' in history.columns:
+        history = history[~history['provisional'].astype(bool)]
+    else:
+        history = history.assign(provisional=False)
+    return pd.concat([history, bar])
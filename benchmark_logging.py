@@ -0,0 +1,167 @@
+"""
+日志开销基准测试
+
+比较两种写法在调用线程上的耗时：
+- sync：旧写法，每个日志器直接挂文件和控制台处理器，调用时同步写盘
+- queue：当前写法，调用线程只把记录放进队列，由监听线程写文件和控制台
+
+分别在本地磁盘和模拟的慢磁盘（每次写入额外等待 --disk-latency-ms，例如挂载的网络卷）上测量，
+并用离线数据源跑一次扫描，统计一次刷新产生的日志条数，换算成每次刷新的日志开销。
+
+    python benchmark_logging.py --calls 20000 --stocks 300 --disk-latency-ms 1
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import logger_config
+from logger_config import DailyFileHandler, LOG_FORMAT, LOG_DATE_FORMAT
+
+
+class _CountingFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record):
+        self.count += 1
+        return True
+
+
+class _SlowDiskHandler(DailyFileHandler):
+    """每次写入后额外等待，模拟慢磁盘"""
+
+    def __init__(self, log_dir, latency):
+        super().__init__(log_dir)
+        self.latency = latency
+
+    def flush(self):
+        super().flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def _sync_handlers(log_dir, latency=0.0):
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    file_handler = _SlowDiskHandler(log_dir, latency)
+    console_handler = logging.StreamHandler(open(os.devnull, 'w'))
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    return [file_handler, console_handler]
+
+
+def measure_call_latency(mode, calls, log_dir, latency=0.0):
+    """
+    调用线程上每条日志的平均耗时（微秒）
+
+    Args:
+        mode: sync 或 queue
+        calls: 日志条数
+        log_dir: 写入的日志目录
+        latency: 模拟的每次写盘延迟（秒）
+    """
+    logger = logging.getLogger(f'benchmark_{mode}')
+    logger.handlers.clear()
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener = None
+    if mode == 'sync':
+        for handler in _sync_handlers(log_dir, latency):
+            logger.addHandler(handler)
+    else:
+        queue = logger_config.multiprocessing.Queue(-1)
+        logger.addHandler(logging.handlers.QueueHandler(queue))
+        listener = logging.handlers.QueueListener(queue, *_sync_handlers(log_dir, latency))
+        listener.start()
+
+    start = time.perf_counter()
+    for i in range(calls):
+        logger.info(f"处理进度: {i}/{calls} (50.0%) - 已用时: 10秒 - 预计剩余: 10秒")
+    elapsed = time.perf_counter() - start
+
+    if listener is not None:
+        drain_start = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - drain_start
+    else:
+        drain = 0.0
+    for handler in (listener.handlers if listener else logger.handlers):
+        handler.close()
+    logger.handlers.clear()
+    return {'per_call_us': round(elapsed / calls * 1e6, 2), 'background_drain_seconds': round(drain, 3)}
+
+
+def count_refresh_log_calls(stocks):
+    """用离线数据源扫描stocks只股票，返回 (日志条数, 扫描耗时秒)"""
+    import bar_cache
+    import stock_signals
+    from market_data import OfflineProvider, set_provider
+
+    cache_dir = tempfile.mkdtemp()
+    old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+    counter = _CountingFilter()
+    handler = logger_config.get_queue_handler()
+    handler.addFilter(counter)
+    try:
+        bar_cache.BAR_CACHE_DIR = cache_dir
+        stock_signals.FETCH_DELAY = 0
+        set_provider(OfflineProvider(universe_size=stocks))
+        stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(stocks)]
+        start = time.perf_counter()
+        stock_signals.run_stock_scan(stock_list)
+        return counter.count, time.perf_counter() - start
+    finally:
+        handler.removeFilter(counter)
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = old_settings
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='日志开销基准测试')
+    parser.add_argument('--calls', type=int, default=20000, help='每种写法测量的日志条数')
+    parser.add_argument('--stocks', type=int, default=300, help='模拟刷新的股票数量')
+    parser.add_argument('--disk-latency-ms', type=float, default=1.0, help='模拟慢磁盘每次写入的额外延迟（毫秒）')
+    args = parser.parse_args(argv)
+
+    log_dir = tempfile.mkdtemp()
+    slow_calls = min(args.calls, 2000)
+    try:
+        results = {mode: measure_call_latency(mode, args.calls, log_dir) for mode in ('sync', 'queue')}
+        slow = {mode: measure_call_latency(mode, slow_calls, log_dir, args.disk_latency_ms / 1000)
+                for mode in ('sync', 'queue')}
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    log_calls, scan_seconds = count_refresh_log_calls(args.stocks)
+    report = {
+        'calls': args.calls,
+        'per_call_us': {mode: result['per_call_us'] for mode, result in results.items()},
+        'queue_background_drain_seconds': results['queue']['background_drain_seconds'],
+        'slow_disk': {
+            'calls': slow_calls,
+            'disk_latency_ms': args.disk_latency_ms,
+            'per_call_us': {mode: result['per_call_us'] for mode, result in slow.items()},
+        },
+        'refresh': {
+            'stocks': args.stocks,
+            'log_calls': log_calls,
+            'scan_seconds': round(scan_seconds, 2),
+            'logging_ms': {mode: round(result['per_call_us'] * log_calls / 1000, 2)
+                           for mode, result in results.items()},
+            'slow_disk_logging_ms': {mode: round(result['per_call_us'] * log_calls / 1000, 2)
+                                     for mode, result in slow.items()}
+        }
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
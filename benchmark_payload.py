@@ -0,0 +1,117 @@
+"""
+接口响应体基准测试
+
+用模拟的全市场快照（默认5000只股票）比较 /api/signals 的几种响应：
+- rows_jsonify：旧写法，每次请求用 jsonify 编码逐行JSON，不压缩
+- rows / columns：逐行或按列的格式，按快照版本编码一次并预压缩（identity/gzip/br）
+
+输出全量快照各格式的字节数，以及默认筛选（有任何信号的股票）下通过Flask测试客户端请求的平均耗时：
+
+    python benchmark_payload.py --stocks 5000 --requests 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import app as web_app
+import signal_store
+from compact_payload import EncodedBody, encode_signals_columns, brotli
+from stock_signals import SIGNAL_NAMES
+
+
+def make_snapshot(stocks, seed=0):
+    """模拟全市场快照：约10%的股票有信号"""
+    rng = random.Random(seed)
+    date = datetime.now().strftime('%Y-%m-%d')
+    signals = []
+    for i in range(stocks):
+        active = rng.random() < 0.1
+        signals.append({
+            'code': f"{600000 + i:06d}",
+            'name': f"模拟股票{i + 1}",
+            'date': date,
+            'close': round(rng.uniform(2, 200), 2),
+            'signals': {name: active and rng.random() < 0.3 for name in SIGNAL_NAMES}
+        })
+    return signals
+
+
+def measure_sizes(signals):
+    rows = {'version': 1, 'update_time': None, 'signals': signals}
+    with web_app.app.app_context():
+        jsonify_bytes = len(web_app.jsonify(rows).get_data())
+    sizes = {'rows_jsonify': {'identity': jsonify_bytes}}
+    for name, payload in (('rows', rows), ('columns', encode_signals_columns(signals, 1))):
+        body = EncodedBody.from_payload(payload)
+        sizes[name] = {'identity': len(body.identity), 'gzip': len(body.gzip)}
+        if body.br is not None:
+            sizes[name]['br'] = len(body.br)
+    return sizes
+
+
+def measure_latency(signals, requests):
+    """每种响应的平均请求耗时（毫秒），首次请求（编码并压缩）单独列出"""
+    client = web_app.app.test_client()
+    results = {}
+
+    def timed(path, headers=None):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers or {})
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - start) * 1000, len(response.get_data())
+
+    # 旧写法：每次请求都 jsonify
+    with web_app.app.app_context():
+        start = time.perf_counter()
+        for _ in range(requests):
+            web_app.jsonify({'version': 1, 'update_time': None,
+                             'signals': [s for s in signals if any(s['signals'].values())]}).get_data()
+        elapsed = time.perf_counter() - start
+        results['rows_jsonify'] = {'encode_per_request_ms': round(elapsed * 1000 / requests, 2)}
+
+    for fmt in ('rows', 'columns'):
+        for encoding in ('identity', 'gzip') + (('br',) if brotli is not None else ()):
+            web_app.payload_cache.clear()
+            path = f'/api/signals?format={fmt}'
+            headers = {'Accept-Encoding': encoding}
+            first, size = timed(path, headers)
+            latencies = [timed(path, headers)[0] for _ in range(requests)]
+            results[f'{fmt}_{encoding}'] = {
+                'bytes': size,
+                'first_request_ms': round(first, 2),
+                'per_request_ms': round(sum(latencies) / len(latencies), 2)
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='接口响应体基准测试')
+    parser.add_argument('--stocks', type=int, default=5000, help='模拟快照中的股票数量')
+    parser.add_argument('--requests', type=int, default=50, help='每种响应测量的请求次数')
+    args = parser.parse_args(argv)
+
+    signals = make_snapshot(args.stocks)
+    # 不读取共享目录中的快照，也不触发刷新
+    signal_store.SNAPSHOT_PATH = os.path.join(tempfile.mkdtemp(), 'stock_signals.json')
+    web_app.WEB_REFRESH_ENABLED = False
+    web_app.global_signals = signals
+    web_app.snapshot_version = 1
+    web_app.last_update_time = datetime.now()
+
+    report = {
+        'stocks': args.stocks,
+        'brotli_available': brotli is not None,
+        'full_snapshot_bytes': measure_sizes(signals),
+        'api_signals': measure_latency(signals, args.requests)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+接口响应体的紧凑编码与预压缩
+
+/api/signals 和 /api/history 默认返回逐行的JSON（每只股票重复九个中文信号名），
+带 format=columns 参数时返回按列组织的紧凑格式：
+
+    /api/signals?format=columns
+    {"format": "columns", "version": 12, "update_time": "...",
+     "signal_names": ["顶钝化", ...],
+     "codes": ["600000", ...], "names": [...], "dates": [...], "closes": [...],
+     "signals": [5, 0, ...]}
+
+signals 中每只股票一个整数，第k位对应 signal_names[k]（与 pack_signal_bits 的位序一致）。
+
+两种格式的响应体都按快照版本只编码一次，同时预先压缩好gzip（以及安装了brotli包时的br），
+请求时按 Accept-Encoding 直接返回对应的字节，并带上 Content-Encoding 和 Vary 头。
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date, datetime
+
+from stock_signals import SIGNAL_NAMES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+FORMAT_ROWS = 'rows'
+FORMAT_COLUMNS = 'columns'
+FORMATS = (FORMAT_ROWS, FORMAT_COLUMNS)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def pack_signals(signals):
+    """信号字典 -> 位图整数，第k位对应 SIGNAL_NAMES[k]"""
+    bits = 0
+    for position, name in enumerate(SIGNAL_NAMES):
+        if signals.get(name):
+            bits |= 1 << position
+    return bits
+
+
+def encode_signals_columns(signals, version=None, update_time=None):
+    """将信号列表转换为按列组织的格式"""
+    return {
+        'format': FORMAT_COLUMNS,
+        'version': version,
+        'update_time': update_time,
+        'signal_names': SIGNAL_NAMES,
+        'codes': [stock['code'] for stock in signals],
+        'names': [stock['name'] for stock in signals],
+        'dates': [stock.get('date') for stock in signals],
+        'closes': [stock['close'] for stock in signals],
+        'signals': [pack_signals(stock['signals']) for stock in signals],
+    }
+
+
+def encode_history_columns(signals_by_date, days):
+    """
+    将历史信号转换为按列组织的格式
+
+    每个信号日一组列；后续走势按该信号日之后的交易日（window_dates）对齐，
+    daily_closes 中缺少数据的交易日为null，没有走势数据的股票整行为null。
+    每日涨幅由客户端从 closes 和 daily_closes 计算。
+    """
+    dates = {}
+    for date, stocks in signals_by_date.items():
+        window_dates = sorted({price['date'] for stock in stocks for price in (stock.get('daily_prices') or [])})
+        positions = {day: i for i, day in enumerate(window_dates)}
+        daily_closes = []
+        for stock in stocks:
+            prices = stock.get('daily_prices')
+            if prices is None:
+                daily_closes.append(None)
+                continue
+            row = [None] * len(window_dates)
+            for price in prices:
+                row[positions[price['date']]] = price['close']
+            daily_closes.append(row)
+        accumulates = [stock.get('accumulate') for stock in stocks]
+        dates[date] = {
+            'codes': [stock['code'] for stock in stocks],
+            'names': [stock['name'] for stock in stocks],
+            'closes': [stock['close'] for stock in stocks],
+            'signals': [pack_signals(stock['signals']) for stock in stocks],
+            'window_dates': window_dates,
+            'daily_closes': daily_closes,
+            'accumulate': [item['number'] if item else None for item in accumulates],
+            'correct': [item['status'] if item else None for item in accumulates],
+        }
+    return {'format': FORMAT_COLUMNS, 'days': days, 'signal_names': SIGNAL_NAMES, 'signals_by_date': dates}
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q值}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+class EncodedBody:
+    """编码一次、预先压缩好的响应体"""
+
+    def __init__(self, data, count=None):
+        # 响应中的记录数，用于请求日志
+        self.count = count
+        self.identity = data
+        self.gzip = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        self.br = brotli.compress(data, quality=BROTLI_QUALITY) if brotli is not None else None
+
+    @classmethod
+    def from_payload(cls, payload, count=None):
+        return cls(json.dumps(payload, ensure_ascii=False, separators=(',', ':'),
+                              default=_json_default).encode('utf-8'), count)
+
+    def negotiate(self, accept_encoding):
+        """按客户端支持的编码选择响应体，返回 (字节, Content-Encoding或None)"""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.0)
+        if self.br is not None and accepted.get('br', wildcard) > 0:
+            return self.br, 'br'
+        if accepted.get('gzip', wildcard) > 0:
+            return self.gzip, 'gzip'
+        return self.identity, None
+
+
+def _json_default(value):
+    # CSV读取的信号和价格可能是numpy类型，后续行情的日期为date
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+class PayloadCache:
+    """按key缓存编码后的响应体（key中包含快照版本，新快照的响应体挤掉旧的）"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        获取key对应的响应体，没有时调用 build() 生成 (载荷, 记录数) 并编码
+
+        build 在锁外执行；同一个key只有一个请求执行 build，其他并发请求等待它的结果
+        （build 抛出异常时这些请求得到同一个异常）
+        """
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+            future = self._building.get(key)
+            owner = future is None
+            if owner:
+                future = self._building[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            body = EncodedBody.from_payload(*build())
+        except BaseException as e:
+            with self._lock:
+                self._building.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = body
+            self._building.pop(key, None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(body)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
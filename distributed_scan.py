@@ -0,0 +1,409 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import signal_store
+from stock_signals import (get_all_stocks, run_stock_scan, summarize_outcomes, log_outcome_summary,
+                           COMPUTE_WORKERS, FETCH_WORKERS)
+from refresh_lease import RefreshLease
+from accuracy_stats import update_accuracy_stats
+from metrics import export_metrics
+from logger_config import get_unified_logger
+
+
+# 工作队列数据库位于共享的history卷，多台机器挂载同一目录即可协作
+# （需要支持文件锁的共享文件系统；SQLite不适合放在锁实现不可靠的NFS上）
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'scan_queue.db')
+
+# 每个分片包含的股票数量
+DEFAULT_SHARD_SIZE = 50
+
+# 分片租约时长（秒），工作节点处理期间定期续约；节点失联后租约过期，分片重新分配给其他节点
+DEFAULT_SHARD_LEASE = 120
+
+# 退出码（与 scan.py 一致）
+EXIT_OK = 0
+EXIT_NO_SIGNALS = 2
+EXIT_BUSY = 3
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    shard_count INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scan_shards (
+    job_id TEXT NOT NULL,
+    shard_id INTEGER NOT NULL,
+    stocks TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    signals TEXT,
+    outcomes TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (job_id, shard_id)
+);
+CREATE INDEX IF NOT EXISTS idx_scan_shards_status ON scan_shards (status, lease_expires);
+'''
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def default_worker_id():
+    """生成工作节点标识：主机名-进程号-随机串"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class ShardQueue:
+    """
+    基于SQLite的分片工作队列
+
+    协调者把股票池切成分片写入队列；工作节点领取分片时获得一段时间的租约，
+    处理完成后写回结果。租约过期仍未完成的分片会被其他节点重新领取，
+    过期节点迟到的结果会被丢弃。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_QUEUE_PATH
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接，成功时提交，结束后关闭"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_job(self, stock_list, shard_size=DEFAULT_SHARD_SIZE, job_id=None):
+        """
+        创建扫描任务并切分分片
+
+        Args:
+            stock_list: (code, name) 列表
+            shard_size: 每个分片的股票数量
+            job_id: 指定任务ID，不指定时自动生成
+
+        Returns:
+            任务ID
+        """
+        job_id = job_id or f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        now = _now()
+        shards = [stock_list[i:i + shard_size] for i in range(0, len(stock_list), shard_size)]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO scan_jobs (job_id, status, total, shard_count, created_at, updated_at) "
+                "VALUES (?, 'running', ?, ?, ?, ?)",
+                (job_id, len(stock_list), len(shards), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO scan_shards (job_id, shard_id, stocks, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                [(job_id, shard_id, json.dumps([list(stock) for stock in shard], ensure_ascii=False), now)
+                 for shard_id, shard in enumerate(shards)]
+            )
+        return job_id
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_SHARD_LEASE):
+        """
+        领取一个待处理或租约已过期的分片
+
+        Returns:
+            (job_id, shard_id, stock_list)，没有可领取的分片时返回None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # 立即加写锁，保证同一个分片只会被一个节点领取
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT s.job_id, s.shard_id, s.stocks FROM scan_shards s "
+                "JOIN scan_jobs j ON j.job_id = s.job_id AND j.status = 'running' "
+                "WHERE s.status = 'pending' OR (s.status = 'leased' AND s.lease_expires < ?) "
+                "ORDER BY j.created_at, s.shard_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE scan_shards SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_id = ? AND shard_id = ?",
+                (worker_id, now + lease_seconds, _now(), row['job_id'], row['shard_id'])
+            )
+        return row['job_id'], row['shard_id'], [tuple(stock) for stock in json.loads(row['stocks'])]
+
+    def renew(self, job_id, shard_id, worker_id, lease_seconds=DEFAULT_SHARD_LEASE):
+        """续约，分片已被重新分配时返回False"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE scan_shards SET lease_expires = ? "
+                "WHERE job_id = ? AND shard_id = ? AND owner = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job_id, shard_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, shard_id, worker_id, signals, outcomes):
+        """
+        写回分片结果
+
+        Returns:
+            是否写入成功；租约已被其他节点接管时丢弃结果并返回False
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE scan_shards SET status = 'done', signals = ?, outcomes = ?, updated_at = ? "
+                "WHERE job_id = ? AND shard_id = ? AND owner = ? AND status = 'leased'",
+                (json.dumps(signals, ensure_ascii=False), json.dumps(outcomes, ensure_ascii=False), _now(),
+                 job_id, shard_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def get_progress(self, job_id):
+        """
+        读取任务进度
+
+        Returns:
+            包含 job_id/status/total/shard_count/by_status/workers 的字典，任务不存在时返回None
+        """
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM scan_shards WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+            workers = conn.execute(
+                "SELECT owner, COUNT(*) AS count FROM scan_shards WHERE job_id = ? AND status = 'done' GROUP BY owner",
+                (job_id,)
+            ).fetchall()
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'total': job['total'],
+            'shard_count': job['shard_count'],
+            'by_status': {row['status']: row['count'] for row in rows},
+            'workers': {row['owner']: row['count'] for row in workers}
+        }
+
+    def collect(self, job_id):
+        """
+        按分片顺序汇总已完成分片的结果
+
+        Returns:
+            (信号列表, 处理结果列表)
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT signals, outcomes FROM scan_shards WHERE job_id = ? AND status = 'done' ORDER BY shard_id",
+                (job_id,)
+            ).fetchall()
+        signals = []
+        outcomes = []
+        for row in rows:
+            signals.extend(json.loads(row['signals']))
+            outcomes.extend(json.loads(row['outcomes']))
+        return signals, outcomes
+
+    def finish_job(self, job_id, status='completed'):
+        """标记任务结束，剩余分片不再被领取"""
+        with self._connect() as conn:
+            conn.execute("UPDATE scan_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, _now(), job_id))
+
+
+def process_shard(queue, worker_id, job_id, shard_id, stock_list, lean=True, max_workers=COMPUTE_WORKERS,
+                  fetch_workers=FETCH_WORKERS, lease_seconds=DEFAULT_SHARD_LEASE):
+    """处理一个分片，处理期间后台续约，完成后写回结果"""
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease_seconds / 3):
+            if not queue.renew(job_id, shard_id, worker_id, lease_seconds):
+                break
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        signals, outcomes = run_stock_scan(stock_list, lean=lean, max_workers=max_workers,
+                                           fetch_workers=fetch_workers)
+    finally:
+        stop.set()
+        thread.join()
+    return queue.complete(job_id, shard_id, worker_id, signals, outcomes)
+
+
+def run_worker(queue, worker_id=None, lean=True, max_workers=COMPUTE_WORKERS, fetch_workers=FETCH_WORKERS,
+               lease_seconds=DEFAULT_SHARD_LEASE, poll_interval=2, idle_timeout=None):
+    """
+    工作节点主循环：不断领取分片并处理
+
+    Args:
+        queue: 分片工作队列
+        worker_id: 节点标识，不指定时自动生成
+        lean: 是否使用精简模式计算信号
+        max_workers: 本节点信号计算进程数
+        fetch_workers: 本节点行情请求并发数
+        lease_seconds: 分片租约时长（秒）
+        poll_interval: 没有分片时的轮询间隔（秒）
+        idle_timeout: 连续空闲超过该时长（秒）后退出，None表示一直运行
+
+    Returns:
+        本节点成功写回的分片数量
+    """
+    worker_id = worker_id or default_worker_id()
+    logger = get_unified_logger('distributed_scan')
+    logger.info(f"工作节点 {worker_id} 启动")
+    completed = 0
+    idle_since = time.time()
+    while True:
+        task = queue.claim(worker_id, lease_seconds)
+        if task is None:
+            if idle_timeout is not None and time.time() - idle_since >= idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        job_id, shard_id, stock_list = task
+        logger.info(f"工作节点 {worker_id} 领取分片 {job_id}/{shard_id}，共 {len(stock_list)} 只股票")
+        if process_shard(queue, worker_id, job_id, shard_id, stock_list, lean=lean, max_workers=max_workers,
+                         fetch_workers=fetch_workers, lease_seconds=lease_seconds):
+            completed += 1
+        else:
+            logger.warning(f"分片 {job_id}/{shard_id} 的租约已被其他节点接管，丢弃本节点结果")
+        # 每个分片的指标累加到共享目录（各节点挂载同一个history卷时由Web进程汇总输出）
+        try:
+            export_metrics('distributed_scan')
+        except OSError as e:
+            logger.warning(f"导出指标失败: {e}")
+        idle_since = time.time()
+
+    logger.info(f"工作节点 {worker_id} 退出，共完成 {completed} 个分片")
+    return completed
+
+
+def publish_results(signals, update_time=None):
+    """
+    发布汇总的信号（与 scan.py 相同）：替换当前快照、写入当日历史信号CSV并更新准确率统计
+
+    只有 update_time 所在的交易日已经收盘定型时才写历史信号，盘中或非交易日的扫描只替换快照。
+    调用方需要持有刷新租约。
+
+    Returns:
+        (历史信号文件路径, 保存的股票数量)；没有写历史信号时为 (None, 0)
+    """
+    update_time = update_time or datetime.now()
+    signal_store.save_snapshot(signals, update_time)
+    result = signal_store.save_finalized_history(signals, update_time, now=update_time) or (None, 0)
+    update_accuracy_stats()
+    return result
+
+
+def run_coordinator(queue, stock_list=None, shard_size=DEFAULT_SHARD_SIZE, poll_interval=2, timeout=None,
+                    publish=True, lease=None):
+    """
+    协调者：切分股票池、等待所有分片完成、汇总并发布结果
+
+    Args:
+        queue: 分片工作队列
+        stock_list: (code, name) 列表，不指定时使用 get_all_stocks 的股票池
+        shard_size: 每个分片的股票数量
+        poll_interval: 检查进度的间隔（秒）
+        timeout: 最长等待时间（秒），超时后返回已完成分片的结果
+        publish: 所有分片完成时是否发布信号快照和当日历史信号（调用方需要持有刷新租约）；
+            超时的任务缺少部分股票，不发布
+        lease: 持有的刷新租约，发布前确认仍然持有，已被其他进程接管时不发布
+
+    Returns:
+        (信号列表, 处理结果列表)，顺序与股票池一致；获取股票池失败时均为空列表
+    """
+    logger = get_unified_logger('distributed_scan')
+    if stock_list is None:
+        stocks = get_all_stocks()
+        if stocks is None:
+            logger.error("获取股票池失败，不创建分布式扫描任务")
+            return [], []
+        stock_list = list(zip(stocks['code'], stocks['name']))
+
+    job_id = queue.create_job(stock_list, shard_size=shard_size)
+    logger.info(f"创建分布式扫描任务 {job_id}：{len(stock_list)} 只股票，分片大小 {shard_size}")
+    start_time = time.time()
+    while True:
+        progress = queue.get_progress(job_id)
+        done = progress['by_status'].get('done', 0)
+        if done == progress['shard_count']:
+            break
+        if timeout is not None and time.time() - start_time >= timeout:
+            logger.warning(f"任务 {job_id} 等待超时，已完成 {done}/{progress['shard_count']} 个分片")
+            break
+        time.sleep(poll_interval)
+
+    completed = done == progress['shard_count']
+    queue.finish_job(job_id, 'completed' if completed else 'timeout')
+    signals, outcomes = queue.collect(job_id)
+    elapsed = time.time() - start_time
+    logger.info(f"任务 {job_id} 结束，用时 {elapsed:.1f} 秒，参与节点: {progress['workers']}")
+    log_outcome_summary(outcomes)
+    if publish and lease is not None and not lease.is_held():
+        logger.error(f"刷新租约已被其他进程接管，不发布任务 {job_id} 的信号")
+    elif publish and completed and signals:
+        path, rows = publish_results(signals)
+        history = f"历史信号 {path}（{rows} 只）" if path else "收盘数据尚未定型，不写历史信号"
+        logger.info(f"任务 {job_id} 的信号已发布: 快照 {len(signals)} 只股票，{history}")
+    elif publish and not completed:
+        logger.warning(f"任务 {job_id} 没有全部完成，不发布信号")
+    return signals, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分布式信号扫描：coordinator 切分任务，worker 领取分片处理')
+    parser.add_argument('role', choices=['coordinator', 'worker'])
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help='工作队列数据库路径（所有节点共享）')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='每个分片的股票数量')
+    parser.add_argument('--lease', type=int, default=DEFAULT_SHARD_LEASE, help='分片租约时长（秒）')
+    parser.add_argument('--workers', type=int, default=COMPUTE_WORKERS, help='本节点信号计算进程数')
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS, help='本节点行情请求并发数')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='worker空闲超过该秒数后退出')
+    parser.add_argument('--timeout', type=float, default=None, help='coordinator最长等待秒数')
+    args = parser.parse_args()
+
+    queue = ShardQueue(args.queue)
+    if args.role == 'worker':
+        run_worker(queue, max_workers=args.workers, fetch_workers=args.fetch_workers,
+                   lease_seconds=args.lease, idle_timeout=args.idle_timeout)
+        return EXIT_OK
+
+    # 与Web进程和 scan.py 共用刷新租约，同一时刻只有一个进程发布快照
+    lease = RefreshLease()
+    with lease.hold() as is_leader:
+        if not is_leader:
+            print('其他进程正在刷新股票信号，本次扫描跳过', file=sys.stderr)
+            return EXIT_BUSY
+        signals, outcomes = run_coordinator(queue, shard_size=args.shard_size, timeout=args.timeout,
+                                            lease=lease)
+    summary = summarize_outcomes(outcomes)
+    print(json.dumps({'signals': len(signals), 'by_status': summary['by_status']}, ensure_ascii=False))
+    return EXIT_OK if signals else EXIT_NO_SIGNALS
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+快照推送（Server-Sent Events）
+
+单线程的事件循环服务器：用 selectors 管理所有浏览器长连接，空闲连接只占一个文件描述符，
+不占用Flask的请求线程。事件循环每隔 POLL_INTERVAL 秒检查一次共享快照文件的修改时间，
+发现新版本（本进程或 scan.py 等其他进程发布）后把版本号和变化摘要推送给所有连接；
+本进程发布快照后调用 notify() 可以立即唤醒事件循环。
+
+    event: snapshot
+    id: <版本号>
+    data: {"version": 12, "update_time": "...", "changed": 35, "signals": {"底成立": 8, ...}}
+"""
+import json
+import selectors
+import socket
+import threading
+import time
+
+import signal_store
+from logger_config import log_system_info
+
+
+# 推送服务监听的端口，nginx 把 /api/events 转发到这里
+DEFAULT_EVENTS_PORT = 5001
+# 检查快照文件的间隔（秒），只是一次 stat 调用
+POLL_INTERVAL = 2.0
+# 心跳间隔（秒），防止代理和浏览器因长时间没有数据而断开连接
+HEARTBEAT_INTERVAL = 15.0
+# 单个连接积压的未发送数据上限，超过时断开（客户端会自动重连）
+MAX_PENDING_BYTES = 64 * 1024
+# 请求头最大长度
+MAX_REQUEST_BYTES = 8 * 1024
+# 浏览器断线后的重连等待时间（毫秒）
+RETRY_MILLISECONDS = 5000
+
+
+def summarize_snapshot(previous_version):
+    """
+    读取当前快照，生成推送事件的内容
+
+    Args:
+        previous_version: 上一次推送的版本号，None表示没有推送过
+
+    Returns:
+        事件字典：version/update_time/changed/signals；没有快照时返回None。
+        changed 为相对上一次推送变化的股票数量，signals 为变化的股票中各信号为真的数量；
+        变化日志已经不包含上一次推送的版本时 changed 为None（客户端需要全量刷新）。
+    """
+    snapshot = signal_store.load_snapshot()
+    if snapshot is None:
+        return None
+    signals, update_time, _, version = snapshot
+    codes = signal_store.get_changed_codes(previous_version, version) if previous_version is not None else None
+    counts = {}
+    if codes is not None:
+        for stock in signals:
+            if stock['code'] in codes:
+                for name, value in stock['signals'].items():
+                    counts[name] = counts.get(name, 0) + int(bool(value))
+    return {
+        'version': version,
+        'update_time': update_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'changed': len(codes) if codes is not None else None,
+        'signals': counts
+    }
+
+
+def format_event(event):
+    """按SSE格式编码一个快照事件"""
+    payload = json.dumps(event, ensure_ascii=False)
+    return f"event: snapshot\nid: {event['version']}\ndata: {payload}\n\n".encode('utf-8')
+
+
+class _Connection:
+    """一个客户端连接：读取请求头阶段或已建立的事件流"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.request = b''
+        self.pending = b''
+        self.streaming = False
+        self.last_event_id = None
+
+
+class SnapshotEventServer:
+    """
+    基于 selectors 的SSE服务器，一个线程服务所有连接
+
+    只响应 GET /api/events，其余路径返回404。
+    """
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_EVENTS_PORT, poll_interval=POLL_INTERVAL,
+                 heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        # 用于跨线程唤醒事件循环
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+        self.connections = {}
+        self.current_event = None
+        self._snapshot_mtime = None
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def client_count(self):
+        return sum(1 for conn in self.connections.values() if conn.streaming)
+
+    def notify(self):
+        """本进程发布了新快照，立即唤醒事件循环检查"""
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def start(self):
+        """在后台守护线程中运行事件循环"""
+        self._thread = threading.Thread(target=self.serve_forever, name='snapshot-events', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def serve_forever(self):
+        next_poll = 0.0
+        next_heartbeat = time.monotonic() + self.heartbeat_interval
+        try:
+            while not self._stopped:
+                now = time.monotonic()
+                if now >= next_poll:
+                    self._check_snapshot()
+                    next_poll = now + self.poll_interval
+                if now >= next_heartbeat:
+                    self._broadcast(b': ping\n\n')
+                    next_heartbeat = now + self.heartbeat_interval
+                timeout = max(0.0, min(next_poll, next_heartbeat) - time.monotonic())
+                for key, mask in self.selector.select(timeout):
+                    if key.fileobj is self.listener:
+                        self._accept()
+                    elif key.fileobj is self._wakeup_r:
+                        self._drain_wakeup()
+                        next_poll = 0.0
+                    else:
+                        conn = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._read(conn)
+                        if mask & selectors.EVENT_WRITE and conn.sock.fileno() != -1:
+                            self._flush(conn)
+        finally:
+            for conn in list(self.connections.values()):
+                self._close(conn)
+            self.selector.close()
+            self.listener.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_r.recv(1024):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _check_snapshot(self):
+        """快照文件有变化时生成新事件并推送给所有连接"""
+        mtime = signal_store.get_snapshot_mtime()
+        if mtime is None or mtime == self._snapshot_mtime:
+            return
+        previous_version = self.current_event['version'] if self.current_event else None
+        try:
+            event = summarize_snapshot(previous_version)
+        except Exception as e:
+            log_system_info(f"读取信号快照失败，稍后重试: {e}")
+            return
+        self._snapshot_mtime = mtime
+        if event is None or event['version'] == previous_version:
+            return
+        self.current_event = event
+        self._broadcast(format_event(event))
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        conn = _Connection(sock)
+        self.connections[sock.fileno()] = conn
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+        if conn.streaming:
+            # 事件流建立后客户端不再发送数据，忽略即可
+            return
+        conn.request += data
+        if b'\r\n\r\n' not in conn.request:
+            if len(conn.request) > MAX_REQUEST_BYTES:
+                self._close(conn)
+            return
+        self._handle_request(conn)
+
+    def _handle_request(self, conn):
+        head = conn.request.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        lines = head.split('\r\n')
+        parts = lines[0].split()
+        path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+        if len(parts) < 2 or parts[0] != 'GET' or path != '/api/events':
+            conn.pending = b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+            self._flush(conn)
+            self._close(conn)
+            return
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'last-event-id' and value.strip().isdigit():
+                conn.last_event_id = int(value.strip())
+
+        conn.streaming = True
+        response = (
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream; charset=utf-8\r\n'
+            'Cache-Control: no-cache\r\n'
+            'Connection: keep-alive\r\n'
+            'X-Accel-Buffering: no\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            '\r\n'
+            f'retry: {RETRY_MILLISECONDS}\n\n'
+        ).encode('utf-8')
+        # 新连接（或重连时错过了事件）立即收到当前版本
+        if self.current_event and conn.last_event_id != self.current_event['version']:
+            response += format_event(self.current_event)
+        self._send(conn, response)
+
+    def _broadcast(self, data):
+        for conn in list(self.connections.values()):
+            if conn.streaming:
+                self._send(conn, data)
+
+    def _send(self, conn, data):
+        conn.pending += data
+        if len(conn.pending) > MAX_PENDING_BYTES:
+            self._close(conn)
+            return
+        self._flush(conn)
+
+    def _flush(self, conn):
+        try:
+            while conn.pending:
+                sent = conn.sock.send(conn.pending)
+                conn.pending = conn.pending[sent:]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(conn)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.pending else 0)
+        if conn.sock.fileno() in self.connections:
+            self.selector.modify(conn.sock, events, conn)
+
+    def _close(self, conn):
+        fileno = conn.sock.fileno()
+        if fileno == -1:
+            return
+        self.connections.pop(fileno, None)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_event_server(host='0.0.0.0', port=DEFAULT_EVENTS_PORT):
+    """
+    启动本进程的推送服务
+
+    多个Web进程共享同一个快照目录时只需要一个推送服务，端口已被占用说明其他进程已经在推送。
+
+    Returns:
+        SnapshotEventServer；端口被占用时返回None
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = SnapshotEventServer(host, port).start()
+                log_system_info(f"快照推送服务已启动: {host}:{_server.port}")
+            except OSError as e:
+                log_system_info(f"快照推送服务未启动（端口 {port} 不可用）: {e}")
+                return None
+        return _server
+
+
+def notify_snapshot_published():
+    """本进程发布新快照后通知推送服务（未启动时什么也不做）"""
+    if _server is not None:
+        _server.notify()
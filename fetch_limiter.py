@@ -0,0 +1,186 @@
+"""
+行情请求的自适应并发控制（AIMD）
+
+取代固定的请求间隔和批次等待：请求并发上限在数据源健康时缓慢增加（加性增），
+请求出错、超时或耗时明显高于基线时立即减半（乘性减）。
+
+    limiter = get_fetch_limiter()
+    with limiter.slot():
+        df = provider.get_daily_bars(...)
+
+- 增加：每个成功且不慢的请求使上限增加 1/上限，即每一轮（上限个请求）约增加1；
+  只在并发已经用满时增加，需求不足时上限不会无限上涨
+- 减少：同一轮请求中的多个错误只减少一次（请求开始时间早于上次减少的错误忽略）
+- 基线：最近 BASELINE_WINDOW 个成功请求耗时的最小值，超过基线 LATENCY_TOLERANCE 倍
+  且超过 SLOW_LATENCY 秒视为拥塞
+
+当前上限、在途请求数、调整次数和等待时间通过 /metrics 输出。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import counter, gauge, histogram
+
+
+# 初始并发上限
+INITIAL_LIMIT = 4
+# 出错时上限乘以的系数
+BACKOFF_FACTOR = 0.5
+# 超过基线多少倍视为拥塞
+LATENCY_TOLERANCE = 3.0
+# 低于该耗时（秒）的请求不视为拥塞，避免本地缓存、离线数据源的抖动触发减少
+SLOW_LATENCY = 1.0
+# 计算基线的成功请求数
+BASELINE_WINDOW = 100
+
+LIMIT_GAUGE = gauge('fetch_concurrency_limit', '行情请求当前并发上限')
+IN_FLIGHT_GAUGE = gauge('fetch_in_flight', '正在进行的行情请求数')
+LIMIT_CHANGES = counter('fetch_limit_changes_total', '并发上限调整次数', labels=('direction', 'reason'))
+WAIT_SECONDS = histogram('fetch_limiter_wait_seconds', '等待并发名额的时间（秒）',
+                         buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+
+
+class AdaptiveLimiter:
+    """按请求耗时和错误自动调整并发上限的限流器"""
+
+    def __init__(self, initial=INITIAL_LIMIT, min_limit=1, max_limit=16, backoff=BACKOFF_FACTOR,
+                 latency_tolerance=LATENCY_TOLERANCE, slow_latency=SLOW_LATENCY):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.slow_latency = slow_latency
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._latencies = deque(maxlen=BASELINE_WINDOW)
+        self._last_decrease = float('-inf')
+        self._publish()
+
+    def set_bounds(self, min_limit=None, max_limit=None):
+        """调整上下限（例如扫描时按请求线程数设置上限），当前上限收拢到新范围内"""
+        with self._condition:
+            if min_limit is not None:
+                self.min_limit = min_limit
+            if max_limit is not None:
+                self.max_limit = max_limit
+            self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+            self._publish()
+            self._condition.notify_all()
+
+    @property
+    def current_limit(self):
+        return int(self.limit)
+
+    def baseline(self):
+        """最近成功请求的最小耗时，样本不足时返回None"""
+        with self._condition:
+            return min(self._latencies) if len(self._latencies) >= 5 else None
+
+    def acquire(self):
+        """等待并占用一个并发名额，返回请求开始时间（传给 release）"""
+        wait_start = time.perf_counter()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            IN_FLIGHT_GAUGE.set(self.in_flight)
+        started = time.perf_counter()
+        WAIT_SECONDS.observe(started - wait_start)
+        return started
+
+    def try_acquire(self):
+        """有空闲名额时占用并返回请求开始时间，没有时立即返回None（不等待，用于可以放弃的对冲请求）"""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            IN_FLIGHT_GAUGE.set(self.in_flight)
+        return time.perf_counter()
+
+    def release(self, started, ok=True):
+        """
+        释放名额并根据本次请求的结果调整上限
+
+        Args:
+            started: acquire 返回的请求开始时间
+            ok: 请求是否成功（出错、超时为False）
+        """
+        latency = time.perf_counter() - started
+        with self._condition:
+            self.in_flight -= 1
+            if not ok:
+                self._decrease(started, 'error')
+            else:
+                baseline = min(self._latencies) if len(self._latencies) >= 5 else None
+                self._latencies.append(latency)
+                if baseline is not None and latency > self.slow_latency and \
+                        latency > baseline * self.latency_tolerance:
+                    self._decrease(started, 'latency')
+                else:
+                    self._increase()
+            self._publish()
+            self._condition.notify_all()
+
+    def cancel(self):
+        """释放名额但不调整上限（请求没有真正发出，例如接口处于熔断状态；或对冲请求，结果已由原请求计入）"""
+        with self._condition:
+            self.in_flight -= 1
+            self._publish()
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """占用一个名额执行请求，抛出异常时按出错处理"""
+        started = self.acquire()
+        try:
+            yield
+        except BaseException:
+            self.release(started, ok=False)
+            raise
+        self.release(started, ok=True)
+
+    def _increase(self):
+        # 并发没有用满时说明需求不足，不增加
+        if self.in_flight + 1 < int(self.limit) or self.limit >= self.max_limit:
+            return
+        before = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        if int(self.limit) > before:
+            LIMIT_CHANGES.inc(direction='increase', reason='healthy')
+
+    def _decrease(self, started, reason):
+        # 上次减少之前发出的请求反映的是旧的并发水平，不再重复减少
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.perf_counter()
+        before = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        if int(self.limit) < before:
+            LIMIT_CHANGES.inc(direction='decrease', reason=reason)
+
+    def _publish(self):
+        LIMIT_GAUGE.set(int(self.limit))
+        IN_FLIGHT_GAUGE.set(self.in_flight)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_fetch_limiter():
+    """获取行情请求共用的限流器（并发上限在多次扫描之间保留）"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+        return _limiter
+
+
+def set_fetch_limiter(limiter):
+    """替换行情请求共用的限流器（传入None时下次使用时重新创建）"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
@@ -0,0 +1,262 @@
+"""
+行情请求的熔断、对冲请求和单次调用超时
+
+    df = call_endpoint('daily_bars', provider.get_daily_bars, code, start_date, end_date)
+
+- 熔断：每个接口一个熔断器。最近 WINDOW 次调用中失败比例达到 FAILURE_RATIO，或连续失败
+  CONSECUTIVE_FAILURES 次时打开，之后 RESET_TIMEOUT 秒内的调用直接抛出 CircuitOpenError
+  （调用方改用本地缓存），到时后放行一个探测请求，成功则关闭
+- 对冲：请求耗时超过该接口最近成功请求的P95时，再发出一个相同的请求，先返回的结果生效；
+  样本不足 HEDGE_MIN_SAMPLES 个或熔断器处于半开状态时不对冲。对冲请求同样占用自适应限流器的
+  一个名额（请求结束后释放），没有空闲名额时不对冲，不会超出并发上限
+- 超时：单次调用（包括对冲请求）最多等待 CALL_TIMEOUT 秒，超时抛出 FetchTimeoutError。
+  Python无法中止正在运行的线程，超时的请求由HTTP会话的socket超时结束
+
+请求在共享线程池中执行，fork出的子进程会重新创建线程池。
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from fetch_limiter import get_fetch_limiter
+from logger_config import log_stock_analysis
+from metrics import counter, gauge
+
+
+# 熔断：统计窗口、失败比例和连续失败次数
+WINDOW = 20
+FAILURE_RATIO = 0.5
+CONSECUTIVE_FAILURES = 10
+# 熔断打开后多久放行探测请求（秒）
+RESET_TIMEOUT = 30
+# 单次调用的最长等待时间（秒），略大于HTTP会话的socket超时
+CALL_TIMEOUT = 20
+# 是否发出对冲请求（环境变量 FETCH_HEDGE=off 关闭）
+HEDGING = os.environ.get('FETCH_HEDGE', 'on') != 'off'
+# 对冲延迟取最近成功请求耗时的分位数
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+# 对冲延迟下限（秒），避免快速请求全部被对冲
+HEDGE_MIN_DELAY = 0.2
+# 执行请求的线程数
+POOL_SIZE = 32
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = gauge('market_data_circuit_state', '行情接口熔断状态（0关闭，1半开，2打开）', labels=('endpoint',))
+CIRCUIT_REJECTIONS = counter('market_data_circuit_rejections_total', '熔断期间直接拒绝的调用次数',
+                             labels=('endpoint',))
+CALL_TIMEOUTS = counter('market_data_timeouts_total', '超时的行情调用次数', labels=('endpoint',))
+HEDGED_CALLS = counter('market_data_hedged_requests_total', '发出对冲请求的次数', labels=('endpoint',))
+HEDGE_WINS = counter('market_data_hedge_wins_total', '对冲请求先于原请求返回的次数', labels=('endpoint',))
+HEDGE_SKIPPED = counter('market_data_hedge_skipped_total', '没有空闲并发名额而放弃对冲的次数',
+                        labels=('endpoint',))
+
+
+class CircuitOpenError(ConnectionError):
+    """接口处于熔断状态，调用没有发出"""
+
+
+class FetchTimeoutError(TimeoutError):
+    """调用在 CALL_TIMEOUT 内没有返回"""
+
+
+class CircuitBreaker:
+    """单个接口的熔断器（关闭 -> 打开 -> 半开 -> 关闭）"""
+
+    def __init__(self, endpoint, window=WINDOW, failure_ratio=FAILURE_RATIO,
+                 consecutive_failures=CONSECUTIVE_FAILURES, reset_timeout=RESET_TIMEOUT, clock=time.monotonic):
+        self.endpoint = endpoint
+        self.failure_ratio = failure_ratio
+        self.consecutive_failures = consecutive_failures
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self._results = deque(maxlen=window)
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, endpoint=endpoint)
+
+    def _set_state(self, state):
+        if state != self.state:
+            log_stock_analysis(f"行情接口 {self.endpoint} 熔断状态: {self.state} -> {state}",
+                               'warning' if state == OPEN else 'info')
+            self.state = state
+            CIRCUIT_STATE.set(_STATE_VALUES[state], endpoint=self.endpoint)
+
+    def allow(self):
+        """是否放行本次调用；半开状态同一时刻只放行一个探测请求"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def retry_in(self):
+        """距离放行探测请求的秒数"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._probing = False
+            if self.state == HALF_OPEN:
+                self._results.clear()
+                self._set_state(CLOSED)
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            self._results.append(False)
+            failures = self._results.count(False)
+            tripped = self._consecutive >= self.consecutive_failures or (
+                len(self._results) == self._results.maxlen and failures / len(self._results) >= self.failure_ratio)
+            if self.state == HALF_OPEN or (self.state == CLOSED and tripped):
+                self._opened_at = self.clock()
+                self._set_state(OPEN)
+
+
+class LatencyTracker:
+    """记录接口最近成功调用的耗时，计算对冲延迟"""
+
+    def __init__(self, maxlen=200):
+        self._latencies = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self):
+        """P95耗时（不低于 HEDGE_MIN_DELAY），样本不足时返回None"""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return max(HEDGE_MIN_DELAY, latencies[min(len(latencies) - 1, int(len(latencies) * HEDGE_QUANTILE))])
+
+
+_lock = threading.Lock()
+_breakers = {}
+_trackers = {}
+_executor = None
+_executor_pid = None
+
+
+def get_breaker(endpoint):
+    with _lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+            _trackers[endpoint] = LatencyTracker()
+        return _breakers[endpoint]
+
+
+def get_latency_tracker(endpoint):
+    get_breaker(endpoint)
+    return _trackers[endpoint]
+
+
+def reset_breakers():
+    """清空所有接口的熔断状态和耗时统计（替换数据源时调用）"""
+    with _lock:
+        _breakers.clear()
+        _trackers.clear()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='market-data')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def call_endpoint(endpoint, func, *args, timeout=None, hedge=None, **kwargs):
+    """
+    经由熔断器调用行情接口，超过P95耗时时发出对冲请求
+
+    Args:
+        endpoint: 接口名称，每个接口单独熔断和统计耗时
+        func: 实际的调用
+        timeout: 最长等待时间（秒），默认为 CALL_TIMEOUT
+        hedge: 是否允许对冲请求，默认为 HEDGING；对冲请求占用限流器的一个空闲名额，没有时不对冲
+
+    Returns:
+        func的返回值
+
+    Raises:
+        CircuitOpenError: 接口处于熔断状态
+        FetchTimeoutError: 超时
+        以及func抛出的异常（对冲时两个请求都失败才抛出）
+    """
+    breaker = get_breaker(endpoint)
+    tracker = get_latency_tracker(endpoint)
+    if not breaker.allow():
+        CIRCUIT_REJECTIONS.inc(endpoint=endpoint)
+        raise CircuitOpenError(f"行情接口 {endpoint} 熔断中，{breaker.retry_in():.0f}秒后重试")
+
+    timeout = CALL_TIMEOUT if timeout is None else timeout
+    hedge = HEDGING if hedge is None else hedge
+    hedge_delay = tracker.hedge_delay() if hedge and breaker.state == CLOSED else None
+    executor = _get_executor()
+    start = time.perf_counter()
+    deadline = start + timeout
+    primary = executor.submit(func, *args, **kwargs)
+    pending = {primary}
+    hedged = False
+    error = None
+    while pending:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        waiting_to_hedge = hedge_delay is not None and not hedged
+        until = min(deadline, start + hedge_delay) if waiting_to_hedge else deadline
+        done, pending = wait(pending, timeout=max(0.0, until - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                tracker.record(time.perf_counter() - start)
+                breaker.record_success()
+                if future is not primary:
+                    HEDGE_WINS.inc(endpoint=endpoint)
+                return future.result()
+            error = error or future.exception()
+        if waiting_to_hedge and pending and time.perf_counter() >= start + hedge_delay:
+            hedged = True
+            limiter = get_fetch_limiter()
+            if limiter.try_acquire() is None:
+                HEDGE_SKIPPED.inc(endpoint=endpoint)
+                continue
+            HEDGED_CALLS.inc(endpoint=endpoint)
+            future = executor.submit(func, *args, **kwargs)
+            # 对冲请求结束（或未开始即被取消）时释放名额
+            future.add_done_callback(lambda _: limiter.cancel())
+            pending.add(future)
+
+    breaker.record_failure()
+    if pending:
+        for future in pending:
+            future.cancel()
+        CALL_TIMEOUTS.inc(endpoint=endpoint)
+        raise FetchTimeoutError(f"行情接口 {endpoint} 调用超时（{timeout}秒）")
+    raise error
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# 默认连接池大小，与行情请求的并发数保持一致
+DEFAULT_POOL_SIZE = 4
+# 调用方没有指定timeout时使用的socket超时（秒），避免请求无限期挂起
+DEFAULT_TIMEOUT = 15
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+# 共享会话的连接池大小（由本模块记录，不读取HTTPAdapter的内部属性）
+_pool_size = DEFAULT_POOL_SIZE
+
+_stats = {
+    'requests': 0,
+    'errors': 0,
+    'new_connections': 0,
+}
+_latencies = deque(maxlen=10000)
+
+
+def _count_new_connection():
+    with _lock:
+        _stats['new_connections'] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """统计新建连接数的连接池适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+
+class PooledSession(requests.Session):
+    """记录请求次数、失败次数和耗时的会话，调用方没有指定timeout时使用 DEFAULT_TIMEOUT"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        super().__init__()
+        self.pool_size = pool_size
+        adapter = PooledAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        start = time.perf_counter()
+        try:
+            return super().request(method, url, **kwargs)
+        except Exception:
+            with _lock:
+                _stats['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                _stats['requests'] += 1
+                _latencies.append(elapsed)
+
+
+def get_session():
+    """
+    获取当前进程共享的keep-alive会话（行情数据源用它发出请求）
+
+    会话按进程创建：fork出的子进程不会复用父进程的socket。
+    只有显式使用这个会话的请求才走连接池，不影响进程中其他代码的 requests 调用。
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = PooledSession(_pool_size)
+            _session_pid = os.getpid()
+        return _session
+
+
+def set_pool_size(pool_size):
+    """
+    设置共享会话的连接池大小，应与请求并发数一致
+
+    大小变化时下次 get_session 创建新的会话；旧会话不主动关闭，
+    正在使用它的请求可以正常完成，之后随对象回收释放连接。
+    """
+    global _session, _pool_size
+    with _lock:
+        if pool_size != _pool_size:
+            _pool_size = pool_size
+            _session = None
+
+
+def close_pooled_session():
+    """关闭共享会话（下次使用时重新创建）"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def reset_http_stats():
+    """清空请求统计"""
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
+        _latencies.clear()
+
+
+def get_http_stats():
+    """
+    获取请求统计
+
+    Returns:
+        包含请求数、新建连接数、连接复用率和延迟分位数（毫秒）的字典
+    """
+    with _lock:
+        stats = dict(_stats)
+        latencies = sorted(_latencies)
+
+    total = stats['requests']
+    stats['reuse_ratio'] = max(0.0, 1 - stats['new_connections'] / total) if total else 0.0
+    if latencies:
+        stats['latency_ms'] = {
+            'mean': sum(latencies) / len(latencies) * 1000,
+            'p50': latencies[len(latencies) // 2] * 1000,
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            'max': latencies[-1] * 1000
+        }
+    else:
+        stats['latency_ms'] = None
+    return stats
+
+
+def format_http_stats(stats=None):
+    """将请求统计格式化为一行日志"""
+    stats = stats or get_http_stats()
+    message = (f"HTTP请求: {stats['requests']} 次, 失败: {stats['errors']} 次, "
+               f"新建连接: {stats['new_connections']} 个, 连接复用率: {stats['reuse_ratio']:.1%}")
+    latency = stats['latency_ms']
+    if latency:
+        message += (f", 延迟(ms) 平均: {latency['mean']:.0f} P50: {latency['p50']:.0f} "
+                    f"P95: {latency['p95']:.0f} 最大: {latency['max']:.0f}")
+    return message
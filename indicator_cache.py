@@ -0,0 +1,158 @@
+"""
+个股指标序列缓存
+
+扫描只保留每只股票最新一天的信号，完整的DIF/DEA/MACD/CH1/CL1等序列计算完就丢弃了。
+这里按需从本地日线缓存（最近一次刷新写入，不访问网络）计算一次精简模式的全部列，
+以紧凑的numpy数组（float32/int16/bool）保存在有界LRU缓存中；日线或复权因子缓存文件更新后自动失效。
+同一只股票反复查看图表时不再重新计算。
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bar_cache
+from stock_signals import calculate_lean_signals, LEAN_VALUE_COLUMNS, SIGNAL_NAMES, MIN_BARS
+from metrics import counter
+
+
+# 可查询的列：精简模式的数值列和九个信号
+INDICATOR_COLUMNS = list(LEAN_VALUE_COLUMNS) + SIGNAL_NAMES
+# 未指定列时返回的默认列
+DEFAULT_COLUMNS = ['close', 'DIF', 'DEA', 'MACD']
+# 缓存的股票数量上限，每只股票约数百个周期×17列，256只约占几MB
+DEFAULT_MAX_ENTRIES = 256
+# 浮点列输出保留的小数位数
+FLOAT_DECIMALS = 4
+
+CACHE_REQUESTS = counter('indicator_cache_requests_total', '指标序列缓存的查询次数', labels=('result',))
+
+
+class IndicatorSeries:
+    """一只股票的全部指标序列（列式numpy数组）"""
+
+    def __init__(self, stock_code, dates, columns, provisional, source_mtime):
+        self.stock_code = stock_code
+        self.dates = dates
+        self.columns = columns
+        self.provisional = provisional
+        self.source_mtime = source_mtime
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def select(self, start=None, end=None, columns=None, max_points=None):
+        """
+        按日期区间和列选取序列
+
+        Args:
+            start/end: 起止日期（含），None表示不限
+            columns: 列名列表，默认为 DEFAULT_COLUMNS
+            max_points: 最多返回的点数，超过时降采样（每个区间取最后一个值，信号取区间内是否出现过）
+
+        Returns:
+            列式字典：code/dates/columns/provisional/downsampled
+        """
+        columns = columns or DEFAULT_COLUMNS
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), 'D')))
+        hi = len(self.dates) if end is None else int(
+            np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), 'D'), side='right'))
+        dates = self.dates[lo:hi]
+        selected = {name: self.columns[name][lo:hi] for name in columns}
+
+        downsampled = bool(max_points) and len(dates) > max_points
+        if downsampled:
+            # 把区间平均切成max_points段，bounds为每段的起点
+            bounds = np.linspace(0, len(dates), max_points + 1).astype(int)[:-1]
+            last = np.append(bounds[1:], len(dates)) - 1
+            dates = dates[last]
+            for name, values in selected.items():
+                if values.dtype == bool:
+                    selected[name] = np.logical_or.reduceat(values, bounds)
+                else:
+                    selected[name] = values[last]
+
+        return {
+            'code': self.stock_code,
+            'dates': [str(d) for d in dates],
+            'columns': {name: _to_list(values) for name, values in selected.items()},
+            # 最后一根K线是否为盘中临时K线
+            'provisional': bool(self.provisional) and hi == len(self.dates),
+            'downsampled': downsampled
+        }
+
+
+def _to_list(values):
+    if values.dtype == np.float32 or values.dtype == np.float64:
+        return np.round(values.astype(np.float64), FLOAT_DECIMALS).tolist()
+    return values.tolist()
+
+
+def compute_indicator_series(stock_code, df, source_mtime=None):
+    """从日线计算一只股票的全部指标序列"""
+    frame = calculate_lean_signals(df, outputs=INDICATOR_COLUMNS)
+    columns = {name: frame[name].to_numpy() for name in INDICATOR_COLUMNS}
+    dates = df.index.to_numpy().astype('datetime64[D]')
+    provisional = bool(df['provisional'].iloc[-1]) if 'provisional' in df.columns else False
+    return IndicatorSeries(stock_code, dates, columns, provisional, source_mtime)
+
+
+class IndicatorCache:
+    """按股票代码的有界LRU缓存，日线缓存文件修改后重新计算"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, stock_code):
+        """
+        获取一只股票的指标序列
+
+        Returns:
+            IndicatorSeries；本地没有日线缓存或K线不足 MIN_BARS 时返回None
+        """
+        mtime = (bar_cache.get_bars_mtime(stock_code), bar_cache.get_factors_mtime(stock_code))
+        if mtime[0] is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(stock_code)
+            if entry is not None and entry.source_mtime == mtime:
+                self._entries.move_to_end(stock_code)
+                self.hits += 1
+                CACHE_REQUESTS.inc(result='hit')
+                return entry
+            self.misses += 1
+        CACHE_REQUESTS.inc(result='miss')
+
+        # 计算放在锁外，不阻塞其他股票的查询
+        df = bar_cache.load_adjusted_bars(stock_code)
+        if df is None or len(df) < MIN_BARS:
+            return None
+        entry = compute_indicator_series(stock_code, df, source_mtime=mtime)
+
+        with self._lock:
+            self._entries[stock_code] = entry
+            self._entries.move_to_end(stock_code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = IndicatorCache()
+
+
+def get_indicator_cache():
+    return _cache
@@ -0,0 +1,287 @@
+"""
+Web接口压测
+
+在本进程中启动Web服务（多线程WSGI服务器，监听本机随机端口），使用离线数据源和模拟的信号快照、历史信号，
+按目标速率并发请求各页面和接口，输出每个接口的吞吐量和 p50/p95/p99 延迟：
+
+    python loadtest.py --stocks 5000 --history-days 20 --rate 100 --duration 30
+
+- 请求按固定间隔发出（开环），延迟从计划发出的时刻算起，服务端变慢时请求排队等待的时间也计入延迟
+- --mix 指定各路径的请求比例，默认 /api/signals 60%、/api/history 20%、/ 10%、/history 10%
+- --refresh-at 10 在第10秒触发一次刷新（离线数据源扫描 --refresh-stocks 只股票并发布新快照），
+  报告中另外按刷新前、刷新期间、刷新后分别统计
+- 正式计时前每个路径先请求一次（生成并缓存响应体），首次请求的耗时单独列出
+- 快照、历史信号、日线缓存等都写在临时目录中，不读写 history/ 和 datas/cache/
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+import accuracy_stats
+import app as web_app
+import bar_cache
+import refresh_lease
+import scan_checkpoint
+import signal_store
+import stock_signals
+import stock_universe
+import trading_calendar
+from benchmark_payload import make_snapshot
+from market_data import OfflineProvider, set_provider
+from trading_calendar import get_calendar
+
+
+DEFAULT_MIX = '/api/signals=60,/api/history=20,/=10,/history=10'
+# 单个请求的超时时间（秒），超时记为失败
+REQUEST_TIMEOUT = 60
+PHASES = ('before', 'during', 'after')
+
+
+def parse_mix(value):
+    """'路径=权重,...' -> [(路径, 权重)]，格式错误时抛出ValueError"""
+    mix = []
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        path, _, weight = item.strip().rpartition('=')
+        if not path.startswith('/') or float(weight) <= 0:
+            raise ValueError(f"无效的请求比例: {item}")
+        mix.append((path, float(weight)))
+    if not mix:
+        raise ValueError('请求比例为空')
+    return mix
+
+
+def prepare_environment(work_dir, stocks, history_stocks, history_days, refresh_stocks):
+    """数据目录指向临时目录，使用离线数据源，写入模拟快照和最近 history_days 个交易日的历史信号"""
+    bar_cache.BAR_CACHE_DIR = os.path.join(work_dir, 'bars')
+    signal_store.HISTORY_DIR = os.path.join(work_dir, 'history')
+    signal_store.SNAPSHOT_PATH = os.path.join(work_dir, 'history', 'stock_signals.json')
+    refresh_lease.DEFAULT_LEASE_PATH = os.path.join(work_dir, 'refresh.lease')
+    scan_checkpoint.DEFAULT_CHECKPOINT_PATH = os.path.join(work_dir, 'checkpoint.db')
+    accuracy_stats.DEFAULT_STATS_PATH = os.path.join(work_dir, 'accuracy_stats.db')
+    trading_calendar.CALENDAR_DIR = work_dir
+    stock_universe.UNIVERSE_DIR = work_dir
+    stock_signals.FETCH_DELAY = 0
+    # 刷新扫描的股票池为离线数据源的模拟成分股
+    set_provider(OfflineProvider(universe_size=refresh_stocks))
+    # 只由压测触发刷新，请求不会触发
+    web_app.WEB_REFRESH_ENABLED = False
+
+    day = get_calendar().latest_finalized_day()
+    for k in range(history_days):
+        signals = make_snapshot(history_stocks, seed=k + 1)
+        for signal in signals:
+            signal['date'] = day.strftime('%Y-%m-%d')
+        signal_store.save_history_csv(signals, day)
+        day = get_calendar().previous_trading_day(day)
+
+    signal_store.save_snapshot(make_snapshot(stocks), datetime.now())
+    web_app.load_cached_signals()
+
+
+def start_server():
+    """在后台线程中启动多线程WSGI服务器，返回 (server, base_url)"""
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def warm_up(base_url, paths):
+    """每个路径请求一次，返回首次请求的耗时（毫秒）"""
+    result = {}
+    with requests.Session() as session:
+        for path in paths:
+            start = time.perf_counter()
+            response = session.get(base_url + path, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            result[path] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def run_clients(base_url, mix, rate, duration, clients, start, seed=0):
+    """
+    clients 个客户端线程按合计 rate 次/秒的速率请求，持续 duration 秒
+
+    每个客户端有自己的发送计划（间隔 clients/rate 秒，彼此错开），慢请求会推迟该客户端之后的请求，
+    推迟的时间计入这些请求的延迟。
+
+    Returns:
+        [(路径, 计划发出时刻, 延迟秒数, 状态码, 响应字节数)]，请求失败时状态码为None
+    """
+    paths = [path for path, _ in mix]
+    weights = [weight for _, weight in mix]
+    interval = clients / rate
+    results = [[] for _ in range(clients)]
+
+    def run(k):
+        rng = random.Random(seed + k)
+        scheduled = start + interval * k / clients
+        with requests.Session() as session:
+            while scheduled < start + duration:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                path = rng.choices(paths, weights)[0]
+                try:
+                    response = session.get(base_url + path, timeout=REQUEST_TIMEOUT)
+                    status, size = response.status_code, len(response.content)
+                except requests.RequestException:
+                    status, size = None, 0
+                results[k].append((path, scheduled, time.perf_counter() - scheduled, status, size))
+                scheduled += interval
+
+    threads = [threading.Thread(target=run, args=(k,), name=f'loadtest-client-{k}', daemon=True)
+               for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for part in results for sample in part]
+
+
+def schedule_refresh(start, delay, intraday):
+    """在第 delay 秒触发一次刷新，返回记录刷新起止时刻的字典（线程结束后填写）"""
+    refresh = {'mode': 'intraday' if intraday else 'full'}
+
+    def run():
+        time.sleep(max(0.0, start + delay - time.perf_counter()))
+        refresh['started'] = time.perf_counter()
+        try:
+            # 让 should_update 判断需要刷新
+            web_app.last_update_time = None
+            web_app.update_signals(intraday=intraday)
+        except Exception as e:
+            refresh['error'] = str(e)
+        refresh['finished'] = time.perf_counter()
+
+    thread = threading.Thread(target=run, name='loadtest-refresh', daemon=True)
+    thread.start()
+    refresh['thread'] = thread
+    return refresh
+
+
+def summarize(samples, seconds):
+    """一组请求的数量、失败数、吞吐量（成功请求/秒）和延迟分位数（毫秒）"""
+    ok = [sample for sample in samples if sample[3] is not None and sample[3] < 400]
+    summary = {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'throughput_rps': round(len(ok) / seconds, 2) if seconds > 0 else None
+    }
+    if ok:
+        latencies = np.array([sample[2] for sample in ok]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update({
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(latencies.max()), 2),
+            'avg_bytes': int(np.mean([sample[4] for sample in ok]))
+        })
+    return summary
+
+
+def summarize_routes(samples, seconds, paths):
+    report = {path: summarize([sample for sample in samples if sample[0] == path], seconds) for path in paths}
+    report['all'] = summarize(samples, seconds)
+    return report
+
+
+def phase_of(scheduled, refresh):
+    if scheduled < refresh['started']:
+        return 'before'
+    if scheduled < refresh['finished']:
+        return 'during'
+    return 'after'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Web接口压测（离线数据源）')
+    parser.add_argument('--stocks', type=int, default=5000, help='模拟快照中的股票数量')
+    parser.add_argument('--history-stocks', type=int, default=300, help='每个历史交易日模拟的股票数量')
+    parser.add_argument('--history-days', type=int, default=20, help='模拟历史信号的交易日数量')
+    parser.add_argument('--rate', type=float, default=50, help='目标请求速率（次/秒，所有客户端合计）')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端数量')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='各路径的请求比例，格式为 路径=权重,...')
+    parser.add_argument('--refresh-at', type=float, default=None, metavar='SECONDS',
+                        help='在压测开始后第几秒触发一次刷新，默认不刷新')
+    parser.add_argument('--refresh-stocks', type=int, default=300, help='刷新时扫描的股票数量')
+    parser.add_argument('--intraday', action='store_true', help='刷新时使用盘中增量刷新（不可用时退回完整扫描）')
+    parser.add_argument('--seed', type=int, default=0, help='请求路径选择的随机种子')
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rate <= 0 or args.duration <= 0 or args.clients <= 0:
+        parser.error('--rate、--duration、--clients 必须大于0')
+    paths = [path for path, _ in mix]
+
+    work_dir = tempfile.mkdtemp(prefix='loadtest_')
+    server = None
+    try:
+        prepare_environment(work_dir, args.stocks, args.history_stocks, args.history_days, args.refresh_stocks)
+        server, base_url = start_server()
+        first_request_ms = warm_up(base_url, paths)
+
+        start = time.perf_counter() + 0.1
+        refresh = schedule_refresh(start, args.refresh_at, args.intraday) if args.refresh_at is not None else None
+        samples = run_clients(base_url, mix, args.rate, args.duration, args.clients, start, seed=args.seed)
+        elapsed = max(time.perf_counter() - start, args.duration)
+
+        report = {
+            'stocks': args.stocks,
+            'history_days': args.history_days,
+            'target_rps': args.rate,
+            'clients': args.clients,
+            'duration_s': round(elapsed, 2),
+            'first_request_ms': first_request_ms,
+            'routes': summarize_routes(samples, elapsed, paths)
+        }
+        if refresh is not None:
+            # 刷新比压测结束得晚时等它完成，刷新之后的阶段为空
+            refresh['thread'].join()
+            end = start + elapsed
+            bounds = {'before': (start, refresh['started']),
+                      'during': (refresh['started'], min(refresh['finished'], end)),
+                      'after': (min(refresh['finished'], end), end)}
+            report['refresh'] = {
+                'mode': refresh['mode'],
+                'started_at_s': round(refresh['started'] - start, 2),
+                'duration_s': round(refresh['finished'] - refresh['started'], 2),
+                'stocks_after': len(web_app.global_signals),
+                'snapshot_version': web_app.snapshot_version
+            }
+            if 'error' in refresh:
+                report['refresh']['error'] = refresh['error']
+            report['phases'] = {
+                phase: summarize_routes([sample for sample in samples if phase_of(sample[1], refresh) == phase],
+                                        bounds[phase][1] - bounds[phase][0], paths)
+                for phase in PHASES
+            }
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,145 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import threading
 from datetime import datetime
 
 
+# 日志目录，每天一个 YYYY-MM-DD.log 文件
+LOG_DIR = 'log'
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    按日期写入 log/YYYY-MM-DD.log 的文件处理器
+
+    根据日志记录的产生时间选择文件，跨过零点后自动切换到新一天的文件，
+    长时间运行的服务不会一直写入启动当天的文件。
+    """
+
+    def __init__(self, log_dir=None, encoding='utf-8'):
+        self.log_dir = log_dir or LOG_DIR
+        self.current_date = datetime.now().strftime('%Y-%m-%d')
+        os.makedirs(self.log_dir, exist_ok=True)
+        super().__init__(self._path(self.current_date), encoding=encoding, delay=True)
+
+    def _path(self, date_str):
+        return os.path.join(self.log_dir, f'{date_str}.log')
+
+    def emit(self, record):
+        date_str = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d')
+        if date_str != self.current_date:
+            self.acquire()
+            try:
+                if self.stream is not None:
+                    self.stream.close()
+                    self.stream = None
+                self.current_date = date_str
+                self.baseFilename = os.path.abspath(self._path(date_str))
+                os.makedirs(self.log_dir, exist_ok=True)
+            finally:
+                self.release()
+        super().emit(record)
+
+
+# 所有日志器共用一个队列：调用方只把记录放进队列，由主进程中唯一的监听线程写文件和控制台。
+# 进程池以 init_worker_logging 为 initializer 把主进程的队列交给工作进程，日志同样汇总到主进程的
+# 监听线程，不会各自打开日志文件。fork 出的进程本来就继承队列；spawn/forkserver 启动的进程会重新
+# 导入本模块，不经 initializer 时会各自启动监听线程。
+_queue = None
+_queue_handler = None
+_listener = None
+# 启动监听线程的进程，fork出的子进程只向队列写入，不能停止父进程的监听线程
+_listener_pid = None
+_setup_lock = threading.Lock()
+
+
+def _create_output_handlers():
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    file_handler = DailyFileHandler()
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    return file_handler, console_handler
+
+
+def get_queue_handler():
+    """获取当前进程写入日志队列的处理器，第一次调用时启动监听线程"""
+    global _queue, _queue_handler, _listener, _listener_pid
+    with _setup_lock:
+        if _queue_handler is None:
+            _queue = multiprocessing.Queue(-1)
+            _queue_handler = logging.handlers.QueueHandler(_queue)
+            _queue_handler.setLevel(logging.INFO)
+            _listener = logging.handlers.QueueListener(_queue, *_create_output_handlers(),
+                                                       respect_handler_level=True)
+            _listener.start()
+            _listener_pid = os.getpid()
+            atexit.register(stop_logging)
+        return _queue_handler
+
+
+def get_log_queue():
+    """当前进程的日志队列（需要时启动监听线程），作为 init_worker_logging 的参数传给进程池"""
+    get_queue_handler()
+    return _queue
+
+
+def init_worker_logging(queue):
+    """
+    进程池工作进程的 initializer：日志写入主进程的队列，不启动监听线程
+
+        ProcessPoolExecutor(max_workers=4, initializer=init_worker_logging, initargs=(get_log_queue(),))
+
+    Args:
+        queue: 主进程 get_log_queue() 返回的队列
+    """
+    global _queue, _queue_handler
+    with _setup_lock:
+        # fork出的进程已经继承了同一个队列和处理器
+        if _queue is queue:
+            return
+        _queue = queue
+        _queue_handler = logging.handlers.QueueHandler(queue)
+        _queue_handler.setLevel(logging.INFO)
+
+
+def stop_logging():
+    """停止监听线程，写完队列中剩余的日志（进程退出时自动调用）"""
+    global _listener
+    with _setup_lock:
+        if _listener_pid != os.getpid():
+            return
+        listener, _listener = _listener, None
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def flush_logging():
+    """等待队列中已有的日志写入文件（测试和基准测试用）"""
+    with _setup_lock:
+        listener = _listener
+        if listener is None or listener._thread is None or _listener_pid != os.getpid():
+            return
+        listener.stop()
+        listener.start()
+
+
 def get_unified_logger(name=None):
     """
     获取统一配置的日志器
     
+    日志器只挂一个 QueueHandler，记录放进队列后立即返回，写文件由监听线程完成。
+    
     Args:
         name: logger名称，如果不指定则使用调用模块的名称
     
@@ -22,39 +155,9 @@ def get_unified_logger(name=None):
     if logger.handlers:
         return logger
     
-    # 确保log目录存在
-    log_dir = 'log'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # 按日期命名日志文件
-    today = datetime.now().strftime('%Y-%m-%d')
-    log_filename = os.path.join(log_dir, f'{today}.log')
-    
     # 设置日志级别
     logger.setLevel(logging.INFO)
-    
-    # 创建文件处理器
-    file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    
-    # 创建控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    
-    # 创建格式器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # 设置格式器
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-    
-    # 添加处理器到logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(get_queue_handler())
     
     return logger
 
@@ -69,10 +172,9 @@ def setup_flask_logging(app):
     # 获取统一的logger
     logger = get_unified_logger('flask_app')
     
-    # 设置Flask应用的logger
+    # 设置Flask应用的logger，同样通过日志队列写入
     app.logger.handlers.clear()
-    app.logger.addHandler(logger.handlers[0])  # 文件处理器
-    app.logger.addHandler(logger.handlers[1])  # 控制台处理器
+    app.logger.addHandler(get_queue_handler())
     app.logger.setLevel(logging.INFO)
     
     return logger
@@ -145,7 +247,7 @@ def cleanup_old_logs(keep_days=30):
     import glob
     from datetime import timedelta
     
-    log_dir = 'log'
+    log_dir = LOG_DIR
     if not os.path.exists(log_dir):
         return
     
@@ -0,0 +1,355 @@
+import os
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from http_session import get_session
+
+
+# 行情列名映射：akshare中文列名 -> 统一英文列名
+DAILY_COLUMNS = {
+    '日期': 'date',
+    '开盘': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '收盘': 'close',
+    '成交量': 'volume'
+}
+
+SPOT_COLUMNS = {
+    '代码': 'code',
+    '名称': 'name',
+    '今开': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '最新价': 'close',
+    '成交量': 'volume'
+}
+
+MINUTE_COLUMNS = {
+    '时间': 'time',
+    '开盘': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '收盘': 'close',
+    '成交量': 'volume'
+}
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 东方财富K线接口（ak.stock_zh_a_hist、ak.stock_zh_a_hist_min_em 使用的接口）返回的前6个字段
+KLINE_FIELDS = ['开盘', '收盘', '最高', '最低', '成交量']
+
+
+def normalize_daily_bars(df):
+    """
+    将akshare日线数据转换为统一格式
+
+    Args:
+        df: 东方财富K线接口（ak.stock_zh_a_hist）中文列名的DataFrame
+
+    Returns:
+        以date为索引、包含 open/high/low/close/volume 列的DataFrame
+    """
+    df = df.rename(columns=DAILY_COLUMNS)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.set_index('date')
+    return df[BAR_COLUMNS]
+
+
+def exchange_symbol(stock_code):
+    """6位股票代码 -> 带交易所前缀的代码（新浪接口使用，如 sh600000）"""
+    if stock_code.startswith(('6', '9')):
+        return f'sh{stock_code}'
+    if stock_code.startswith(('4', '8')):
+        return f'bj{stock_code}'
+    return f'sz{stock_code}'
+
+
+class MarketDataProvider:
+    """行情数据源接口，所有行情请求都通过该接口发出，便于在本地替换为模拟数据"""
+
+    name = 'base'
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        """
+        获取日线数据
+
+        Args:
+            stock_code: 6位股票代码
+            start_date: 开始日期，格式YYYYMMDD
+            end_date: 结束日期，格式YYYYMMDD
+
+        Returns:
+            统一格式的日线DataFrame，没有数据时返回空DataFrame
+        """
+        raise NotImplementedError
+
+    def get_minute_bars(self, stock_code, start, end):
+        """
+        获取5分钟线（不复权）
+
+        Args:
+            start/end: 起止时刻，格式 YYYY-mm-dd HH:MM:SS
+
+        Returns:
+            以每根K线的截止时刻（time）为索引、包含 open/high/low/close/volume 列的DataFrame
+        """
+        raise NotImplementedError
+
+    def get_spot_snapshot(self):
+        """
+        一次性获取全市场实时行情快照
+
+        Returns:
+            以code为索引、包含 name/open/high/low/close/volume 列的DataFrame
+        """
+        raise NotImplementedError
+
+    def get_index_constituents(self, index_code):
+        """
+        获取指数成分股
+
+        Returns:
+            包含 code/name 列的DataFrame
+        """
+        raise NotImplementedError
+
+    def get_trade_dates(self):
+        """
+        获取交易日历
+
+        Returns:
+            交易日（datetime.date）列表
+        """
+        raise NotImplementedError
+
+    def get_adjust_factors(self, stock_code):
+        """
+        获取复权因子
+
+        Returns:
+            以date为索引、factor列为后复权累计因子的DataFrame，每次除权除息一行，自该日起生效；
+            后复权价格 = 不复权价格 × factor
+        """
+        raise NotImplementedError
+
+    def universe_cache_key(self):
+        """股票池本地缓存的文件名标识，成分股不同的数据源需要返回不同的值"""
+        return self.name
+
+
+class AkshareProvider(MarketDataProvider):
+    """
+    基于akshare的行情数据源
+
+    逐只股票请求的日线和5分钟线直接请求东方财富K线接口（与akshare请求的接口和参数相同），
+    经由传入的会话（默认为 http_session 的共享keep-alive会话）发出，复用连接池；
+    实时快照、成分股、交易日历、复权因子等请求次数少的接口仍调用akshare。
+    """
+
+    name = 'akshare'
+    kline_url = 'https://push2his.eastmoney.com/api/qt/stock/kline/get'
+
+    def __init__(self, session=None):
+        self._session = session
+
+    @property
+    def session(self):
+        return self._session if self._session is not None else get_session()
+
+    def _get_klines(self, stock_code, period, start_date, end_date, time_column):
+        """请求不复权K线，返回 time_column 加 KLINE_FIELDS 列（数值）的DataFrame，没有数据时为空"""
+        params = {
+            'fields1': 'f1,f2,f3,f4,f5,f6',
+            'fields2': 'f51,f52,f53,f54,f55,f56',
+            'ut': '7eea3edcaed734bea9cbfc24409ed989',
+            'klt': period,
+            'fqt': '0',
+            'secid': f"{1 if stock_code.startswith('6') else 0}.{stock_code}",
+            'beg': start_date,
+            'end': end_date
+        }
+        response = self.session.get(self.kline_url, params=params)
+        response.raise_for_status()
+        data = response.json().get('data') or {}
+        columns = [time_column] + KLINE_FIELDS
+        df = pd.DataFrame([line.split(',')[:len(columns)] for line in data.get('klines') or []], columns=columns)
+        df[KLINE_FIELDS] = df[KLINE_FIELDS].apply(pd.to_numeric, errors='coerce')
+        return df
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        df = self._get_klines(stock_code, '101', start_date, end_date, '日期')
+        if df.empty:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        return normalize_daily_bars(df)
+
+    def get_minute_bars(self, stock_code, start, end):
+        # 与akshare相同：接口只保留最近一段时间的分钟线，全部取回后按时间截取 [start, end]
+        df = self._get_klines(stock_code, '5', '0', '20500000', '时间')
+        df = df.rename(columns=MINUTE_COLUMNS)
+        df['time'] = pd.to_datetime(df['time'])
+        df = df.set_index('time')[BAR_COLUMNS]
+        return df[(df.index >= pd.Timestamp(start)) & (df.index <= pd.Timestamp(end))]
+
+    def get_adjust_factors(self, stock_code):
+        import akshare as ak
+        df = ak.stock_zh_a_daily(symbol=exchange_symbol(stock_code), adjust="hfq-factor")
+        df = df.rename(columns={'hfq_factor': 'factor'})
+        df['date'] = pd.to_datetime(df['date'])
+        df['factor'] = df['factor'].astype(float)
+        return df.set_index('date')[['factor']].sort_index()
+
+    def get_spot_snapshot(self):
+        import akshare as ak
+        df = ak.stock_zh_a_spot_em()
+        df = df.rename(columns=SPOT_COLUMNS)[list(SPOT_COLUMNS.values())]
+        # 停牌股票没有最新价
+        df = df.dropna(subset=['close'])
+        return df.set_index('code')
+
+    def get_index_constituents(self, index_code):
+        import akshare as ak
+        df = ak.index_stock_cons(symbol=index_code)
+        return pd.DataFrame({
+            'code': df['品种代码'].tolist(),
+            'name': df['品种名称'].tolist()
+        })
+
+    def get_trade_dates(self):
+        import akshare as ak
+        df = ak.tool_trade_date_hist_sina()
+        return list(pd.to_datetime(df['trade_date']).dt.date)
+
+
+class OfflineProvider(MarketDataProvider):
+    """
+    离线模拟数据源
+
+    按股票代码生成确定性的随机游走日线，不访问网络，
+    用于本地调试、测试和压测。
+    """
+
+    name = 'offline'
+
+    def __init__(self, universe_size=None):
+        if universe_size is None:
+            universe_size = int(os.environ.get('OFFLINE_UNIVERSE_SIZE', 300))
+        self.universe_size = universe_size
+
+    def universe_cache_key(self):
+        # 模拟成分股随股票池大小变化
+        return f"{self.name}_{self.universe_size}"
+
+    def _seed(self, stock_code):
+        return zlib.crc32(str(stock_code).encode('utf-8'))
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        # 从固定起点生成整段序列后再截取，保证不同区间请求得到的数据一致
+        dates = pd.bdate_range('2020-01-01', pd.to_datetime(end_date), name='date')
+        rng = np.random.default_rng(self._seed(stock_code))
+        steps = rng.normal(0, 0.02, len(dates))
+        close = np.round(10 * np.exp(np.cumsum(steps)), 2)
+        df = pd.DataFrame({
+            'open': np.round(close * (1 - steps / 4), 2),
+            'high': np.round(close * 1.01, 2),
+            'low': np.round(close * 0.99, 2),
+            'close': close,
+            'volume': rng.integers(100000, 1000000, len(dates)).astype(float)
+        }, index=dates)
+        return df[df.index >= pd.to_datetime(start_date)]
+
+    def get_minute_bars(self, stock_code, start, end):
+        # 每个交易日48根5分钟线，收盘价在15:00与当日日线的收盘价一致
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        daily = self.get_daily_bars(stock_code, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+        slots = pd.to_timedelta(np.r_[np.arange(9 * 60 + 35, 11 * 60 + 31, 5), np.arange(13 * 60 + 5, 15 * 60 + 1, 5)],
+                                unit='min')
+        frames = []
+        for day, bar in daily.iterrows():
+            rng = np.random.default_rng(self._seed(stock_code) + day.toordinal())
+            path = np.cumsum(rng.normal(0, 0.003, len(slots)))
+            close = np.round(bar['close'] * np.exp(path - path[-1]), 2)
+            opens = np.r_[bar['open'], close[:-1]]
+            frames.append(pd.DataFrame({
+                'open': opens,
+                'high': np.round(np.maximum(opens, close) * 1.001, 2),
+                'low': np.round(np.minimum(opens, close) * 0.999, 2),
+                'close': close,
+                'volume': np.round(bar['volume'] / len(slots) * rng.uniform(0.5, 1.5, len(slots)))
+            }, index=pd.DatetimeIndex(day + slots, name='time')))
+        if not frames:
+            return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([], name='time'))
+        df = pd.concat(frames)
+        return df[(df.index >= start) & (df.index <= end)]
+
+    def get_adjust_factors(self, stock_code):
+        # 模拟日线没有除权除息
+        return pd.DataFrame({'factor': [1.0]}, index=pd.DatetimeIndex([pd.Timestamp('2020-01-01')], name='date'))
+
+    def get_spot_snapshot(self):
+        today = datetime.now().strftime('%Y%m%d')
+        # 按分钟取随机种子，模拟盘中价格变动
+        minute_seed = int(datetime.now().strftime('%H%M'))
+        rows = []
+        for code, name in self.get_index_constituents('000300').itertuples(index=False):
+            bars = self.get_daily_bars(code, today, today)
+            base = bars['open'].iloc[-1] if not bars.empty else \
+                self.get_daily_bars(code, '20200101', today)['close'].iloc[-1]
+            rng = np.random.default_rng(self._seed(code) + minute_seed)
+            price = round(float(base) * (1 + rng.normal(0, 0.01)), 2)
+            rows.append({
+                'code': code,
+                'name': name,
+                'open': float(base),
+                'high': max(float(base), price),
+                'low': min(float(base), price),
+                'close': price,
+                'volume': float(rng.integers(10000, 500000))
+            })
+        return pd.DataFrame(rows).set_index('code')
+
+    def get_index_constituents(self, index_code):
+        codes = [f"{600000 + i:06d}" for i in range(self.universe_size)]
+        return pd.DataFrame({
+            'code': codes,
+            'name': [f"模拟股票{i + 1}" for i in range(self.universe_size)]
+        })
+
+    def get_trade_dates(self):
+        # 与模拟日线一致：工作日均为交易日
+        return list(pd.bdate_range('2020-01-01', f'{datetime.now().year + 1}-12-31').date)
+
+
+PROVIDERS = {
+    'akshare': AkshareProvider,
+    'offline': OfflineProvider
+}
+
+_provider = None
+
+
+def get_provider():
+    """
+    获取当前行情数据源
+
+    默认使用akshare，可通过环境变量 STOCK_DATA_PROVIDER=offline 切换为离线数据源；
+    使用环境变量可以保证进程池中的子进程选择相同的数据源。
+    """
+    global _provider
+    if _provider is None:
+        name = os.environ.get('STOCK_DATA_PROVIDER', 'akshare')
+        if name not in PROVIDERS:
+            raise ValueError(f"未知的数据源: {name}")
+        _provider = PROVIDERS[name]()
+    return _provider
+
+
+def set_provider(provider):
+    """替换当前进程的行情数据源，传入None则恢复默认；各接口的熔断状态随之重置"""
+    global _provider
+    from fetch_resilience import reset_breakers
+    _provider = provider
+    reset_breakers()
@@ -0,0 +1,375 @@
+"""
+进程内指标注册表，输出Prometheus文本格式
+
+    FETCH_LATENCY = histogram('stock_fetch_latency_seconds', '单次行情请求耗时', labels=('status',))
+    FETCH_LATENCY.observe(0.35, status='ok')
+
+信号计算在进程池中进行，工作进程中记录的计数器和直方图通过 drain_metrics() 取出增量，
+随计算结果返回主进程后用 merge_metrics() 合并，/metrics 输出的是所有工作进程的汇总。
+fork出的子进程会继承父进程的数值，注册表按进程号检测fork，子进程从零开始计数，避免重复累加。
+
+独立运行的扫描进程（scan.py、distributed_scan.py）结束时用 export_metrics() 把计数器和直方图的增量
+累加到共享目录 METRICS_DIR 中的文件，Web进程的 /metrics 输出本进程的指标加上该目录中的累计值。
+瞬时值（gauge）只输出Web进程自己的；Web服务按单进程部署，多个Web进程时各自输出自己的请求指标。
+"""
+import copy
+import json
+import math
+import os
+import threading
+
+from refresh_lease import exclusive_lock
+
+
+# 扫描进程导出指标的共享目录，与Web进程共用history卷
+METRICS_DIR = os.environ.get('METRICS_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'metrics')
+
+
+# 默认的耗时直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _reset(self):
+        self._values = {}
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.check_fork()
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values):
+        for key, value in values.items():
+            self._values[key] = self._values.get(key, 0) + value
+
+    def _valid(self, value):
+        return isinstance(value, (int, float))
+
+    def _samples(self):
+        if not self._values and not self.label_names:
+            yield self.name, '', 0
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.label_names, key), value
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；也可以设置为在输出时调用的函数"""
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        """输出时调用function取值（无标签），返回None时不输出"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                value = None
+            if value is not None:
+                yield self.name, '', value
+            return
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.label_names, key), value
+
+
+class Histogram(_Metric):
+    """分桶直方图，记录分布、总和和次数"""
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.check_fork()
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def get_count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def get_sum(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0.0
+
+    def _drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def _valid(self, value):
+        return isinstance(value, list) and len(value) == 3 and len(value[0]) == len(self.buckets)
+
+    def _merge(self, values):
+        for key, (counts, total, count) in values.items():
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.label_names, key, [('le', _format_value(float(bound)))]), cumulative)
+            yield f'{self.name}_sum', _format_labels(self.label_names, key), total
+            yield f'{self.name}_count', _format_labels(self.label_names, key), count
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._metrics = {}
+        self._pid = os.getpid()
+
+    def check_fork(self):
+        """在fork出的子进程中第一次使用时清空继承来的计数器和直方图（调用方持有锁）"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            for metric in self._metrics.values():
+                if metric.kind != 'gauge':
+                    metric._reset()
+
+    def _register(self, cls, name, documentation, labels, **kwargs):
+        with self.lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"指标 {name} 已注册为不同的类型或标签")
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def drain(self):
+        """取出并清零本进程的计数器和直方图增量（用于从工作进程传回主进程）"""
+        with self.lock:
+            self.check_fork()
+            return {name: metric._drain() for name, metric in self._metrics.items()
+                    if metric.kind != 'gauge' and metric._values}
+
+    def merge(self, delta):
+        """合并工作进程传回的增量"""
+        if not delta:
+            return
+        with self.lock:
+            self.check_fork()
+            for name, values in delta.items():
+                metric = self._metrics.get(name)
+                if metric is not None:
+                    metric._merge(values)
+
+    def render(self, extra=()):
+        """输出Prometheus文本格式，extra 中的增量（如其他进程导出的指标）累加到输出中，不改变本进程的数值"""
+        lines = []
+        with self.lock:
+            self.check_fork()
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                deltas = [delta[name] for delta in extra if name in delta]
+                if deltas:
+                    metric = copy.copy(metric)
+                    metric._values = copy.deepcopy(metric._values)
+                    for values in deltas:
+                        metric._merge(values)
+                samples = list(metric._samples())
+                if not samples and metric.label_names:
+                    continue
+                lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+                lines.append(f'# TYPE {name} {metric.kind}')
+                for sample_name, labels, value in samples:
+                    lines.append(f'{sample_name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def decode(self, data):
+        """JSON中的指标 -> merge 的增量格式，跳过未注册、类型或分桶不一致的指标"""
+        delta = {}
+        for name, items in data.items():
+            metric = self._metrics.get(name)
+            if metric is None or metric.kind == 'gauge':
+                continue
+            values = {tuple(key): value for key, value in items
+                      if len(key) == len(metric.label_names) and metric._valid(value)}
+            if values:
+                delta[name] = values
+        return delta
+
+
+def _encode(delta):
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in delta.items()}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, documentation, labels=()):
+    return REGISTRY.counter(name, documentation, labels)
+
+
+def gauge(name, documentation, labels=()):
+    return REGISTRY.gauge(name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, documentation, labels, buckets)
+
+
+def drain_metrics():
+    return REGISTRY.drain()
+
+
+def merge_metrics(delta):
+    REGISTRY.merge(delta)
+
+
+def _export_path(name, directory=None):
+    return os.path.join(directory or METRICS_DIR, f'{name}.json')
+
+
+def _read_exported(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return REGISTRY.decode(json.load(f))
+
+
+def export_metrics(name, directory=None):
+    """
+    把本进程的计数器和直方图增量累加到共享目录中的 <name>.json（取出后本进程清零，重复调用不会重复累加）
+
+    多个进程可以使用同一个名称，读-改-写在文件锁内进行。
+
+    Returns:
+        导出文件的路径
+    """
+    directory = directory or METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = _export_path(name, directory)
+    delta = drain_metrics()
+    with exclusive_lock(f'{path}.lock'):
+        try:
+            totals = _read_exported(path)
+        except (FileNotFoundError, ValueError):
+            totals = {}
+        for metric_name, values in delta.items():
+            # 借用已注册指标的合并逻辑，累加到文件中的数值上
+            metric = copy.copy(REGISTRY.get(metric_name))
+            metric._values = totals.get(metric_name, {})
+            metric._merge(values)
+            totals[metric_name] = metric._values
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_encode(totals), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load_exported_metrics(directory=None):
+    """读取共享目录中其他进程导出的累计值（merge 的增量格式列表），无法读取的文件跳过"""
+    directory = directory or METRICS_DIR
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            result.append(_read_exported(os.path.join(directory, file_name)))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def render_metrics(include_exported=True):
+    """输出本进程的指标，include_exported 为True时加上扫描进程导出到共享目录的累计值"""
+    return REGISTRY.render(load_exported_metrics() if include_exported else ())
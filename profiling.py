@@ -0,0 +1,252 @@
+"""
+扫描性能剖析
+
+开启后（scan.py --profile）每个计算进程在计算信号时启用 cProfile 和 tracemalloc，
+计算结果连同本进程的剖析数据一起返回主进程合并；stock_signals 中用 StageTimer 标记的
+各阶段（行情请求、M2/M3循环、CH/CL循环、df.apply、MACD120循环等）记录墙钟时间、
+CPU时间和峰值内存。扫描结束后 write_report() 输出文本报告和合并后的 .prof 文件
+（可用 snakeviz 等工具查看）。
+
+未开启时 StageTimer 和 start_task() 什么也不做，对正常扫描没有开销。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import unicodedata
+from datetime import datetime
+
+
+# 设置为1时开启剖析（spawn方式启动的子进程通过环境变量继承开关）
+PROFILE_ENV = 'STOCK_PROFILE'
+# 报告中列出的函数数量
+DEFAULT_TOP_FUNCTIONS = 30
+
+_enabled = os.environ.get(PROFILE_ENV) == '1'
+_lock = threading.Lock()
+# 本进程各阶段的累计：{阶段: [次数, 墙钟秒, CPU秒, 峰值内存字节]}
+_stages = {}
+_stages_pid = os.getpid()
+_collector = None
+
+
+def enable():
+    """开启剖析，并清空之前收集的结果"""
+    global _enabled, _collector
+    _enabled = True
+    os.environ[PROFILE_ENV] = '1'
+    _collector = ProfileCollector()
+    drain_stages()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    os.environ.pop(PROFILE_ENV, None)
+
+
+def is_enabled():
+    return _enabled
+
+
+def _check_fork():
+    """fork出的子进程丢弃继承来的阶段统计，避免合并时重复计算（调用方持有锁）"""
+    global _stages, _stages_pid
+    if _stages_pid != os.getpid():
+        _stages_pid = os.getpid()
+        _stages = {}
+
+
+def _record_stage(name, wall, cpu, peak):
+    with _lock:
+        _check_fork()
+        stage = _stages.setdefault(name, [0, 0.0, 0.0, None])
+        stage[0] += 1
+        stage[1] += wall
+        stage[2] += cpu
+        if peak is not None:
+            stage[3] = peak if stage[3] is None else max(stage[3], peak)
+
+
+def drain_stages():
+    """取出并清空本进程的阶段统计"""
+    global _stages
+    with _lock:
+        _check_fork()
+        stages, _stages = _stages, {}
+    return stages
+
+
+class StageTimer:
+    """
+    按顺序分段计时：每次 lap(name) 记录从上一次 lap（或创建时）到现在的一段
+
+        timer = StageTimer()
+        ...  # 基础MACD
+        timer.lap('基础MACD')
+        ...  # M2/M3循环
+        timer.lap('M2/M3循环')
+
+    CPU时间按线程统计，行情请求线程之间互不干扰；峰值内存只在 tracemalloc 开启时（计算进程中）记录。
+    """
+
+    def __init__(self):
+        self.active = _enabled
+        if self.active:
+            self._start()
+
+    def _start(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        if tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        else:
+            self.memory = None
+
+    def lap(self, name):
+        if not self.active:
+            return
+        peak = tracemalloc.get_traced_memory()[1] - self.memory if self.memory is not None else None
+        _record_stage(name, time.perf_counter() - self.wall, time.thread_time() - self.cpu, peak)
+        self._start()
+
+
+def start_task():
+    """计算进程中开始剖析一次计算，未开启剖析时返回None"""
+    if not _enabled:
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_task(profiler):
+    """结束剖析，返回可以传回主进程的剖析数据（未开启时返回None）"""
+    if profiler is None:
+        return None
+    profiler.disable()
+    profiler.create_stats()
+    return {
+        'pid': os.getpid(),
+        'stats': profiler.stats,
+        'stages': drain_stages(),
+        'traced_peak_bytes': tracemalloc.get_traced_memory()[1]
+    }
+
+
+def _pad(text, width, align_right=False):
+    """按显示宽度补齐（中文字符占两列）"""
+    text = str(text)
+    display = sum(2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1 for char in text)
+    padding = ' ' * max(0, width - display)
+    return padding + text if align_right else text + padding
+
+
+class _StatsHolder:
+    """让 pstats.Stats 可以直接加载 cProfile 的统计字典"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfileCollector:
+    """在主进程中合并各计算进程的剖析数据"""
+
+    def __init__(self):
+        self.stats = None
+        self.stages = {}
+        self.tasks_by_pid = {}
+        self.started_at = datetime.now()
+        self.wall_start = time.perf_counter()
+
+    def add_stages(self, stages):
+        for name, (calls, wall, cpu, peak) in stages.items():
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0, None])
+            stage[0] += calls
+            stage[1] += wall
+            stage[2] += cpu
+            if peak is not None:
+                stage[3] = peak if stage[3] is None else max(stage[3], peak)
+
+    def add(self, profile):
+        if not profile:
+            return
+        self.tasks_by_pid[profile['pid']] = self.tasks_by_pid.get(profile['pid'], 0) + 1
+        self.add_stages(profile['stages'])
+        if profile['stats']:
+            holder = _StatsHolder(profile['stats'])
+            if self.stats is None:
+                self.stats = pstats.Stats(holder)
+            else:
+                self.stats.add(holder)
+
+    def format_report(self, top=DEFAULT_TOP_FUNCTIONS, title=None):
+        """生成文本报告：各阶段耗时、各计算进程的任务数、最耗时的函数"""
+        lines = [f"# 扫描性能剖析报告 {self.started_at.strftime('%Y-%m-%d %H:%M:%S')}"]
+        if title:
+            lines.append(title)
+        lines.append(f"总墙钟时间: {time.perf_counter() - self.wall_start:.2f} 秒")
+        lines.append('')
+        lines.append('## 各阶段耗时（计算阶段为所有计算进程的合计，行情请求为所有请求线程的合计）')
+        widths = (20, 8, 12, 12, 12, 14)
+        header = ('阶段', '次数', '墙钟(秒)', 'CPU(秒)', '平均(毫秒)', '峰值内存(MB)')
+        rows = [header]
+        for name, (calls, wall, cpu, peak) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            peak_text = f"{peak / 1024 / 1024:.2f}" if peak is not None else '-'
+            rows.append((name, calls, f"{wall:.3f}", f"{cpu:.3f}", f"{wall / calls * 1000:.2f}", peak_text))
+        for row in rows:
+            lines.append(''.join(_pad(value, width, align_right=i > 0)
+                                 for i, (value, width) in enumerate(zip(row, widths))))
+        lines.append('')
+        lines.append('## 计算进程')
+        for pid, tasks in sorted(self.tasks_by_pid.items()):
+            lines.append(f"进程 {pid}: {tasks} 只股票")
+        if self.stats is not None:
+            for sort_key, heading in (('cumulative', '累计耗时'), ('tottime', '自身耗时')):
+                stream = io.StringIO()
+                self.stats.stream = stream
+                self.stats.sort_stats(sort_key).print_stats(top)
+                lines.append('')
+                lines.append(f'## 按{heading}排序的前 {top} 个函数')
+                lines.append(stream.getvalue().strip())
+        return '\n'.join(lines) + '\n'
+
+
+def collect(profile):
+    """合并一个计算进程返回的剖析数据（未开启剖析时忽略）"""
+    if _collector is not None and profile:
+        with _lock:
+            _collector.add(profile)
+
+
+def write_report(path=None, top=DEFAULT_TOP_FUNCTIONS, title=None):
+    """
+    写出剖析报告，主进程中记录的阶段（行情请求等）一并计入
+
+    Args:
+        path: 报告路径，默认为 log/profile_YYYYmmdd_HHMMSS.txt；同名 .prof 文件保存合并后的cProfile数据
+
+    Returns:
+        (报告路径, .prof路径或None)
+    """
+    if _collector is None:
+        raise RuntimeError('未开启剖析')
+    _collector.add_stages(drain_stages())
+    path = path or os.path.join('log', f"profile_{_collector.started_at.strftime('%Y%m%d_%H%M%S')}.txt")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_collector.format_report(top=top, title=title))
+    prof_path = None
+    if _collector.stats is not None:
+        prof_path = os.path.splitext(path)[0] + '.prof'
+        _collector.stats.dump_stats(prof_path)
+    return path, prof_path
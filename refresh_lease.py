@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# 租约文件放在history目录，多个容器共享同一个卷时可以互相看到
+DEFAULT_LEASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'refresh.lease')
+
+# 租约有效期（秒），持有者在刷新过程中定期续约；进程崩溃后租约过期即可被其他进程接管
+DEFAULT_LEASE_TTL = 600
+
+
+def default_owner_id():
+    """生成进程唯一的持有者标识：主机名-进程号-随机串"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+@contextmanager
+def exclusive_lock(path):
+    """对锁文件加排他锁，保护租约文件的读-改-写"""
+    with open(path, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RefreshLease:
+    """
+    基于文件的刷新租约（选主）
+
+    同一时刻只有一个进程持有租约并执行全市场扫描；其他进程获取失败后直接使用
+    持有者发布的快照。租约记录持有者和过期时间，持有者崩溃后租约自然过期。
+    """
+
+    def __init__(self, path=None, owner=None, ttl=DEFAULT_LEASE_TTL):
+        self.path = path or DEFAULT_LEASE_PATH
+        self.lock_path = f'{self.path}.lock'
+        self.owner = owner or default_owner_id()
+        self.ttl = ttl
+        # hold() 期间续约失败（租约已被其他进程接管）时设置
+        self._lost = threading.Event()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, lease):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(lease, f)
+        os.replace(tmp_path, self.path)
+
+    def holder(self):
+        """当前有效的租约信息，没有时返回None"""
+        lease = self._read()
+        if lease is None or lease['expires_at'] <= time.time():
+            return None
+        return lease
+
+    def is_held(self):
+        """
+        是否仍持有租约：续约没有失败，且租约文件中的持有者仍是自己、尚未过期
+
+        持有者在发布结果前调用，租约丢失（如进程长时间停顿后被其他进程接管）时不应再发布。
+        """
+        if self._lost.is_set():
+            return False
+        lease = self.holder()
+        return lease is not None and lease['owner'] == self.owner
+
+    def acquire(self):
+        """
+        尝试获取租约
+
+        Returns:
+            是否持有租约（已由自己持有时视为续约）
+        """
+        with exclusive_lock(self.lock_path):
+            lease = self._read()
+            now = time.time()
+            if lease is not None and lease['owner'] != self.owner and lease['expires_at'] > now:
+                return False
+            self._write({
+                'owner': self.owner,
+                'acquired_at': lease['acquired_at'] if lease and lease['owner'] == self.owner else now,
+                'expires_at': now + self.ttl
+            })
+            return True
+
+    def renew(self):
+        """续约，租约已被他人接管时返回False"""
+        with exclusive_lock(self.lock_path):
+            lease = self._read()
+            if lease is None or lease['owner'] != self.owner:
+                return False
+            lease['expires_at'] = time.time() + self.ttl
+            self._write(lease)
+            return True
+
+    def release(self):
+        """释放自己持有的租约"""
+        with exclusive_lock(self.lock_path):
+            lease = self._read()
+            if lease is not None and lease['owner'] == self.owner:
+                os.remove(self.path)
+
+    @contextmanager
+    def hold(self):
+        """
+        获取租约并在持有期间后台定期续约
+
+        续约失败（租约已被其他进程接管）后不再续约，is_held() 返回False，调用方据此放弃发布结果；
+        读写租约文件出错时下次心跳再试。
+
+        Yields:
+            是否获取成功；获取失败时不做任何事
+        """
+        if not self.acquire():
+            yield False
+            return
+
+        self._lost.clear()
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.ttl / 3):
+                try:
+                    renewed = self.renew()
+                except OSError:
+                    continue
+                if not renewed:
+                    self._lost.set()
+                    break
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield True
+        finally:
+            stop.set()
+            thread.join()
+            self.release()
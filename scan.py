@@ -0,0 +1,191 @@
+"""
+收盘后批量扫描命令行入口
+
+不依赖Flask应用，扫描指定交易日和股票池的信号，发布信号快照和历史信号CSV，
+打印耗时和吞吐量统计，并通过退出码报告结果，便于用cron在收盘后定时运行：
+
+    31 15 * * 1-5 cd /app && python scan.py >> log/scan_cron.log 2>&1
+
+默认扫描收盘数据已定型的最近一个交易日；--date 指定的日期不是交易日或尚未收盘定型时不写历史信号CSV。
+
+退出码：0 成功；1 失败股票比例超过 --max-failure-ratio；2 没有得到任何信号（股票池获取失败等）；
+3 其他进程正在刷新；4 扫描期间刷新租约被其他进程接管（结果没有发布）
+
+排查刷新耗时时可以加 --profile 剖析一次扫描，报告写入 log/profile_*.txt（各阶段墙钟/CPU时间、
+峰值内存和最耗时的函数），合并后的cProfile数据写入同名 .prof 文件：
+
+    python scan.py --full --no-resume --no-snapshot --profile
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import fetch_resilience
+import profiling
+import stock_signals
+import signal_store
+from stock_signals import (get_all_stock_signals, retry_failed_stocks, merge_signals, summarize_outcomes,
+                           COMPUTE_WORKERS, FETCH_WORKERS, STATUS_STALE)
+from http_session import format_http_stats
+from refresh_lease import RefreshLease
+from scan_checkpoint import get_checkpoint
+from trading_calendar import get_calendar
+from accuracy_stats import update_accuracy_stats
+from metrics import export_metrics
+
+EXIT_OK = 0
+EXIT_TOO_MANY_FAILURES = 1
+EXIT_NO_SIGNALS = 2
+EXIT_BUSY = 3
+EXIT_LEASE_LOST = 4
+
+
+def load_universe(universe):
+    """
+    读取股票池
+
+    Args:
+        universe: 'default' 使用沪深300+补充股票；CSV文件路径（包含code/name列）；
+                  或逗号分隔的股票代码
+
+    Returns:
+        (code, name) 列表，使用默认股票池时返回None（由扫描自行获取）
+    """
+    if universe == 'default':
+        return None
+    if universe.endswith('.csv'):
+        df = pd.read_csv(universe, encoding='utf-8', dtype={'code': str})
+        df = df.drop_duplicates(subset=['code'], keep='first')
+        return list(zip(df['code'], df['name'] if 'name' in df.columns else df['code']))
+    return [(code.strip(), code.strip()) for code in universe.split(',') if code.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='收盘后批量扫描股票信号（不启动Web服务）')
+    parser.add_argument('--date', default=None,
+                        help='交易日（YYYY-MM-DD或YYYYMMDD），默认为收盘数据已定型的最近一个交易日；行情截止到该日')
+    parser.add_argument('--universe', default='default',
+                        help="股票池：default（沪深300+补充股票）、CSV文件路径或逗号分隔的股票代码")
+    parser.add_argument('--workers', type=int, default=COMPUTE_WORKERS, help='信号计算进程数')
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS,
+                        help='行情请求并发上限（实际并发按请求耗时和错误自动调整）')
+    parser.add_argument('--fetch-delay', type=float, default=stock_signals.FETCH_DELAY,
+                        help='请求失败重试前的退避基数（秒）')
+    parser.add_argument('--fetch-timeout', type=float, default=fetch_resilience.CALL_TIMEOUT,
+                        help='单次行情请求的最长等待时间（秒）')
+    parser.add_argument('--no-hedge', action='store_true', help='慢请求不发出对冲请求')
+    parser.add_argument('--retry-rounds', type=int, default=1, help='失败股票的重试轮数')
+    parser.add_argument('--full', action='store_true', help='使用完整模式计算信号（默认精简模式）')
+    parser.add_argument('--no-resume', action='store_true', help='不续跑该交易日未完成的扫描')
+    parser.add_argument('--no-snapshot', action='store_true', help='不发布信号快照，只写历史信号CSV')
+    parser.add_argument('--max-failure-ratio', type=float, default=0.05,
+                        help='失败股票比例超过该值时以退出码1结束')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='PATH',
+                        help='剖析本次扫描（计算进程中开启cProfile和tracemalloc），'
+                             '报告默认写入 log/profile_<时间>.txt')
+    return parser.parse_args(argv)
+
+
+def run_scan(args, trade_date, lean, lease=None):
+    """
+    执行扫描并发布结果
+
+    Args:
+        lease: 持有的刷新租约，发布前确认仍然持有，已被其他进程接管时不发布（报告中 lease_lost 为True）
+
+    Returns:
+        扫描统计报告
+    """
+    start_time = time.time()
+    checkpoint = get_checkpoint()
+    signals, outcomes, run_id = get_all_stock_signals(
+        lean=lean, max_workers=args.workers, fetch_workers=args.fetch_workers, return_outcomes=True,
+        trade_date=trade_date.strftime('%Y-%m-%d'), resume=not args.no_resume,
+        stock_list=load_universe(args.universe), checkpoint=checkpoint, return_run_id=True
+    )
+    if args.retry_rounds > 0 and summarize_outcomes(outcomes)['failed']:
+        # 重试结果写回同一次扫描的检查点，续跑时不再重复请求
+        retried, outcomes = retry_failed_stocks(outcomes, lean=lean, max_rounds=args.retry_rounds,
+                                                max_workers=args.workers, fetch_workers=args.fetch_workers,
+                                                checkpoint=checkpoint, run_id=run_id,
+                                                end_date=trade_date.strftime('%Y%m%d'))
+        signals = merge_signals(signals, retried)
+    elapsed = time.time() - start_time
+
+    summary = summarize_outcomes(outcomes)
+    report = {
+        'trade_date': trade_date.strftime('%Y-%m-%d'),
+        'total': summary['total'],
+        'signals': len(signals),
+        'by_status': summary['by_status'],
+        'failed': [item['code'] for item in summary['failed']],
+        # 数据源熔断、只有本地缓存K线的股票数（计入失败，不发布信号）
+        'stale': summary['by_status'][STATUS_STALE],
+        'elapsed_seconds': round(elapsed, 1),
+        'stocks_per_second': round(summary['total'] / elapsed, 2) if elapsed > 0 else None,
+        'http': format_http_stats()
+    }
+    if not signals:
+        return report
+    if lease is not None and not lease.is_held():
+        report['lease_lost'] = True
+        return report
+
+    # 历史日期的扫描不覆盖当前快照
+    if trade_date >= get_calendar().latest_finalized_day() and not args.no_snapshot:
+        signal_store.save_snapshot(signals, datetime.now())
+        report['snapshot'] = signal_store.SNAPSHOT_PATH
+    # 非交易日或收盘数据尚未定型时不写历史信号，避免临时信号进入准确率统计和组合选股
+    report['history'], report['history_rows'] = \
+        signal_store.save_finalized_history(signals, trade_date) or (None, 0)
+    report['accuracy_updated'] = update_accuracy_stats()
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    trade_date = pd.Timestamp(args.date).date() if args.date else get_calendar().latest_finalized_day()
+    stock_signals.FETCH_DELAY = args.fetch_delay
+    fetch_resilience.CALL_TIMEOUT = args.fetch_timeout
+    fetch_resilience.HEDGING = not args.no_hedge
+    lean = not args.full
+
+    # 与Web进程共用刷新租约，同一时刻只有一个进程扫描
+    lease = RefreshLease()
+    with lease.hold() as is_leader:
+        if not is_leader:
+            print('其他进程正在刷新股票信号，本次扫描跳过', file=sys.stderr)
+            return EXIT_BUSY
+        if args.profile is not None:
+            profiling.enable()
+        try:
+            report = run_scan(args, trade_date, lean, lease=lease)
+        finally:
+            if args.profile is not None:
+                profiling.disable()
+            # 本次扫描的指标累加到共享目录，由Web进程的 /metrics 输出
+            try:
+                export_metrics('scan')
+            except OSError as e:
+                print(f'导出指标失败: {e}', file=sys.stderr)
+        if args.profile is not None:
+            title = f"交易日 {report['trade_date']}，{report['total']} 只股票，{'精简' if lean else '完整'}模式"
+            report['profile'], report['profile_stats'] = profiling.write_report(args.profile or None, title=title)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report.get('lease_lost'):
+        print('刷新租约已被其他进程接管，本次扫描结果没有发布', file=sys.stderr)
+        return EXIT_LEASE_LOST
+    if not report['signals']:
+        return EXIT_NO_SIGNALS
+    if report['total'] and len(report['failed']) / report['total'] > args.max_failure_ratio:
+        return EXIT_TOO_MANY_FAILURES
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
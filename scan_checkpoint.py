@@ -0,0 +1,231 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+
+# 检查点数据库位于history目录（与历史信号共用同一个持久化卷）
+DEFAULT_CHECKPOINT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'history', 'scan_checkpoint.db'
+)
+
+# 超过该时长没有进展的中断扫描不再续跑，避免混入过旧的盘中数据
+RESUME_MAX_AGE = timedelta(hours=2)
+
+# 这些状态的结果续跑时直接沿用，其余（请求/计算失败）会重新处理
+FINAL_STATUSES = ('ok', 'empty', 'too-short')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scan_runs (
+    run_id TEXT PRIMARY KEY,
+    trade_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_runs_date ON scan_runs (trade_date, status);
+CREATE TABLE IF NOT EXISTS scan_results (
+    run_id TEXT NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER,
+    latency REAL,
+    error TEXT,
+    payload TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, code)
+);
+'''
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ScanCheckpoint:
+    """
+    扫描检查点
+
+    每只股票处理完成后立即写入SQLite（WAL模式），进程重启后可以只处理剩余股票；
+    其他进程可以随时读取扫描进度和已完成的结果。
+    每次操作使用独立连接，可以在多线程、多进程中安全使用。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_CHECKPOINT_PATH
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接，成功时提交，结束后关闭"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start_run(self, trade_date, total, run_id=None, resume=True):
+        """
+        开始或续跑一次扫描
+
+        Args:
+            trade_date: 交易日，格式YYYY-MM-DD
+            total: 本次扫描的股票数量
+            run_id: 指定扫描ID；不指定时续跑该交易日未完成的扫描，没有则新建
+            resume: 不指定run_id时是否续跑未完成的扫描
+
+        Returns:
+            扫描ID
+        """
+        now = _now()
+        with self._connect() as conn:
+            if run_id is None and resume:
+                cutoff = (datetime.now() - RESUME_MAX_AGE).strftime('%Y-%m-%d %H:%M:%S')
+                row = conn.execute(
+                    "SELECT run_id FROM scan_runs WHERE trade_date = ? AND status = 'running' AND updated_at >= ? "
+                    "ORDER BY updated_at DESC LIMIT 1",
+                    (trade_date, cutoff)
+                ).fetchone()
+                if row is not None:
+                    run_id = row['run_id']
+            if run_id is None:
+                run_id = f"{trade_date.replace('-', '')}-{uuid.uuid4().hex[:8]}"
+            conn.execute(
+                "INSERT INTO scan_runs (run_id, trade_date, status, total, created_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, ?, ?) "
+                "ON CONFLICT(run_id) DO UPDATE SET status = 'running', total = excluded.total, "
+                "updated_at = excluded.updated_at",
+                (run_id, trade_date, total, now, now)
+            )
+        return run_id
+
+    def record(self, run_id, outcome, signal=None):
+        """
+        写入单只股票的处理结果
+
+        Args:
+            run_id: 扫描ID
+            outcome: 处理结果（code/name/status/attempts/latency/error）
+            signal: 计算得到的信号，没有时为None
+        """
+        now = _now()
+        payload = json.dumps(signal, ensure_ascii=False) if signal is not None else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_results "
+                "(run_id, code, name, status, attempts, latency, error, payload, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, outcome['code'], outcome.get('name'), outcome['status'], outcome.get('attempts'),
+                 outcome.get('latency'), outcome.get('error'), payload, now)
+            )
+            conn.execute("UPDATE scan_runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+    def finish_run(self, run_id):
+        """标记扫描完成"""
+        with self._connect() as conn:
+            conn.execute("UPDATE scan_runs SET status = 'completed', updated_at = ? WHERE run_id = ?",
+                         (_now(), run_id))
+
+    def load_results(self, run_id, final_only=False):
+        """
+        读取已写入的结果
+
+        Args:
+            run_id: 扫描ID
+            final_only: 只读取续跑时可以直接沿用的结果
+
+        Returns:
+            (信号列表, 处理结果列表)
+        """
+        query = "SELECT * FROM scan_results WHERE run_id = ?"
+        params = [run_id]
+        if final_only:
+            query += f" AND status IN ({', '.join('?' * len(FINAL_STATUSES))})"
+            params.extend(FINAL_STATUSES)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        signals = []
+        outcomes = []
+        for row in rows:
+            outcomes.append({
+                'code': row['code'],
+                'name': row['name'],
+                'status': row['status'],
+                'attempts': row['attempts'],
+                'latency': row['latency'],
+                'error': row['error']
+            })
+            if row['payload'] is not None:
+                signals.append(json.loads(row['payload']))
+        return signals, outcomes
+
+    def get_progress(self, run_id=None):
+        """
+        读取扫描进度，不指定run_id时返回最近一次扫描
+
+        Returns:
+            包含 run_id/trade_date/status/total/done/by_status 的字典，没有扫描记录时返回None
+        """
+        with self._connect() as conn:
+            if run_id is None:
+                run = conn.execute("SELECT * FROM scan_runs ORDER BY updated_at DESC LIMIT 1").fetchone()
+            else:
+                run = conn.execute("SELECT * FROM scan_runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM scan_results WHERE run_id = ? GROUP BY status",
+                (run['run_id'],)
+            ).fetchall()
+
+        by_status = {row['status']: row['count'] for row in rows}
+        return {
+            'run_id': run['run_id'],
+            'trade_date': run['trade_date'],
+            'status': run['status'],
+            'total': run['total'],
+            'done': sum(by_status.values()),
+            'by_status': by_status,
+            'updated_at': run['updated_at']
+        }
+
+    def prune(self, keep_days=7):
+        """删除keep_days天以前的扫描记录"""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+        with self._connect() as conn:
+            run_ids = [row['run_id'] for row in
+                       conn.execute("SELECT run_id FROM scan_runs WHERE trade_date < ?", (cutoff,)).fetchall()]
+            for run_id in run_ids:
+                conn.execute("DELETE FROM scan_results WHERE run_id = ?", (run_id,))
+                conn.execute("DELETE FROM scan_runs WHERE run_id = ?", (run_id,))
+        return len(run_ids)
+
+
+_checkpoint = None
+_checkpoint_lock = threading.Lock()
+
+
+def get_checkpoint():
+    """
+    获取默认路径（DEFAULT_CHECKPOINT_PATH）的检查点，同一进程内复用一个实例
+
+    建表和设置WAL只在创建实例时执行一次，Web接口读取进度时不再每次执行；路径改变时重新创建。
+    """
+    global _checkpoint
+    with _checkpoint_lock:
+        if _checkpoint is None or _checkpoint.path != DEFAULT_CHECKPOINT_PATH:
+            _checkpoint = ScanCheckpoint(DEFAULT_CHECKPOINT_PATH)
+        return _checkpoint
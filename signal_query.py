@@ -0,0 +1,286 @@
+"""
+组合条件选股
+
+在信号快照上按布尔表达式筛选股票，例如：
+
+    底背离 AND 底结构 AND NOT 顶钝化 AND close < 50
+    ANY(主升, 3) OR (底成立 AND close >= 10)
+
+- 九个信号名（SIGNAL_NAMES）：当前快照中该信号为真
+- ANY(信号, N)：最近N个交易日（含快照当天，按交易日历计）中任意一天该信号为真，
+  历史信号取自 history/signals_*.csv，缺少文件的交易日视为该天所有信号为假
+- close <,<=,>,>=,=,!= 数值：收盘价条件
+- AND / OR / NOT（不区分大小写）和括号；优先级 NOT > AND > OR
+
+每个快照版本构建一次索引：每个信号一个位图（Python整数，第i位对应快照中第i只股票），
+最近几天的历史信号也各建一组位图。查询只做位运算，全市场几千只股票也在亚毫秒级完成。
+"""
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import signal_store
+from stock_signals import SIGNAL_NAMES, pack_signal_bits
+from trading_calendar import get_calendar
+
+
+# ANY(信号, N) 最多回看的交易日数
+MAX_LOOKBACK_DAYS = 10
+# 支持数值比较的字段
+NUMERIC_FIELDS = ['close']
+
+_COMPARE_OPS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '=': np.equal, '==': np.equal, '!=': np.not_equal,
+}
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|(<=|>=|!=|==|=|<|>)|([(),])|([^\W\d]\w*))')
+
+
+class QueryError(ValueError):
+    """查询表达式语法错误或引用了未知的信号/字段"""
+
+
+def _to_bitmap(mask):
+    """bool数组转为位图整数，第i位对应第i只股票"""
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def _bitmap_positions(bitmap, size):
+    """位图中为1的位置"""
+    if not bitmap:
+        return np.array([], dtype=np.int64)
+    raw = np.frombuffer(bitmap.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder='little')[:size])
+
+
+class SignalIndex:
+    """
+    一个快照版本的查询索引
+
+    Attributes:
+        stocks: 快照中的股票列表（位图的位序）
+        version: 快照版本号
+        dates: 按时间倒序的交易日，dates[0] 为快照当天
+        missing_dates: dates 中没有历史信号文件的交易日（按全部信号为假处理）
+        bitmaps: {信号名: 当前快照的位图}
+        history: [{信号名: 位图}]，与 dates 一一对应
+        columns: {数值字段: numpy数组}
+    """
+
+    def __init__(self, stocks, version=0, history_frames=None):
+        """
+        Args:
+            history_frames: [(YYYY-MM-DD, DataFrame或None)]，快照之前连续的交易日，按日期倒序；
+                None 表示该交易日没有历史信号文件
+        """
+        self.stocks = stocks
+        self.version = version
+        self.size = len(stocks)
+        self.all_bits = (1 << self.size) - 1
+        self.positions = {stock['code']: i for i, stock in enumerate(stocks)}
+        self.columns = {'close': np.array([float(stock['close']) for stock in stocks], dtype=np.float64)}
+
+        frame = pd.DataFrame([stock['signals'] for stock in stocks], columns=SIGNAL_NAMES).fillna(False)
+        packed = pack_signal_bits(frame.astype(bool))
+        self.bitmaps = {name: _to_bitmap(((packed >> position) & 1) == 1)
+                        for position, name in enumerate(SIGNAL_NAMES)}
+
+        latest = max((stock['date'] for stock in stocks), default=None)
+        self.dates = [latest] if latest else []
+        self.history = [self.bitmaps] if latest else []
+        self.missing_dates = []
+        empty = dict.fromkeys(SIGNAL_NAMES, 0)
+        for date, df in history_frames or []:
+            if latest and date >= latest:
+                continue
+            self.dates.append(date)
+            if df is None:
+                self.missing_dates.append(date)
+                self.history.append(empty)
+            else:
+                self.history.append(self._history_bitmaps(df))
+
+    def _history_bitmaps(self, df):
+        """历史信号CSV中的股票映射到当前快照的位序，快照中没有的股票忽略"""
+        index = df['code'].map(self.positions)
+        valid = index.notna().to_numpy()
+        rows = index[valid].astype(int).to_numpy()
+        bitmaps = {}
+        for name in SIGNAL_NAMES:
+            mask = np.zeros(self.size, dtype=bool)
+            if name in df.columns:
+                mask[rows] = df[name].to_numpy(dtype=bool)[valid]
+            bitmaps[name] = _to_bitmap(mask)
+        return bitmaps
+
+    def any_of_days(self, name, days):
+        bitmap = 0
+        for bitmaps in self.history[:days]:
+            bitmap |= bitmaps[name]
+        return bitmap
+
+    def compare(self, field, op, value):
+        return _to_bitmap(_COMPARE_OPS[op](self.columns[field], value))
+
+    def query(self, expression, limit=None):
+        """
+        执行查询
+
+        Returns:
+            符合条件的股票列表（按快照顺序），limit限制返回数量
+        """
+        bitmap = compile_query(expression)(self)
+        positions = _bitmap_positions(bitmap, self.size)
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.stocks[i] for i in positions]
+
+    def count(self, expression):
+        return bin(compile_query(expression)(self)).count('1')
+
+
+def _lookback_dates(latest, days):
+    """快照日期之前的 days-1 个交易日（按交易日历），按日期倒序"""
+    calendar = get_calendar()
+    day = pd.Timestamp(latest).date()
+    dates = []
+    for _ in range(days - 1):
+        day = calendar.previous_trading_day(day)
+        dates.append(day)
+    return dates
+
+
+def _load_history_frames(dates):
+    """读取给定交易日的历史信号CSV：[(YYYY-MM-DD, DataFrame或None)]，没有文件的交易日为None"""
+    frames = []
+    for day in dates:
+        path = os.path.join(signal_store.HISTORY_DIR, f"signals_{day.strftime('%Y%m%d')}.csv")
+        if not os.path.exists(path):
+            df = None
+        else:
+            try:
+                df = pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str})
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame(columns=['code'] + SIGNAL_NAMES)
+        frames.append((day.strftime('%Y-%m-%d'), df))
+    return frames
+
+
+def build_signal_index(stocks, version=0, lookback_days=MAX_LOOKBACK_DAYS):
+    """根据快照和快照之前 lookback_days-1 个交易日的历史信号文件构建查询索引"""
+    latest = max((stock['date'] for stock in stocks), default=None)
+    dates = _lookback_dates(latest, lookback_days) if latest else []
+    return SignalIndex(stocks, version=version, history_frames=_load_history_frames(dates))
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = _TOKEN_PATTERN.match(expression, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"无法解析的位置 {pos}: {expression[pos:pos + 10]!r}")
+        number, op, punct, word = match.groups()
+        if number is not None:
+            tokens.append(('number', float(number)))
+        elif op is not None:
+            tokens.append(('op', op))
+        elif punct is not None:
+            tokens.append((punct, punct))
+        elif word.upper() in ('AND', 'OR', 'NOT', 'ANY'):
+            tokens.append((word.upper(), word))
+        else:
+            tokens.append(('name', word))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析，生成以 SignalIndex 为参数、返回位图的函数"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else '结尾'
+            raise QueryError(f"期望 {kind}，实际为 {found}")
+        value = self.tokens[self.pos][1]
+        self.pos += 1
+        return value
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"多余的内容: {self.tokens[self.pos][1]}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == 'OR':
+            self.take('OR')
+            left, right = node, self.parse_and()
+            node = lambda index, left=left, right=right: left(index) | right(index)
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == 'AND':
+            self.take('AND')
+            left, right = node, self.parse_not()
+            node = lambda index, left=left, right=right: left(index) & right(index)
+        return node
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take('NOT')
+            operand = self.parse_not()
+            return lambda index: index.all_bits ^ operand(index)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind == '(':
+            self.take('(')
+            node = self.parse_or()
+            self.take(')')
+            return node
+        if kind == 'ANY':
+            self.take('ANY')
+            self.take('(')
+            name = self.signal_name(self.take('name'))
+            self.take(',')
+            days = self.take('number')
+            self.take(')')
+            if days != int(days) or not 1 <= days <= MAX_LOOKBACK_DAYS:
+                raise QueryError(f"ANY的天数应为1到{MAX_LOOKBACK_DAYS}之间的整数")
+            return lambda index: index.any_of_days(name, int(days))
+        name = self.take('name')
+        if name in NUMERIC_FIELDS:
+            op = self.take('op')
+            value = self.take('number')
+            return lambda index: index.compare(name, op, value)
+        name = self.signal_name(name)
+        return lambda index: index.bitmaps[name]
+
+    def signal_name(self, name):
+        if name not in SIGNAL_NAMES:
+            raise QueryError(f"未知的信号或字段: {name}")
+        return name
+
+
+@lru_cache(maxsize=256)
+def compile_query(expression):
+    """解析查询表达式（同一表达式只解析一次）"""
+    tokens = _tokenize(expression)
+    if not tokens:
+        raise QueryError("查询表达式为空")
+    return _Parser(tokens).parse()
@@ -0,0 +1,196 @@
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from trading_calendar import get_calendar
+
+
+# 信号快照和历史信号都放在共享的history卷上，Web进程和批处理扫描读写同一份数据
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+SNAPSHOT_PATH = os.path.join(HISTORY_DIR, 'stock_signals.json')
+# 旧版本写在工作目录下的快照，仅用于首次启动时读取
+LEGACY_SNAPSHOT_PATH = 'stock_signals.json'
+# 每个快照版本相对上一版本变化的股票代码，只保留最近的若干个版本
+DELTAS_FILENAME = 'snapshot_deltas.json'
+MAX_DELTAS = 100
+
+
+def _atomic_replace(path, write):
+    """先写临时文件再原子替换，读者不会读到写了一半的文件"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_snapshot_mtime():
+    """共享快照文件的修改时间，不存在时返回None"""
+    try:
+        return os.path.getmtime(SNAPSHOT_PATH)
+    except FileNotFoundError:
+        return None
+
+
+def _deltas_path():
+    return os.path.join(os.path.dirname(SNAPSHOT_PATH), DELTAS_FILENAME)
+
+
+def diff_signals(old_signals, new_signals):
+    """两个快照之间新增、删除或内容有变化的股票代码（按代码排序）"""
+    old = {item['code']: item for item in old_signals}
+    new = {item['code']: item for item in new_signals}
+    return sorted(code for code in old.keys() | new.keys() if old.get(code) != new.get(code))
+
+
+def save_snapshot(signals, update_time):
+    """
+    发布信号快照
+
+    版本号在上一个快照的基础上加1，并在变化日志中记录本次变化的股票代码；
+    先写变化日志再替换快照，读者看到新版本时一定能找到对应的变化记录。
+    调用方需要持有刷新租约，保证版本号单调递增。
+
+    Args:
+        signals: 信号列表
+        update_time: 更新时间（datetime）
+
+    Returns:
+        (快照文件的修改时间, 版本号)
+    """
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+    previous = load_snapshot()
+    previous_signals, previous_version = (previous[0], previous[3]) if previous else ([], 0)
+    version = previous_version + 1
+
+    deltas = [delta for delta in load_deltas() if delta['version'] < version][-(MAX_DELTAS - 1):]
+    deltas.append({'version': version, 'codes': diff_signals(previous_signals, signals)})
+
+    def write_deltas(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(deltas, f)
+
+    def write(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'signals': signals, 'update_time': update_time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'version': version}, f, ensure_ascii=False)
+
+    _atomic_replace(_deltas_path(), write_deltas)
+    _atomic_replace(SNAPSHOT_PATH, write)
+    return get_snapshot_mtime(), version
+
+
+def load_snapshot():
+    """
+    读取信号快照，共享快照不存在时读取旧版本位置的快照
+
+    Returns:
+        (信号列表, 更新时间, 文件修改时间, 版本号)，没有快照时返回None；旧格式快照的版本号为0
+    """
+    path = SNAPSHOT_PATH if os.path.exists(SNAPSHOT_PATH) else LEGACY_SNAPSHOT_PATH
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return (data['signals'], datetime.strptime(data['update_time'], '%Y-%m-%d %H:%M:%S'), mtime,
+            data.get('version', 0))
+
+
+# 变化日志按文件修改时间缓存，避免每次增量请求都重新读取
+_deltas_cache = (None, None, [])
+
+
+def load_deltas():
+    """读取快照变化日志：[{version, codes}]，按版本号递增"""
+    global _deltas_cache
+    path = _deltas_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        return []
+    if _deltas_cache[:2] != (path, mtime):
+        with open(path, 'r', encoding='utf-8') as f:
+            _deltas_cache = (path, mtime, json.load(f))
+    return _deltas_cache[2]
+
+
+def get_changed_codes(since_version, current_version):
+    """
+    since_version 之后到 current_version 为止变化过的股票代码
+
+    Returns:
+        股票代码集合；since_version 无效或变化日志已经不包含所需版本时返回None（需要全量重新加载）
+    """
+    if since_version == current_version:
+        return set()
+    if since_version > current_version or since_version < 0:
+        return None
+    deltas = {delta['version']: delta['codes'] for delta in load_deltas()}
+    codes = set()
+    for version in range(since_version + 1, current_version + 1):
+        if version not in deltas:
+            return None
+        codes.update(deltas[version])
+    return codes
+
+
+def save_history_csv(signals, trade_date):
+    """
+    将有信号的股票保存为当日历史信号CSV
+
+    Args:
+        signals: 信号列表
+        trade_date: 交易日（datetime/date），决定文件名 signals_YYYYMMDD.csv
+
+    Returns:
+        (文件路径, 保存的股票数量)
+    """
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+
+    # 只保存有信号的股票
+    csv_data = []
+    for signal in signals:
+        # 检查是否有任何信号为True
+        if any(signal['signals'].values()):
+            row = {
+                'code': signal['code'],
+                'name': signal['name'],
+                'date': signal['date'],
+                'close': signal['close']
+            }
+            # 添加所有信号
+            for signal_name, signal_value in signal['signals'].items():
+                row[signal_name] = signal_value
+            csv_data.append(row)
+
+    df = pd.DataFrame(csv_data)
+    csv_filename = os.path.join(HISTORY_DIR, f"signals_{trade_date.strftime('%Y%m%d')}.csv")
+    _atomic_replace(csv_filename, lambda path: df.to_csv(path, index=False, encoding='utf-8-sig'))
+    return csv_filename, len(csv_data)
+
+
+def save_finalized_history(signals, trade_date, now=None):
+    """
+    trade_date 的收盘数据已经定型时保存历史信号CSV
+
+    历史信号是准确率统计和组合选股的输入，只保存交易日收盘定型（FINALIZE_TIME）之后的信号：
+    盘中的临时信号、非交易日的日期都不写入。Web刷新、scan.py 和分布式扫描都经由这里保存。
+
+    Args:
+        signals: 信号列表
+        trade_date: 交易日（datetime/date）
+        now: 当前时刻，默认为当前时间
+
+    Returns:
+        (文件路径, 保存的股票数量)；没有保存时返回None
+    """
+    calendar = get_calendar()
+    day = pd.Timestamp(trade_date).date()
+    if not calendar.is_trading_day(day) or day > calendar.latest_finalized_day(now):
+        return None
+    return save_history_csv(signals, day)
@@ -1,11 +1,26 @@
 import pandas as pd
 import numpy as np
-import akshare as ak
-from datetime import datetime
+from datetime import datetime, timedelta
 import warnings
 import random
 import os
-from logger_config import get_unified_logger, log_stock_analysis, log_system_info
+import sys
+from logger_config import (get_unified_logger, log_stock_analysis, log_system_info, get_log_queue,
+                           init_worker_logging)
+from market_data import get_provider
+import bar_cache
+from bar_cache import (has_bars, load_bars, save_bars, patch_last_bar, load_factors, save_factors, merge_factors,
+                       adjust_bars, get_factors_mtime, load_minute_bars, save_minute_bars)
+from http_session import set_pool_size, reset_http_stats, format_http_stats
+from scan_checkpoint import get_checkpoint
+from trading_calendar import get_calendar
+from metrics import counter, histogram, drain_metrics, merge_metrics
+from fetch_limiter import get_fetch_limiter
+from fetch_resilience import call_endpoint, CircuitOpenError
+from stock_universe import get_universe
+from timeframes import (DAILY, MINUTE_60, TIMEFRAME_MIN_BARS, ResampleCache, parse_timeframes, resample)
+import profiling
+from profiling import StageTimer
 warnings.filterwarnings('ignore')
 
 def setup_logger_and_log_stocks(stocks):
@@ -28,91 +43,299 @@ def setup_logger_and_log_stocks(stocks):
     # 返回统一的logger
     return get_unified_logger('stock_analysis')
 
-def retry_on_failure(max_retries=3, delay=1):
-    """重试装饰器"""
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            for i in range(max_retries):
-                try:
-                    # 添加随机延迟，避免请求过快
-                    time.sleep(delay + random.random())
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if i == max_retries - 1:  # 最后一次重试
-                        return None
-                    continue
-            return None
-        return wrapper
-    return decorator
+def get_provisional_date(now=None):
+    """收盘前获取的当日K线尚未定型，返回当日日期；收盘后返回None"""
+    now = now or datetime.now()
+    if now.hour < 15:
+        return now.date()
+    return None
 
-@retry_on_failure(max_retries=3, delay=1)
-def get_stock_data(stock_code):
-    """获取股票数据"""
-    try:
-        start_date = "20240901"
-        end_date = datetime.now().strftime('%Y%m%d')
-        
-        # 使用akshare获取股票数据
-        df = ak.stock_zh_a_hist(symbol=stock_code, period="daily", start_date=start_date, end_date=end_date, adjust="")
+# 单只股票的处理结果
+STATUS_OK = 'ok'                         # 成功计算出信号
+STATUS_EMPTY = 'empty'                   # 数据源没有返回数据（停牌、退市等）
+STATUS_TOO_SHORT = 'too-short'           # K线数量不足以计算指标
+STATUS_FETCH_ERROR = 'fetch-error'       # 请求行情失败（限流、网络错误等）
+STATUS_COMPUTE_ERROR = 'compute-error'   # 计算指标时出错
+STATUS_STALE = 'stale'                   # 数据源熔断，只有本地缓存中可能过期的K线（不计算、不发布信号）
+OUTCOME_STATUSES = [STATUS_OK, STATUS_EMPTY, STATUS_TOO_SHORT, STATUS_FETCH_ERROR, STATUS_COMPUTE_ERROR,
+                    STATUS_STALE]
+# 只有失败的股票值得重试，空数据和数据不足重试也不会变化
+RETRYABLE_STATUSES = {STATUS_FETCH_ERROR, STATUS_COMPUTE_ERROR, STATUS_STALE}
+
+# 计算指标所需的最少K线数量
+MIN_BARS = 120
+
+# 收盘后扫描计算的周期：周线、月线由日线重采样，不额外请求数据源
+SIGNAL_TIMEFRAMES = parse_timeframes(os.environ.get('SIGNAL_TIMEFRAMES', 'daily,weekly,monthly'))
+# 盘中刷新计算的周期；60min 需要逐只请求5分钟线（只请求本地缓存之后的部分），默认不开启
+INTRADAY_TIMEFRAMES = parse_timeframes(os.environ.get('INTRADAY_TIMEFRAMES', 'daily,weekly,monthly'))
+# 60分钟线信号使用最近多少个自然日的5分钟线（约每个交易日4根60分钟线）
+MINUTE_HISTORY_DAYS = 60
+
+# 请求失败后重试前的退避基数（秒），每次重试翻倍，另加同等幅度以内的随机抖动；
+# 首次请求不等待，请求速度由自适应限流器（fetch_limiter）控制
+FETCH_DELAY = 1
+
+# 指标：行情请求、重试、日线缓存命中、信号计算和全市场扫描
+FETCH_LATENCY = histogram('stock_fetch_latency_seconds', '单次行情请求耗时（秒）', labels=('status',))
+FETCH_RETRIES = counter('stock_fetch_retries_total', '行情请求重试次数')
+BAR_CACHE_REQUESTS = counter('stock_bar_cache_requests_total', '读取已定型日线缓存的次数', labels=('result',))
+FETCH_FALLBACKS = counter('stock_fetch_fallbacks_total', '数据源熔断时改用本地日线缓存的次数')
+ADJUST_FACTOR_REQUESTS = counter('stock_adjust_factor_requests_total', '复权因子请求次数', labels=('result',))
+COMPUTE_SECONDS = histogram('stock_compute_seconds', '单只股票信号计算耗时（秒）', labels=('mode',))
+SCAN_DURATION = histogram('stock_scan_duration_seconds', '全市场扫描耗时（秒）',
+                          buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+SCAN_OUTCOMES = counter('stock_scan_outcomes_total', '扫描中各处理结果的股票数量', labels=('status',))
+
+def fetch_stock_data(stock_code, max_retries=3, delay=None, end_date=None, adjust=None):
+    """获取股票数据，并记录获取结果
+    
+    请求出错时按指数退避重试，返回空数据时不重试。
+    请求经由自适应限流器发出，出错和耗时变化会调整请求并发上限；单次请求有超时，
+    慢请求会发出对冲请求。数据源熔断时不再重试，返回本地日线缓存中已定型的K线（可能不是最新），
+    状态为 STATUS_STALE：扫描不用它计算和发布信号，按失败处理（可重试、续跑时重新处理）。
+    本地日线缓存已经包含最近一个定型交易日的K线时直接使用缓存，不发起请求（尝试次数为0）；
+    缓存落后时只请求缓存之后的K线。缓存中是不复权的日线，返回前按复权因子复权。
+    
+    Args:
+        stock_code: 股票代码
+        max_retries: 最大尝试次数
+        delay: 重试前退避的基数（秒），默认为 FETCH_DELAY
+        end_date: 截止日期（YYYYMMDD），默认为当天；早于当天时不写入日线缓存
+        adjust: 复权方式（qfq/hfq/none），默认为 bar_cache.PRICE_ADJUST
+    
+    Returns:
+        (df, outcome)：df 为日线数据，失败或为空时为None；
+        outcome 包含 code/status/attempts/fetch_latency/error
+    """
+    if delay is None:
+        delay = FETCH_DELAY
+    outcome = {'code': stock_code, 'status': STATUS_OK, 'attempts': 0, 'fetch_latency': 0.0, 'error': None}
+    today = datetime.now().strftime('%Y%m%d')
+    end_date = end_date or today
+    # 至少取截止日期前一年的数据，保证历史日期也有足够的K线计算指标
+    start_date = min("20240901", (datetime.strptime(end_date, '%Y%m%d') - timedelta(days=365)).strftime('%Y%m%d'))
+    
+    history = None
+    fetch_start = start_date
+    if end_date >= today:
+        cached = load_finalized_bars(stock_code)
+        if cached is not None:
+            BAR_CACHE_REQUESTS.inc(result='hit')
+            return adjust_prices(stock_code, cached, adjust, outcome=outcome), outcome
+        # 不复权的K线不会因为除权除息改变，只请求缓存中最后一根定型K线之后的部分
+        history = load_cached_history(stock_code, start_date)
+        BAR_CACHE_REQUESTS.inc(result='partial' if history is not None else 'miss')
+        if history is not None:
+            fetch_start = (history.index[-1] + timedelta(days=1)).strftime('%Y%m%d')
+    
+    limiter = get_fetch_limiter()
+    for i in range(max_retries):
+        if i > 0:
+            # 重试前退避，重试间隔翻倍并加随机抖动
+            time.sleep(delay * (2 ** (i - 1)) + random.random() * delay)
+            FETCH_RETRIES.inc()
+        outcome['attempts'] += 1
+        started = limiter.acquire()
+        request_start = time.time()
+        timer = StageTimer()
+        try:
+            # 通过行情数据源获取股票数据（已转换为统一的列名和日期索引）
+            df = call_endpoint('daily_bars', get_provider().get_daily_bars, stock_code, fetch_start, end_date)
+        except CircuitOpenError as e:
+            # 请求没有发出
+            limiter.cancel()
+            outcome['attempts'] -= 1
+            df, outcome = load_fallback_bars(stock_code, end_date, outcome, e)
+            return adjust_prices(stock_code, df, adjust, refresh=False), outcome
+        except Exception as e:
+            limiter.release(started, ok=False)
+            timer.lap('行情请求')
+            outcome['fetch_latency'] += time.time() - request_start
+            FETCH_LATENCY.observe(time.time() - request_start, status='error')
+            outcome['status'] = STATUS_FETCH_ERROR
+            outcome['error'] = f"{type(e).__name__}: {e}"
+            continue
+        limiter.release(started)
+        timer.lap('行情请求')
+        outcome['fetch_latency'] += time.time() - request_start
+        FETCH_LATENCY.observe(time.time() - request_start, status='empty' if df.empty else 'ok')
         
+        if history is not None:
+            # 停牌等情况下没有新的K线，沿用缓存
+            df = pd.concat([history, df[df.index > history.index[-1]]])
         if df.empty:
-            return None
-            
-        # 先处理日期列
-        df['date'] = pd.to_datetime(df['日期'])
-        
-        # 重命名列以保持一致性
-        df = df.rename(columns={
-            '收盘': 'close',
-            '开盘': 'open',
-            '最高': 'high',
-            '最低': 'low',
-            '成交量': 'volume'
-        })
-        
-        # 设置日期索引
-        df.set_index('date', inplace=True)
+            outcome.update(status=STATUS_EMPTY, error=None)
+            return None, outcome
         
-        # 只保留需要的列
-        df = df[['open', 'high', 'low', 'close', 'volume']]
+        # 写入本地日线缓存，供盘中增量刷新使用（历史日期的截断数据不写入）
+        if end_date >= today:
+            try:
+                save_bars(stock_code, df, provisional_date=get_provisional_date())
+            except Exception as e:
+                log_stock_analysis(f"写入日线缓存失败 {stock_code}: {e}", 'warning')
         
+        outcome.update(status=STATUS_OK, error=None)
+        return adjust_prices(stock_code, df, adjust, outcome=outcome), outcome
+    
+    log_stock_analysis(f"获取股票数据失败 {stock_code}（尝试 {outcome['attempts']} 次）: {outcome['error']}", 'error')
+    return None, outcome
+
+def load_fallback_bars(stock_code, end_date, outcome, error):
+    """数据源熔断时改用本地日线缓存中已定型的K线（截止到end_date，不含盘中临时K线），没有缓存时直接失败"""
+    try:
+        df = load_bars(stock_code)
+    except Exception:
+        df = None
+    if df is not None:
+        df = df[~df['provisional'] & (df.index <= pd.to_datetime(end_date))].drop(columns='provisional')
+    if df is None or df.empty:
+        outcome.update(status=STATUS_FETCH_ERROR, error=f"{type(error).__name__}: {error}")
+        return None, outcome
+    FETCH_FALLBACKS.inc()
+    outcome.update(status=STATUS_STALE, error=f"{type(error).__name__}: {error}")
+    return df, outcome
+
+def load_cached_history(stock_code, start_date):
+    """本地缓存中start_date之后已经定型的K线（不含盘中临时K线），没有时返回None"""
+    try:
+        df = load_bars(stock_code)
+    except Exception as e:
+        log_stock_analysis(f"读取日线缓存失败 {stock_code}: {e}", 'warning')
+        return None
+    if df is None:
+        return None
+    df = df[~df['provisional'].astype(bool) & (df.index >= pd.to_datetime(start_date))]
+    return df.drop(columns='provisional') if not df.empty else None
+
+def factors_outdated(stock_code, now=None):
+    """复权因子每个交易日开盘后向数据源核对一次（除权除息日的因子在开盘前公布）"""
+    mtime = get_factors_mtime(stock_code)
+    if mtime is None:
+        return True
+    return datetime.fromtimestamp(mtime).date() < get_calendar().latest_available_day(now)
+
+def get_adjust_factors(stock_code, refresh=True, outcome=None):
+    """
+    获取复权因子（后复权累计因子）
+    
+    优先使用本地缓存，缓存过期时请求数据源（经由自适应限流器），只合并新增的行；请求失败时沿用缓存。
+    
+    Args:
+        refresh: 是否允许请求数据源，False时只读本地缓存
+        outcome: fetch_stock_data 的处理结果，实际发出请求时计入尝试次数
+    
+    Returns:
+        bar_cache.load_factors 格式的DataFrame，没有可用的复权因子时返回None
+    """
+    try:
+        factors = load_factors(stock_code)
+    except Exception as e:
+        log_stock_analysis(f"读取复权因子缓存失败 {stock_code}: {e}", 'warning')
+        factors = None
+    if not refresh or not factors_outdated(stock_code):
+        return factors
+    limiter = get_fetch_limiter()
+    started = limiter.acquire()
+    try:
+        fetched = call_endpoint('adjust_factors', get_provider().get_adjust_factors, stock_code)
+    except CircuitOpenError as e:
+        # 请求没有发出
+        limiter.cancel()
+        log_stock_analysis(f"获取复权因子失败 {stock_code}: {e}", 'warning')
+        return factors
+    except Exception as e:
+        limiter.release(started, ok=False)
+        if outcome is not None:
+            outcome['attempts'] += 1
+        ADJUST_FACTOR_REQUESTS.inc(result='error')
+        log_stock_analysis(f"获取复权因子失败 {stock_code}: {e}", 'warning')
+        return factors
+    limiter.release(started)
+    if outcome is not None:
+        outcome['attempts'] += 1
+    factors, changed = merge_factors(factors, fetched)
+    ADJUST_FACTOR_REQUESTS.inc(result='changed' if changed else 'unchanged')
+    try:
+        # 没有变化时也写回，记录本次核对的时间
+        save_factors(stock_code, factors)
+    except Exception as e:
+        log_stock_analysis(f"写入复权因子缓存失败 {stock_code}: {e}", 'warning')
+    return factors
+
+def adjust_prices(stock_code, df, adjust=None, refresh=True, base_date=None, outcome=None):
+    """按复权方式复权，复权因子不可用时返回不复权的日线"""
+    adjust = adjust or bar_cache.PRICE_ADJUST
+    if df is None or adjust == 'none':
         return df
+    return adjust_bars(df, get_adjust_factors(stock_code, refresh=refresh, outcome=outcome), adjust,
+                       base_date=base_date)
+
+def fetch_minute_bars(stock_code, now=None):
+    """
+    获取最近 MINUTE_HISTORY_DAYS 天的5分钟线（复权后）
+    
+    本地缓存之后的部分才请求数据源（从缓存的最后一根开始，覆盖盘中未走完的那根）；
+    请求失败时沿用缓存，没有缓存时返回None。
+    """
+    now = now or datetime.now()
+    window_start = pd.Timestamp(now.date() - timedelta(days=MINUTE_HISTORY_DAYS))
+    try:
+        cached = load_minute_bars(stock_code)
+    except Exception as e:
+        log_stock_analysis(f"读取5分钟线缓存失败 {stock_code}: {e}", 'warning')
+        cached = None
+    if cached is not None:
+        cached = cached[cached.index >= window_start]
+    start = cached.index[-1] if cached is not None and not cached.empty else window_start
+    
+    try:
+        with get_fetch_limiter().slot():
+            fetched = call_endpoint('minute_bars', get_provider().get_minute_bars, stock_code,
+                                    start.strftime('%Y-%m-%d %H:%M:%S'), now.strftime('%Y-%m-%d %H:%M:%S'))
+        if cached is not None and not cached.empty and not fetched.empty:
+            fetched = pd.concat([cached[cached.index < fetched.index[0]], fetched])
+        elif cached is not None and not cached.empty:
+            fetched = cached
+        if not fetched.empty:
+            save_minute_bars(stock_code, fetched)
+        df = fetched
     except Exception as e:
-        log_stock_analysis(f"获取股票数据失败 {stock_code}: {e}", 'error')
+        log_stock_analysis(f"获取5分钟线失败 {stock_code}: {e}", 'warning')
+        df = cached
+    if df is None or df.empty:
         return None
+    return adjust_prices(stock_code, df, refresh=False)
 
-@retry_on_failure(max_retries=3, delay=1)
-def get_all_stocks():
-    """获取沪深300成分股代码和名称"""
+def load_finalized_bars(stock_code, now=None):
+    """本地缓存已经包含最近一个定型交易日的K线（收盘后、周末、节假日）时返回缓存，否则返回None"""
     try:
-        # 使用akshare获取沪深300成分股
-        df = ak.index_stock_cons(symbol="000300")
-        # 创建标准格式的DataFrame
-        stock_data = pd.DataFrame({
-            'code': df['品种代码'].tolist(),
-            'name': df['品种名称'].tolist()
-        })
-        
-        # 读取补充股票数据
-        try:
-            supplement_data = pd.read_csv('datas/supplement.csv', encoding='utf-8', dtype={'code': str})
-            log_stock_analysis(f"成功读取补充股票数据: {len(supplement_data)} 只股票")
-            
-            # 合并到主数据中
-            stock_data = pd.concat([stock_data, supplement_data], ignore_index=True)
-            
-        except FileNotFoundError:
-            log_stock_analysis("未找到supplement.csv文件，跳过补充数据", 'warning')
-        except Exception as e:
-            log_stock_analysis(f"读取补充股票数据失败: {e}", 'error')
-        
-        # 根据code去重，保留第一个出现的记录
-        stock_data = stock_data.drop_duplicates(subset=['code'], keep='first')
+        df = load_bars(stock_code)
+        if df is None or df.empty or df['provisional'].iloc[-1]:
+            return None
+        if df.index[-1].date() < get_calendar().latest_finalized_day(now):
+            return None
+        return df.drop(columns='provisional')
+    except Exception as e:
+        log_stock_analysis(f"读取日线缓存失败 {stock_code}: {e}", 'warning')
+        return None
+
+def get_stock_data(stock_code):
+    """获取股票数据"""
+    df, _ = fetch_stock_data(stock_code)
+    return df
+
+def get_all_stocks():
+    """
+    获取沪深300成分股和补充股票的代码和名称
 
-        # 重置索引并返回
-        return stock_data.reset_index(drop=True)
+    股票池缓存在本地（见 stock_universe），过期后在后台更新，不阻塞扫描；
+    数据源不可用时沿用缓存，没有缓存时只返回补充股票。
+    """
+    try:
+        return get_universe()
     except Exception as e:
-        log_stock_analysis(f"获取沪深300成分股失败: {e}", 'error')
+        log_stock_analysis(f"获取股票池失败: {e}", 'error')
         return None
 
 def EMA(series, periods):
@@ -141,6 +364,8 @@ def BARSLAST(condition):
 
 def calculate_macd_indicators(df):
     """计算MACD相关指标"""
+    # 开启剖析时记录各阶段耗时
+    timer = StageTimer()
     # 基础参数
     SHORT = 12
     LONG = 26
@@ -168,6 +393,8 @@ def calculate_macd_indicators(df):
     df['M1'] = BARSLAST(df['金叉'])  # 最近一次金叉的位置
     df['N1'] = BARSLAST(df['死叉'])  # 最近一次死叉的位置
     
+    timer.lap('基础MACD')
+    
     # 计算M2和M3（到当前的周期数）
     df['M2'] = 0  # 初始化M2
     df['M3'] = 0  # 初始化M3
@@ -210,6 +437,8 @@ def calculate_macd_indicators(df):
     df['N2'] = df['N2'].fillna(0)
     df['N3'] = df['N3'].fillna(0)
     
+    timer.lap('M2/M3/N2/N3循环')
+    
     # 计算各周期高低点位置
     for i in range(len(df)):
         m1 = int(df['M1'].iloc[i])
@@ -266,6 +495,8 @@ def calculate_macd_indicators(df):
                 df.loc[df.index[i], 'CL3'] = df['CL2'].iloc[ref_idx]
                 df.loc[df.index[i], 'DIFL3'] = df['DIFL2'].iloc[ref_idx]
     
+    timer.lap('CH/CL循环')
+    
     # 计算PDIFH2和MDIFH2
     df['PDIFH2'] = df.apply(lambda x: 
         int(np.log10(abs(x['DIFH2']))) - 1 if x['DIFH2'] > 0 
@@ -318,6 +549,8 @@ def calculate_macd_indicators(df):
         int(x['DIF'] / (10 ** x['PDIFL3'])) if x['PDIFL3'] != 0 
         else int(x['DIF']), axis=1)
     
+    timer.lap('df.apply')
+    
     # 直接顶背离和隔峰顶背离判断
     df['直接顶背离'] = ((df['CH1'] > df['CH2']) & 
                     (df['MDIFT2'] < df['MDIFH2']) & 
@@ -394,6 +627,8 @@ def calculate_macd_indicators(df):
                    (df['DEA'] < 0) & 
                    (df['金叉'].rolling(21).sum() == 2))
     
+    timer.lap('背离与买卖信号')
+    
     # 趋势判断
     # 计算120和250日内MACD最大值
     df['MACD120_MAX'] = df['MACD'].rolling(120).max()
@@ -420,6 +655,7 @@ def calculate_macd_indicators(df):
             df.loc[df.index[i], 'MACD250'] = df.loc[max_pos, 'MACD'] / 2
         else:
             df.loc[df.index[i], 'MACD250'] = df.loc[df.index[i], 'MACD'] / 2
+    timer.lap('MACD120/250循环')
     
     # 顶底成立条件
     df['顶成立'] = (df['顶钝化'] & df['DEATH_CROSS'] & df['顶结构'])
@@ -440,111 +676,712 @@ def calculate_macd_indicators(df):
     
     # 填充所有可能的NaN值
     df = df.fillna(0)
+    timer.lap('主升与收尾')
     
     return df
 
-def analyze_stock_signals(stock_code, stock_name):
-    """分析单个股票的信号"""
-    df = get_stock_data(stock_code)
-    if df is None or len(df) < 120:  # 确保有足够的数据进行分析
+# 对外输出的九个信号，顺序即位图中的位序
+SIGNAL_NAMES = ['顶钝化', '底钝化', '顶结构', '底结构', '顶背离', '底背离', '主升', '顶成立', '底成立']
+
+# 精简模式可输出的非信号列及其紧凑类型
+LEAN_VALUE_COLUMNS = {
+    'close': np.float32,
+    'DIF': np.float32,
+    'DEA': np.float32,
+    'MACD': np.float32,
+    'CH1': np.float32,
+    'CL1': np.float32,
+    'M1': np.int16,
+    'N1': np.int16,
+}
+
+def _cross_array(a, b):
+    """numpy版CROSS：a上穿b，首个周期没有前值，恒为False"""
+    result = np.zeros(len(a), dtype=bool)
+    result[1:] = (a[1:] > b[1:]) & (a[:-1] <= b[:-1])
+    return result
+
+def _barslast_array(condition):
+    """numpy版BARSLAST：首次成立之前记为0"""
+    positions = np.arange(len(condition))
+    last_true = np.maximum.accumulate(np.where(condition, positions, -1))
+    return np.where(last_true >= 0, positions - last_true, 0)
+
+def _window_extreme(values, bars, use_max):
+    """计算 [i-bars-1, i] 区间内的最高/最低值，区间起点不变时沿用上一周期结果"""
+    result = np.empty(len(values))
+    prev_start = -1
+    for i in range(len(values)):
+        start = max(0, i - int(bars[i]) - 1)
+        if start == prev_start:
+            result[i] = max(result[i - 1], values[i]) if use_max else min(result[i - 1], values[i])
+        else:
+            window = values[start:i + 1]
+            result[i] = window.max() if use_max else window.min()
+        prev_start = start
+    return result
+
+def _ref_by_bars(values, bars):
+    """取 bars+1 个周期前的值，不足时为0（对应CH2/CH3等的递推）"""
+    ref_idx = np.arange(len(values)) - bars - 1
+    valid = ref_idx >= 0
+    return np.where(valid, values[np.clip(ref_idx, 0, None)], 0.0)
+
+def _magnitude(values):
+    """数量级：int(log10(|x|)) - 1，x为0时为0"""
+    with np.errstate(divide='ignore'):
+        exponent = np.trunc(np.log10(np.abs(values))) - 1
+    return np.where(values != 0, exponent, 0.0)
+
+def _scaled(values, magnitude):
+    """按数量级缩放后取整：int(x / 10**p)，p为0时为int(x)"""
+    return np.trunc(np.where(magnitude != 0, values / np.power(10.0, magnitude), values))
+
+def _shift_array(values, fill):
+    """数组整体后移一个周期"""
+    result = np.empty_like(values)
+    result[0] = fill
+    result[1:] = values[:-1]
+    return result
+
+def calculate_lean_signals(df, outputs=None):
+    """精简模式计算MACD信号
+
+    与 calculate_macd_indicators 的信号结果一致，但中间量只保存在临时numpy数组中，
+    不向DataFrame追加列，也不计算输出信号用不到的M2/M3/N2/N3等中间列。
+
+    Args:
+        df: 包含close列、以日期为索引的行情数据
+        outputs: 需要输出的列，默认为九个信号加收盘价；
+                 可选值为 SIGNAL_NAMES 与 LEAN_VALUE_COLUMNS 中的列名
+
+    Returns:
+        只包含所需列的DataFrame，价格/指标为float32，信号为bool，计数为int16
+    """
+    if outputs is None:
+        outputs = SIGNAL_NAMES + ['close']
+    unknown = [col for col in outputs if col not in SIGNAL_NAMES and col not in LEAN_VALUE_COLUMNS]
+    if unknown:
+        raise ValueError(f"不支持的输出列: {unknown}")
+
+    timer = StageTimer()
+    close = df['close'].to_numpy(dtype=np.float64)
+    n = len(close)
+    close_series = pd.Series(close)
+
+    # 基础MACD
+    dif = ((EMA(close_series, 12) - EMA(close_series, 26)) * 100).to_numpy()
+    dea = EMA(pd.Series(dif), 9).to_numpy()
+    macd = 2 * (dif - dea)
+
+    golden_cross = _cross_array(dif, dea)
+    death_cross = _cross_array(dea, dif)
+    m1 = _barslast_array(golden_cross)
+    n1 = _barslast_array(death_cross)
+    timer.lap('精简-基础MACD')
+
+    # 各周期高低点
+    ch1 = _window_extreme(close, m1, use_max=True)
+    difh1 = _window_extreme(dif, m1, use_max=True)
+    ch2 = _ref_by_bars(ch1, m1)
+    difh2 = _ref_by_bars(difh1, m1)
+    ch3 = _ref_by_bars(ch2, m1)
+    difh3 = _ref_by_bars(difh2, m1)
+
+    cl1 = _window_extreme(close, n1, use_max=False)
+    difl1 = _window_extreme(dif, n1, use_max=False)
+    cl2 = _ref_by_bars(cl1, n1)
+    difl2 = _ref_by_bars(difl1, n1)
+    cl3 = _ref_by_bars(cl2, n1)
+    difl3 = _ref_by_bars(difl2, n1)
+    timer.lap('精简-高低点')
+
+    # 数量级归一化后的DIF比较量
+    pdifh2, pdifh3 = _magnitude(difh2), _magnitude(difh3)
+    pdifl2, pdifl3 = _magnitude(difl2), _magnitude(difl3)
+    mdifh2, mdifh3 = _scaled(difh2, pdifh2), _scaled(difh3, pdifh3)
+    mdifl2, mdifl3 = _scaled(difl2, pdifl2), _scaled(difl3, pdifl3)
+    mdift2, mdift3 = _scaled(dif, pdifh2), _scaled(dif, pdifh3)
+    mdifb2, mdifb3 = _scaled(dif, pdifl2), _scaled(dif, pdifl3)
+
+    prev_macd = _shift_array(macd, np.nan)
+    macd_up = (macd > 0) & (prev_macd > 0)
+    macd_down = (macd < 0) & (prev_macd < 0)
+    prev_mdift2, prev_mdift3 = _shift_array(mdift2, np.nan), _shift_array(mdift3, np.nan)
+    prev_mdifb2, prev_mdifb3 = _shift_array(mdifb2, np.nan), _shift_array(mdifb3, np.nan)
+
+    direct_top = (ch1 > ch2) & (mdift2 < mdifh2) & macd_up & (mdift2 >= prev_mdift2)
+    gap_top = (ch1 > ch3) & (ch3 > ch2) & (mdift3 < mdifh3) & macd_up & (mdift3 >= prev_mdift3)
+    direct_bottom = (cl1 < cl2) & (mdifb2 > mdifl2) & macd_down & (mdifb2 <= prev_mdifb2)
+    gap_bottom = (cl1 < cl3) & (cl3 < cl2) & (mdifb3 > mdifl3) & macd_down & (mdifb3 <= prev_mdifb3)
+
+    top = direct_top | gap_top
+    bottom = direct_bottom | gap_bottom
+    top_confirm = ((mdift2 < prev_mdift2) & _shift_array(direct_top, False)) | \
+                  ((mdift3 < prev_mdift3) & _shift_array(gap_top, False))
+    bottom_confirm = ((mdifb2 > prev_mdifb2) & _shift_array(direct_bottom, False)) | \
+                     ((mdifb3 > prev_mdifb3) & _shift_array(gap_bottom, False))
+
+    # 主升：MACD120变化且首次进入强势区
+    positions = np.arange(n)
+    macd120 = np.where(positions >= 120, pd.Series(macd).rolling(121).max().to_numpy(), macd) / 2
+    macd250 = np.where(positions >= 250, pd.Series(macd).rolling(251).max().to_numpy(), macd) / 2
+    xg = np.ones(n, dtype=bool)
+    xg[1:] = macd120[1:] != macd120[:-1]
+    strong = macd >= macd250
+    main_rise = xg & ~_shift_array(xg, True) & strong & ~_shift_array(strong, True)
+
+    top_dull = top | top_confirm
+    signal_arrays = {
+        '顶钝化': top_dull,
+        '底钝化': bottom,
+        '顶结构': top_confirm,
+        '底结构': bottom_confirm,
+        '顶背离': top | top_confirm,
+        '底背离': bottom | bottom_confirm,
+        '主升': main_rise,
+        '顶成立': top_dull & death_cross & top_confirm,
+        '底成立': bottom & golden_cross & bottom_confirm,
+    }
+    value_arrays = {
+        'close': close, 'DIF': dif, 'DEA': dea, 'MACD': macd,
+        'CH1': ch1, 'CL1': cl1, 'M1': m1, 'N1': n1,
+    }
+
+    columns = {}
+    for col in outputs:
+        if col in signal_arrays:
+            columns[col] = signal_arrays[col]
+        else:
+            dtype = LEAN_VALUE_COLUMNS[col]
+            values = value_arrays[col]
+            if dtype is np.int16:
+                values = np.minimum(values, np.iinfo(np.int16).max)
+            columns[col] = values.astype(dtype)
+    frame = pd.DataFrame(columns, index=df.index)
+    timer.lap('精简-背离与信号')
+    return frame
+
+def pack_signal_bits(frame):
+    """将九个信号压缩为每个周期一个uint16位图，第k位对应 SIGNAL_NAMES[k]"""
+    bits = np.zeros(len(frame), dtype=np.uint16)
+    for position, name in enumerate(SIGNAL_NAMES):
+        if name in frame:
+            bits |= frame[name].to_numpy(dtype=bool).astype(np.uint16) << position
+    return bits
+
+def unpack_signal_bits(bits):
+    """将uint16位图还原为信号字典"""
+    return {name: bool((int(bits) >> position) & 1) for position, name in enumerate(SIGNAL_NAMES)}
+
+def get_peak_memory_mb():
+    """当前进程的峰值内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
         return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS下单位为字节，Linux下为KB
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+def analyze_stock_signals(stock_code, stock_name, lean=False, timeframes=None):
+    """分析单个股票的信号，timeframes 中日线以外的周期结果在 timeframes 字段中"""
+    df = get_stock_data(stock_code)
+    minute_bars = fetch_minute_bars(stock_code) if timeframes and MINUTE_60 in timeframes else None
+    return build_stock_signals(stock_code, stock_name, df, lean=lean, timeframes=timeframes, minute_bars=minute_bars)
+
+def compute_timeframe_signals(stock_code, df, timeframes=None, minute_bars=None, resampler=None):
+    """
+    计算日线以外各周期最新一根K线的信号（精简模式）
     
-    try:
+    周线/月线由日线重采样，60分钟线由5分钟线重采样；K线不足或计算出错的周期跳过，不影响日线信号。
+    
+    Args:
+        timeframes: 周期列表，默认为 SIGNAL_TIMEFRAMES
+        minute_bars: 复权后的5分钟线，计算60分钟线信号时需要
+        resampler: ResampleCache，传入时增量重采样（盘中刷新）
+    
+    Returns:
+        {周期: {'date', 'close', 'partial', 'signals'}}，partial 表示该周期尚未走完
+    """
+    timeframes = SIGNAL_TIMEFRAMES if timeframes is None else timeframes
+    results = {}
+    for timeframe in timeframes:
+        source = minute_bars if timeframe == MINUTE_60 else df
+        if timeframe == DAILY or source is None or source.empty:
+            continue
+        try:
+            bars = resampler.resample(stock_code, source, timeframe) if resampler else resample(source, timeframe)
+            if len(bars) < TIMEFRAME_MIN_BARS[timeframe]:
+                continue
+            latest = calculate_lean_signals(bars, outputs=SIGNAL_NAMES).iloc[-1]
+        except Exception as e:
+            log_stock_analysis(f"计算{timeframe}信号失败 {stock_code}: {e}", 'warning')
+            continue
+        results[timeframe] = {
+            'date': bars.index[-1].strftime('%Y-%m-%d %H:%M' if timeframe == MINUTE_60 else '%Y-%m-%d'),
+            'close': float(bars['close'].iloc[-1]),
+            'partial': bool(bars['partial'].iloc[-1]),
+            'signals': {name: bool(latest[name]) for name in SIGNAL_NAMES}
+        }
+    return results
+
+def compute_stock_signals(stock_code, stock_name, df, lean=False, timeframes=None, minute_bars=None, resampler=None):
+    """根据日线数据计算单个股票最新一天的信号（以及其他周期的信号，见 compute_timeframe_signals），计算出错时抛出异常"""
+    start = time.perf_counter()
+    if lean:
+        frame = calculate_lean_signals(df, outputs=SIGNAL_NAMES)
+        latest = frame.iloc[-1]
+        close = df['close'].iloc[-1]
+    else:
         df = calculate_macd_indicators(df)
         latest = df.iloc[-1]  # 获取最新一天的数据
-        
-        signals = {
-            'code': stock_code,
-            'name': stock_name,
-            'date': df.index[-1].strftime('%Y-%m-%d'),
-            'close': latest['close'],
-            'signals': {
-                '顶钝化': bool(latest['顶钝化']),
-                '底钝化': bool(latest['底钝化']),
-                '顶结构': bool(latest['顶结构']),
-                '底结构': bool(latest['底结构']),
-                '顶背离': bool(latest['顶背离']),
-                '底背离': bool(latest['底背离']),
-                '主升': bool(latest['主升']),
-                '顶成立': bool(latest['顶成立']),
-                '底成立': bool(latest['底成立'])
-            }
-        }
-        return signals
+        close = latest['close']
+    result = {
+        'code': stock_code,
+        'name': stock_name,
+        'date': df.index[-1].strftime('%Y-%m-%d'),
+        'close': close,
+        'signals': {name: bool(latest[name]) for name in SIGNAL_NAMES}
+    }
+    timeframes = compute_timeframe_signals(stock_code, df, timeframes, minute_bars, resampler)
+    if timeframes:
+        result['timeframes'] = timeframes
+    COMPUTE_SECONDS.observe(time.perf_counter() - start, mode='lean' if lean else 'full')
+    return result
+
+def build_stock_signals(stock_code, stock_name, df, lean=False, timeframes=None, minute_bars=None, resampler=None,
+                        outcome=None):
+    """根据日线数据计算单个股票最新一天的信号，数据不足或计算出错时返回None，原因记录在 outcome 中"""
+    if df is None or len(df) < MIN_BARS:  # 确保有足够的数据进行分析
+        if outcome is not None:
+            outcome['status'] = STATUS_EMPTY if df is None else STATUS_TOO_SHORT
+        return None
+
+    start = time.time()
+    try:
+        return compute_stock_signals(stock_code, stock_name, df, lean=lean, timeframes=timeframes,
+                                     minute_bars=minute_bars, resampler=resampler)
     except Exception as e:
-        # 静默跳过错误，不显示错误信息
+        log_stock_analysis(f"计算信号失败 {stock_code}: {type(e).__name__}: {e}", 'warning')
+        if outcome is not None:
+            outcome.update(status=STATUS_COMPUTE_ERROR, error=f"{type(e).__name__}: {e}")
         return None
+    finally:
+        if outcome is not None:
+            outcome['compute_latency'] = time.time() - start
 
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import queue
 import time
 
+# 行情请求并发上限（实际并发由自适应限流器在1到该值之间调整），同时也是HTTP连接池大小
+FETCH_WORKERS = 16
+# 信号计算进程数
+COMPUTE_WORKERS = 4
+
+def fetch_scan_data(stock_code, end_date=None):
+    """
+    获取扫描一只股票所需的行情（在主进程的请求线程中调用）
+    
+    SIGNAL_TIMEFRAMES 包含60分钟线时同时获取5分钟线；5分钟线只有最近的数据，指定了更早的截止日期时不获取。
+    
+    Returns:
+        (日线, 5分钟线, outcome)，5分钟线不需要或获取失败时为None
+    """
+    df, outcome = fetch_stock_data(stock_code, end_date=end_date)
+    minute_bars = None
+    if outcome['status'] == STATUS_OK and MINUTE_60 in SIGNAL_TIMEFRAMES and \
+            (end_date is None or end_date >= datetime.now().strftime('%Y%m%d')):
+        minute_bars = fetch_minute_bars(stock_code)
+    return df, minute_bars, outcome
+
 def process_single_stock(args):
-    """处理单个股票的信号（用于多进程）"""
-    code, name = args
+    """计算单个股票的信号（用于多进程，日线和5分钟线由主进程获取后传入）
+
+    Returns:
+        计算结果字典：result/status/error/compute_latency，工作进程的pid和当前峰值内存，
+        以及本次计算记录的指标增量和开启剖析时的剖析数据（由主进程合并）
+    """
+    code, name, df, lean, minute_bars = args
+    start = time.time()
+    profiler = profiling.start_task()
     try:
-        return analyze_stock_signals(code, name)
+        result = compute_stock_signals(code, name, df, lean=lean, minute_bars=minute_bars)
+        status, error = STATUS_OK, None
     except Exception as e:
-        # 静默跳过错误，不显示错误信息
-        return None
+        result, status, error = None, STATUS_COMPUTE_ERROR, f"{type(e).__name__}: {e}"
+    profile = profiling.finish_task(profiler)
+    return {
+        'result': result,
+        'status': status,
+        'error': error,
+        'compute_latency': time.time() - start,
+        'pid': os.getpid(),
+        'peak_memory_mb': get_peak_memory_mb(),
+        'metrics': drain_metrics(),
+        'profile': profile
+    }
 
-def get_all_stock_signals():
-    """获取所有股票的信号"""
-    stocks = get_all_stocks()
-    # 使用包装好的日志函数
-    logger = setup_logger_and_log_stocks(stocks)
-    if stocks is None:
-        return []
+def log_worker_memory(worker_peaks):
+    """记录各工作进程的峰值内存"""
+    for pid, peak in sorted(worker_peaks.items()):
+        if peak is not None:
+            log_stock_analysis(f"工作进程 {pid} 峰值内存: {peak:.1f} MB")
+
+def log_progress(processed, total, start_time):
+    """每处理100个股票记录一次进度"""
+    if processed % 100 == 0 or processed == total:
+        progress = (processed / total) * 100
+        elapsed_time = time.time() - start_time
+        estimated_total_time = (elapsed_time / processed) * total if processed > 0 else 0
+        remaining_time = max(0, estimated_total_time - elapsed_time)
+        
+        log_stock_analysis(f"处理进度: {processed}/{total} ({progress:.1f}%) - "
+              f"已用时: {int(elapsed_time)}秒 - "
+              f"预计剩余: {int(remaining_time)}秒")
+
+def summarize_outcomes(outcomes):
+    """
+    汇总各股票的处理结果
     
-    all_signals = []
-    total = len(stocks)
+    Returns:
+        包含总数、各状态数量和失败明细的字典
+    """
+    by_status = {status: 0 for status in OUTCOME_STATUSES}
+    for outcome in outcomes:
+        by_status[outcome['status']] = by_status.get(outcome['status'], 0) + 1
+    failed = [
+        {key: outcome[key] for key in ('code', 'name', 'status', 'attempts', 'error')}
+        for outcome in outcomes if outcome['status'] in RETRYABLE_STATUSES
+    ]
+    return {'total': len(outcomes), 'by_status': by_status, 'failed': failed}
+
+def log_outcome_summary(outcomes, max_failed=20):
+    """记录处理结果统计以及失败的股票"""
+    summary = summarize_outcomes(outcomes)
+    counts = ', '.join(f"{status}: {count}" for status, count in summary['by_status'].items())
+    log_stock_analysis(f"处理结果统计: {counts}")
+    for item in summary['failed'][:max_failed]:
+        log_stock_analysis(f"处理失败 {item['code']} {item['name']} [{item['status']}] "
+                           f"尝试 {item['attempts']} 次: {item['error']}", 'warning')
+    if len(summary['failed']) > max_failed:
+        log_stock_analysis(f"另有 {len(summary['failed']) - max_failed} 只股票处理失败", 'warning')
+
+def run_stock_scan(stock_list, lean=True, max_workers=COMPUTE_WORKERS, fetch_workers=FETCH_WORKERS,
+                   checkpoint=None, run_id=None, end_date=None):
+    """扫描给定股票的信号
+
+    行情请求在主进程的线程池中发出，共用一个keep-alive连接池（大小等于请求并发上限），
+    实际并发由自适应限流器根据请求耗时和错误调整；信号计算在进程池中进行。
+    所有请求一次提交，每只股票的行情到达后立即提交计算，不按批次等待。
+
+    Args:
+        stock_list: (code, name) 列表
+        lean: 是否使用精简模式计算信号（不保留中间列，内存占用更小）
+        max_workers: 信号计算进程数
+        fetch_workers: 行情请求并发上限
+        checkpoint: 扫描检查点，每只股票处理完成后立即写入
+        run_id: 检查点中的扫描ID
+        end_date: 行情截止日期（YYYYMMDD），默认为当天
+
+    Returns:
+        (信号列表, 处理结果列表)，处理结果与 stock_list 一一对应，
+        包含 code/name/status/attempts/fetch_latency/compute_latency/latency/error
+    """
+    results = [None] * len(stock_list)
+    outcomes = [None] * len(stock_list)
+    worker_peaks = {}
+    total = len(stock_list)
     processed = 0
     start_time = time.time()
     
-    # 使用进程池处理股票数据
-    with ProcessPoolExecutor(max_workers=4) as executor:
-        # 创建任务列表
-        stock_list = list(zip(stocks['code'], stocks['name']))
-        
-        # 分批提交任务，避免同时发送太多请求
-        batch_size = 50
-        batch_count = 0  # 批次计数器
-        total_batches = (len(stock_list) + batch_size - 1) // batch_size  # 总批次数
+    reset_http_stats()
+    limiter = get_fetch_limiter()
+    limiter.set_bounds(max_limit=fetch_workers)
+    
+    # 线程池负责网络请求（经由数据源的keep-alive会话，连接池大小等于请求并发上限），进程池负责信号计算
+    set_pool_size(fetch_workers)
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher, \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging,
+                                initargs=(get_log_queue(),)) as executor:
+        # 所有行情请求一次提交（同时在途的请求数由限流器控制），
+        # 请求和计算完成时把 (类型, 序号, future) 放入队列，主线程按完成顺序处理
+        completed = queue.Queue()
+        for i, (code, name) in enumerate(stock_list):
+            fetch = fetcher.submit(fetch_scan_data, code, end_date=end_date)
+            fetch.add_done_callback(lambda future, i=i: completed.put(('fetch', i, future)))
+        log_stock_analysis(f"已提交 {total} 个行情请求")
         
-        for i in range(0, len(stock_list), batch_size):
-            batch_count += 1
-            batch = stock_list[i:i+batch_size]
-            futures = [executor.submit(process_single_stock, (code, name)) for code, name in batch]
-            
-            # 记录批次信息到日志
-            log_stock_analysis(f"正在处理第 {batch_count}/{total_batches} 批，此批次包含 {len(futures)} 个任务")
-            
-            # 处理结果
-            for future in futures:
+        while processed < total:
+            kind, i, future = completed.get()
+            code, name = stock_list[i]
+            if kind == 'fetch':
+                # 行情获取完成后立即提交计算
+                df, minute_bars, outcome = future.result()
+                outcome.update(name=name, compute_latency=0.0, latency=outcome['fetch_latency'])
+                outcomes[i] = outcome
+                if outcome['status'] == STATUS_OK and df is not None and len(df) < MIN_BARS:
+                    outcome['status'] = STATUS_TOO_SHORT
+                if outcome['status'] == STATUS_OK:
+                    compute = executor.submit(process_single_stock, (code, name, df, lean, minute_bars))
+                    compute.add_done_callback(lambda future, i=i: completed.put(('compute', i, future)))
+                    continue
+                computed = {'result': None}
+            else:
+                outcome = outcomes[i]
                 try:
-                    result = future.result()
-                    if result is not None:
-                        all_signals.append(result)
-                    processed += 1
-                    
-                    # 每处理100个股票才显示一次进度
-                    if processed % 100 == 0 or processed == total:
-                        progress = (processed / total) * 100
-                        elapsed_time = time.time() - start_time
-                        estimated_total_time = (elapsed_time / processed) * total if processed > 0 else 0
-                        remaining_time = max(0, estimated_total_time - elapsed_time)
-                        
-                        log_stock_analysis(f"处理进度: {processed}/{total} ({progress:.1f}%) - "
-                              f"已用时: {int(elapsed_time)}秒 - "
-                              f"预计剩余: {int(remaining_time)}秒")
-                    
-                except Exception:
-                    pass
-            
-            # 批次间添加延迟，避免请求过快
-            time.sleep(2)
+                    computed = future.result()
+                    worker_peaks[computed['pid']] = computed['peak_memory_mb']
+                    merge_metrics(computed.get('metrics'))
+                    profiling.collect(computed.get('profile'))
+                    outcome.update(status=computed['status'], error=computed['error'],
+                                   compute_latency=computed['compute_latency'])
+                    results[i] = computed['result']
+                except Exception as e:
+                    # 工作进程异常退出等情况
+                    computed = {'result': None}
+                    outcome.update(status=STATUS_COMPUTE_ERROR, error=f"{type(e).__name__}: {e}")
+                outcome['latency'] = outcome['fetch_latency'] + outcome['compute_latency']
+            if checkpoint is not None:
+                checkpoint.record(run_id, outcome, computed['result'])
+            processed += 1
+            log_progress(processed, total, start_time)
     
+    all_signals = [result for result in results if result is not None]
     total_time = int(time.time() - start_time)
     log_stock_analysis(f"处理完成! 总用时: {total_time}秒")
     log_stock_analysis(f"成功处理: {len(all_signals)}/{total} 只股票")
+    log_outcome_summary(outcomes)
+    log_stock_analysis(format_http_stats())
+    log_stock_analysis(f"行情请求并发上限: {limiter.current_limit}/{fetch_workers}")
+    log_worker_memory(worker_peaks)
+    
+    return all_signals, outcomes
+
+def get_all_stock_signals(lean=True, max_workers=COMPUTE_WORKERS, fetch_workers=FETCH_WORKERS,
+                          return_outcomes=False, trade_date=None, resume=True, checkpoint=None,
+                          use_checkpoint=True, stock_list=None, return_run_id=False):
+    """获取所有股票的信号
+
+    每只股票的结果会立即写入扫描检查点；同一交易日中断的扫描再次运行时，
+    已完成的股票直接从检查点读取，只处理剩余股票。
+
+    Args:
+        lean: 是否使用精简模式计算信号（不保留中间列，内存占用更小）
+        max_workers: 信号计算进程数
+        fetch_workers: 行情请求并发上限
+        return_outcomes: 是否同时返回每只股票的处理结果
+        trade_date: 交易日（YYYY-MM-DD），默认为当天；指定时行情截止到该日
+        resume: 是否续跑该交易日未完成的扫描
+        checkpoint: 扫描检查点，默认使用history目录下的检查点数据库
+        use_checkpoint: 是否写入检查点
+        stock_list: 指定股票池 (code, name) 列表，默认使用 get_all_stocks
+        return_run_id: 是否同时返回检查点中的扫描ID（不写检查点时为None），重试失败股票时传给 retry_failed_stocks
+
+    Returns:
+        信号列表；return_outcomes为True时返回 (信号列表, 处理结果列表)；
+        return_run_id为True时在末尾追加扫描ID
+    """
+    if stock_list is None:
+        stocks = get_all_stocks()
+        # 使用包装好的日志函数
+        logger = setup_logger_and_log_stocks(stocks)
+        if stocks is None:
+            return _scan_result([], [], None, return_outcomes, return_run_id)
+        
+        # 创建任务列表
+        stock_list = list(zip(stocks['code'], stocks['name']))
+    
+    end_date = trade_date.replace('-', '') if trade_date else None
+    run_id = None
+    done_signals, done_outcomes = [], []
+    if use_checkpoint:
+        trade_date = trade_date or datetime.now().strftime('%Y-%m-%d')
+        checkpoint = checkpoint or get_checkpoint()
+        run_id = checkpoint.start_run(trade_date, len(stock_list), resume=resume)
+        done_signals, done_outcomes = checkpoint.load_results(run_id, final_only=True)
+        if done_outcomes:
+            log_stock_analysis(f"从检查点续跑扫描 {run_id}: 已完成 {len(done_outcomes)} 只，"
+                               f"剩余 {len(stock_list) - len(done_outcomes)} 只")
+        else:
+            log_stock_analysis(f"开始扫描 {run_id}")
+    
+    done_codes = {outcome['code'] for outcome in done_outcomes}
+    remaining = [(code, name) for code, name in stock_list if code not in done_codes]
+    scan_start = time.time()
+    all_signals, outcomes = run_stock_scan(remaining, lean=lean, max_workers=max_workers,
+                                           fetch_workers=fetch_workers, checkpoint=checkpoint, run_id=run_id,
+                                           end_date=end_date)
+    SCAN_DURATION.observe(time.time() - scan_start)
+    for outcome in outcomes:
+        SCAN_OUTCOMES.inc(status=outcome['status'])
+    if use_checkpoint:
+        checkpoint.finish_run(run_id)
+    
+    # 按股票池顺序合并检查点中的结果和本次结果
+    order = {code: i for i, (code, _) in enumerate(stock_list)}
+    all_signals = sorted(done_signals + all_signals, key=lambda item: order.get(item['code'], len(order)))
+    outcomes = sorted(done_outcomes + outcomes, key=lambda item: order.get(item['code'], len(order)))
+    return _scan_result(all_signals, outcomes, run_id, return_outcomes, return_run_id)
+
+def _scan_result(signals, outcomes, run_id, return_outcomes, return_run_id):
+    """按 return_outcomes/return_run_id 组织 get_all_stock_signals 的返回值"""
+    result = (signals, outcomes) if return_outcomes else (signals,)
+    if return_run_id:
+        result += (run_id,)
+    return result if len(result) > 1 else signals
+
+def retry_failed_stocks(outcomes, lean=True, max_rounds=2, backoff=5, max_workers=COMPUTE_WORKERS,
+                        fetch_workers=FETCH_WORKERS, checkpoint=None, run_id=None, end_date=None):
+    """只重试上一次扫描中失败的股票
+    
+    每一轮只处理仍然失败的股票，轮次之间按指数退避等待，给数据源的限流留出恢复时间。
+    
+    Args:
+        outcomes: 上一次扫描的处理结果列表
+        lean: 是否使用精简模式计算信号
+        max_rounds: 最多重试轮数
+        backoff: 第一轮重试前的等待时间（秒），之后每轮翻倍
+        checkpoint: 扫描检查点，重试结果写回原扫描
+        run_id: 检查点中的扫描ID
+        end_date: 行情截止日期（YYYYMMDD），默认为当天
+    
+    Returns:
+        (重试得到的信号列表, 更新后的完整处理结果列表)；处理结果中的尝试次数会累加
+    """
+    outcomes_by_code = {outcome['code']: outcome for outcome in outcomes}
+    retried_signals = []
+    
+    for round_index in range(max_rounds):
+        failed = [(o['code'], o['name']) for o in outcomes_by_code.values() if o['status'] in RETRYABLE_STATUSES]
+        if not failed:
+            break
+        wait = backoff * (2 ** round_index)
+        log_stock_analysis(f"第 {round_index + 1}/{max_rounds} 轮重试: {len(failed)} 只失败股票，等待 {wait} 秒后开始")
+        time.sleep(wait)
+        
+        signals, round_outcomes = run_stock_scan(failed, lean=lean, max_workers=max_workers,
+                                                 fetch_workers=fetch_workers, checkpoint=checkpoint, run_id=run_id,
+                                                 end_date=end_date)
+        retried_signals = merge_signals(retried_signals, signals)
+        for outcome in round_outcomes:
+            outcome['attempts'] += outcomes_by_code[outcome['code']]['attempts']
+            outcomes_by_code[outcome['code']] = outcome
+    
+    merged = [outcomes_by_code[outcome['code']] for outcome in outcomes]
+    return retried_signals, merged
+
+def merge_signals(snapshot, updates):
+    """将部分股票的新信号合并到已有快照中，按code替换或追加，其余股票保持不变"""
+    updated = {item['code']: item for item in updates}
+    merged = [updated.pop(item['code'], item) for item in snapshot]
+    merged.extend(updated.values())
+    return merged
+
+# 盘中刷新的重采样缓存：每次刷新只重新聚合本周、本月、本小时的K线
+_intraday_resampler = ResampleCache()
+
+def get_intraday_signals(min_coverage=0.9, now=None, timeframes=None, outcomes=None):
+    """
+    盘中增量刷新
+    
+    只发起一次全市场实时行情请求，用它修补本地日线缓存中每只股票的当日临时K线，
+    然后在当前进程内一次性重新计算全部股票的信号，不再逐只请求完整日线。
+    周线、月线由修补后的日线增量重采样；开启60分钟线时逐只增量请求5分钟线。
+    
+    Args:
+        min_coverage: 本地日线缓存覆盖股票池的最低比例
+        now: 刷新时刻，默认为当前时间
+        timeframes: 计算的周期，默认为 INTRADAY_TIMEFRAMES
+        outcomes: 传入列表时追加参与刷新的每只股票的处理结果（格式同 run_stock_scan），
+            计算出错的股票状态为 STATUS_COMPUTE_ERROR
+    
+    只使用最后一根定型K线恰好是上一个交易日的缓存：缓存落后时追加当日K线会在指标输入中留下缺口，
+    这些股票不参与盘中刷新（计入覆盖率不足）；之前交易日遗留的临时K线不当作真实的日线。
+    
+    Returns:
+        信号列表；非交易日、缓存覆盖率不足或快照获取失败时返回None，由调用方退回完整扫描
+    """
+    now = now or datetime.now()
+    calendar = get_calendar()
+    if not calendar.is_trading_day(now):
+        log_stock_analysis("非交易日，跳过盘中增量刷新")
+        return None
+    
+    stocks = get_all_stocks()
+    if stocks is None or stocks.empty:
+        return None
+    
+    previous_day = calendar.previous_trading_day(now)
+    cached = []
+    lagging = 0
+    for code, name in zip(stocks['code'], stocks['name']):
+        if not has_bars(code):
+            continue
+        try:
+            df = load_bars(code)
+        except Exception as e:
+            log_stock_analysis(f"读取日线缓存失败 {code}: {e}", 'warning')
+            continue
+        finalized = df[~df['provisional'].astype(bool)]
+        if finalized.empty or finalized.index[-1].date() != previous_day:
+            lagging += 1
+            continue
+        cached.append((code, name, finalized))
+    coverage = len(cached) / len(stocks)
+    if coverage < min_coverage:
+        log_stock_analysis(f"日线缓存覆盖率 {coverage:.1%} 不足（{lagging} 只股票的缓存没有更新到上一交易日），"
+                           f"需要完整扫描", 'warning')
+        return None
+    
+    start_time = time.time()
+    timeframes = INTRADAY_TIMEFRAMES if timeframes is None else timeframes
+    codes = [code for code, _, _ in cached]
+    minute_bars = {}
+    set_pool_size(FETCH_WORKERS)
+    try:
+        snapshot = get_provider().get_spot_snapshot()
+    except Exception as e:
+        log_stock_analysis(f"获取实时行情快照失败: {e}", 'error')
+        return None
+    snapshot = snapshot[~snapshot.index.duplicated(keep='first')]
+    log_stock_analysis(f"获取实时行情快照: {len(snapshot)} 只股票，用时 {time.time() - start_time:.1f}秒")
+    
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        # 复权因子每个交易日核对一次：除权除息日的临时K线是除权后的价格，需要当天的因子
+        outdated = [code for code in codes if bar_cache.PRICE_ADJUST != 'none' and factors_outdated(code, now)]
+        if outdated:
+            list(pool.map(get_adjust_factors, outdated))
+            log_stock_analysis(f"核对复权因子: {len(outdated)} 只股票")
+        if MINUTE_60 in timeframes:
+            minute_bars = dict(zip(codes, pool.map(lambda code: fetch_minute_bars(code, now), codes)))
+    
+    all_signals = []
+    patched = 0
+    for code, name, df in cached:
+        outcome = {'code': code, 'name': name, 'status': STATUS_OK, 'attempts': 0, 'fetch_latency': 0.0,
+                   'compute_latency': 0.0, 'latency': 0.0, 'error': None}
+        try:
+            if code in snapshot.index:
+                df = patch_last_bar(df, snapshot.loc[code], now.date())
+                save_bars(code, df)
+                patched += 1
+            # 当天的复权因子已在上面核对过，这里只读本地缓存
+            result = build_stock_signals(code, name, adjust_prices(code, df, refresh=False), lean=True,
+                                         timeframes=timeframes, minute_bars=minute_bars.get(code),
+                                         resampler=_intraday_resampler, outcome=outcome)
+            if result is not None:
+                all_signals.append(result)
+        except Exception as e:
+            log_stock_analysis(f"盘中刷新失败 {code}: {e}", 'warning')
+            outcome.update(status=STATUS_COMPUTE_ERROR, error=f"{type(e).__name__}: {e}")
+        outcome['latency'] = outcome['compute_latency']
+        if outcomes is not None:
+            outcomes.append(outcome)
     
-    return all_signals 
\ No newline at end of file
+    log_stock_analysis(f"盘中增量刷新完成! 修补K线: {patched} 只, 成功计算: {len(all_signals)}/{len(stocks)} 只股票, "
+                       f"总用时: {time.time() - start_time:.1f}秒")
+    return all_signals
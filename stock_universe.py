@@ -0,0 +1,281 @@
+"""
+股票池（沪深300成分股 + datas/supplement.csv 补充股票）的本地缓存
+
+成分股每半年才调整一次，不再在每次刷新时请求 index_stock_cons 和重新读取补充文件：
+
+- 成分股缓存在 UNIVERSE_DIR/universe_<数据源>.json 中（带内容哈希），进程内再缓存一份
+- 缓存超过 UNIVERSE_MAX_AGE 后仍然直接返回，同时在后台线程中重新请求，启动和扫描都不等待
+- 没有任何缓存时才同步请求；请求失败时退回过期缓存，再退回只包含补充股票的股票池
+- 补充文件只在修改时间变化时重新读取
+- 成分股变化时记录新增/移除的股票，写入日志和 universe_changes_<数据源>.jsonl
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from fetch_resilience import call_endpoint
+from logger_config import log_stock_analysis
+from market_data import get_provider
+from metrics import counter, gauge
+
+
+UNIVERSE_DIR = os.environ.get(
+    'STOCK_UNIVERSE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datas', 'cache')
+)
+UNIVERSE_MAX_AGE = timedelta(days=1)
+INDEX_CODE = '000300'
+SUPPLEMENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datas', 'supplement.csv')
+
+UNIVERSE_SIZE = gauge('stock_universe_size', '当前股票池的股票数量')
+UNIVERSE_REFRESHES = counter('stock_universe_refreshes_total', '成分股请求次数', labels=('result',))
+
+
+def _cache_path(key):
+    return os.path.join(UNIVERSE_DIR, f'universe_{key}.json')
+
+
+def _changes_path(key):
+    return os.path.join(UNIVERSE_DIR, f'universe_changes_{key}.jsonl')
+
+
+def constituents_hash(constituents):
+    """成分股内容哈希（与顺序无关），用于判断成分股是否变化"""
+    rows = sorted(f"{code},{name}" for code, name in constituents[['code', 'name']].itertuples(index=False))
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+
+def diff_constituents(old, new):
+    """比较两份成分股，返回 {'added': [...], 'removed': [...]}，每项为 {'code', 'name'}"""
+    old_names = dict(old[['code', 'name']].itertuples(index=False))
+    new_names = dict(new[['code', 'name']].itertuples(index=False))
+    return {
+        'added': [{'code': code, 'name': new_names[code]} for code in sorted(set(new_names) - set(old_names))],
+        'removed': [{'code': code, 'name': old_names[code]} for code in sorted(set(old_names) - set(new_names))]
+    }
+
+
+def _supplement_mtime():
+    try:
+        return os.path.getmtime(SUPPLEMENT_PATH)
+    except OSError:
+        return None
+
+
+def read_supplement():
+    """读取补充股票，文件不存在或读取失败时返回空表"""
+    try:
+        supplement = pd.read_csv(SUPPLEMENT_PATH, encoding='utf-8', dtype={'code': str})
+        log_stock_analysis(f"成功读取补充股票数据: {len(supplement)} 只股票")
+        return supplement[['code', 'name']]
+    except FileNotFoundError:
+        log_stock_analysis("未找到supplement.csv文件，跳过补充数据", 'warning')
+    except Exception as e:
+        log_stock_analysis(f"读取补充股票数据失败: {e}", 'error')
+    return pd.DataFrame(columns=['code', 'name'])
+
+
+def resolve_universe(constituents, supplement):
+    """合并成分股和补充股票，按code去重并保留第一个出现的记录"""
+    stocks = pd.concat([constituents, supplement], ignore_index=True)
+    return stocks.drop_duplicates(subset=['code'], keep='first').reset_index(drop=True)
+
+
+class _Entry:
+    """一个数据源的股票池缓存"""
+
+    def __init__(self, constituents, updated_at, digest=None):
+        self.constituents = constituents.reset_index(drop=True)
+        self.updated_at = updated_at
+        self.hash = digest or constituents_hash(constituents)
+        self.supplement_mtime = None
+        self.universe = None
+
+    def age(self, now=None):
+        return (now or datetime.now()) - self.updated_at
+
+    def resolved(self):
+        """合并补充股票后的股票池，补充文件修改过时重新合并"""
+        mtime = _supplement_mtime()
+        if self.universe is None or mtime != self.supplement_mtime:
+            self.universe = resolve_universe(self.constituents, read_supplement())
+            self.supplement_mtime = mtime
+            UNIVERSE_SIZE.set(len(self.universe))
+        return self.universe.copy()
+
+
+def _load_entry(key):
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        constituents = pd.DataFrame(data['constituents'], columns=['code', 'name']).astype({'code': str})
+        return _Entry(constituents, datetime.fromisoformat(data['updated_at']), data.get('hash'))
+    except Exception as e:
+        log_stock_analysis(f"读取股票池缓存失败: {e}", 'warning')
+        return None
+
+
+def _save_entry(key, entry):
+    os.makedirs(UNIVERSE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'index': INDEX_CODE,
+            'updated_at': entry.updated_at.isoformat(),
+            'hash': entry.hash,
+            'constituents': entry.constituents.to_dict('records')
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _record_changes(key, old, new, now):
+    changes = diff_constituents(old.constituents, new.constituents)
+    if not changes['added'] and not changes['removed']:
+        return changes
+    describe = lambda items: '、'.join(f"{item['code']}{item['name']}" for item in items) or '无'
+    log_stock_analysis(f"成分股变化（{INDEX_CODE}）: 新增 {len(changes['added'])} 只 [{describe(changes['added'])}]，"
+                       f"移除 {len(changes['removed'])} 只 [{describe(changes['removed'])}]")
+    os.makedirs(UNIVERSE_DIR, exist_ok=True)
+    with open(_changes_path(key), 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'time': now.isoformat(timespec='seconds'), 'index': INDEX_CODE,
+                            'previous_hash': old.hash, 'hash': new.hash, **changes}, ensure_ascii=False) + '\n')
+    return changes
+
+
+_lock = threading.Lock()
+_fetch_lock = threading.Lock()
+_entries = {}
+_refreshing = {}
+_state_pid = os.getpid()
+
+
+def _check_fork():
+    """fork出的子进程不继承父进程的后台刷新线程（调用方持有锁）"""
+    global _state_pid
+    if _state_pid != os.getpid():
+        _state_pid = os.getpid()
+        _refreshing.clear()
+
+
+def refresh_universe(provider=None):
+    """
+    请求成分股并更新缓存，成分股有变化时记录变化
+
+    Returns:
+        合并补充股票后的股票池DataFrame
+
+    Raises:
+        请求失败或返回空的成分股时抛出异常，缓存保持不变
+    """
+    provider = provider or get_provider()
+    key = provider.universe_cache_key()
+    try:
+        constituents = call_endpoint('index_constituents', provider.get_index_constituents, INDEX_CODE)
+        if constituents is None or constituents.empty:
+            raise ValueError('成分股为空')
+    except Exception:
+        UNIVERSE_REFRESHES.inc(result='error')
+        raise
+    now = datetime.now()
+    entry = _Entry(constituents[['code', 'name']].astype({'code': str}), now)
+    with _lock:
+        old = _entries.get(key)
+    old = old or _load_entry(key)
+    if old is not None and old.hash == entry.hash:
+        # 成分股没有变化，沿用已经合并好的股票池，只更新时间
+        entry.universe, entry.supplement_mtime = old.universe, old.supplement_mtime
+        UNIVERSE_REFRESHES.inc(result='unchanged')
+    else:
+        if old is not None:
+            _record_changes(key, old, entry, now)
+        UNIVERSE_REFRESHES.inc(result='changed')
+    try:
+        _save_entry(key, entry)
+    except Exception as e:
+        log_stock_analysis(f"写入股票池缓存失败: {e}", 'warning')
+    with _lock:
+        _entries[key] = entry
+    log_stock_analysis(f"成分股已更新（{INDEX_CODE}）: {len(entry.constituents)} 只")
+    return entry.resolved()
+
+
+def _background_refresh(provider, key):
+    try:
+        refresh_universe(provider)
+    except Exception as e:
+        log_stock_analysis(f"后台更新成分股失败，继续使用缓存: {e}", 'warning')
+    finally:
+        with _lock:
+            _refreshing.pop(key, None)
+
+
+def _start_background_refresh(provider, key):
+    """每个数据源同一时刻只有一个后台刷新"""
+    with _lock:
+        _check_fork()
+        if key in _refreshing:
+            return
+        thread = threading.Thread(target=_background_refresh, args=(provider, key),
+                                  name='universe-refresh', daemon=True)
+        _refreshing[key] = thread
+    thread.start()
+
+
+def wait_for_refresh(timeout=None):
+    """等待正在进行的后台刷新结束（测试和命令行退出前使用）"""
+    with _lock:
+        threads = list(_refreshing.values())
+    for thread in threads:
+        thread.join(timeout)
+
+
+def get_universe(provider=None, max_age=UNIVERSE_MAX_AGE):
+    """
+    获取股票池（code/name 列的DataFrame）
+
+    有缓存时立即返回，缓存过期则同时在后台更新；没有缓存时同步请求成分股，
+    请求失败时退回只包含补充股票的股票池，补充股票也没有时返回None。
+    """
+    provider = provider or get_provider()
+    key = provider.universe_cache_key()
+    with _lock:
+        entry = _entries.get(key)
+    if entry is None:
+        with _fetch_lock:
+            with _lock:
+                entry = _entries.get(key)
+            if entry is None:
+                entry = _load_entry(key)
+                if entry is not None:
+                    with _lock:
+                        entry = _entries.setdefault(key, entry)
+                else:
+                    try:
+                        return refresh_universe(provider)
+                    except Exception as e:
+                        log_stock_analysis(f"获取沪深300成分股失败: {e}", 'error')
+                        supplement = read_supplement()
+                        if supplement.empty:
+                            return None
+                        log_stock_analysis(f"暂时只使用补充股票: {len(supplement)} 只", 'warning')
+                        return supplement.drop_duplicates(subset=['code'], keep='first').reset_index(drop=True)
+
+    if entry.age() > max_age:
+        _start_background_refresh(provider, key)
+    with _lock:
+        return entry.resolved()
+
+
+def reset():
+    """清空进程内缓存（测试用），本地文件不受影响"""
+    wait_for_refresh()
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,115 @@
+import unittest
+import tempfile
+import shutil
+from datetime import datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 accuracy_stats 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import accuracy_stats
+import signal_store
+from accuracy_stats import AccuracyStats, update_accuracy_stats
+from market_data import OfflineProvider, set_provider
+from trading_calendar import TradingCalendar, set_calendar
+from stock_signals import SIGNAL_NAMES
+
+
+class CountingProvider(OfflineProvider):
+    """记录日线请求次数的模拟数据源"""
+
+    def __init__(self):
+        super().__init__(universe_size=3)
+        self.calls = 0
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.calls += 1
+        return super().get_daily_bars(stock_code, start_date, end_date)
+
+
+class TestAccuracyStats(unittest.TestCase):
+    """测试增量预计算的准确率统计"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_history_dir = signal_store.HISTORY_DIR
+        signal_store.HISTORY_DIR = self.tmp_dir
+        accuracy_stats._final_price_windows.clear()
+        self.provider = CountingProvider()
+        set_provider(self.provider)
+        set_calendar(TradingCalendar(pd.bdate_range('2025-01-01', '2025-12-31').date))
+        self.stats = AccuracyStats(os.path.join(self.tmp_dir, 'accuracy_stats.db'))
+        # 观察窗口已定型的时刻：2025-07-15 之后第5个交易日为 07-22
+        self.now = datetime(2025, 7, 23, 16, 0)
+
+    def tearDown(self):
+        set_calendar(None)
+        set_provider(None)
+        signal_store.HISTORY_DIR = self.old_history_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def write_history(self, date, rows):
+        signals = [{'code': code, 'name': code, 'date': date,
+                    'close': float(self.provider.get_daily_bars(code, date.replace('-', ''),
+                                                                date.replace('-', ''))['close'].iloc[-1]),
+                    'signals': {name: name in fired for name in SIGNAL_NAMES}}
+                   for code, fired in rows]
+        signal_store.save_history_csv(signals, pd.Timestamp(date))
+
+    def expected_return(self, code, date, end):
+        bars = self.provider.get_daily_bars(code, date.replace('-', ''), end.replace('-', ''))
+        return (bars['close'].iloc[-1] - bars['close'].iloc[0]) / bars['close'].iloc[0] * 100
+
+    def test_only_final_windows_materialized_once(self):
+        """只写入观察窗口已定型的信号日，重复更新不再请求行情"""
+        self.write_history('2025-07-15', [('600000', {'底背离'}), ('600001', {'顶背离', '顶结构'})])
+        self.write_history('2025-07-21', [('600002', {'主升'})])
+
+        self.assertEqual(update_accuracy_stats(self.stats, now=self.now), ['2025-07-15'])
+        calls = self.provider.calls
+        self.assertEqual(update_accuracy_stats(self.stats, now=self.now), [])
+        self.assertEqual(self.provider.calls, calls)
+
+        summary = self.stats.get_summary()
+        self.assertEqual([item['date'] for item in summary['by_date']], ['2025-07-15'])
+        returns = [self.expected_return('600000', '2025-07-15', '2025-07-22'),
+                   self.expected_return('600001', '2025-07-15', '2025-07-22')]
+        hits = int(returns[0] > 0) + int(returns[1] < 0)
+        day = summary['by_date'][0]
+        self.assertEqual(day['total'], 2)
+        self.assertEqual(day['hits'], hits)
+        self.assertAlmostEqual(day['avg_return'], sum(returns) / 2)
+        by_signal = {item['signal']: item for item in summary['by_signal']}
+        self.assertEqual(set(by_signal), {'底背离', '顶背离', '顶结构'})
+        self.assertAlmostEqual(by_signal['顶结构']['avg_return'], returns[1])
+
+        # 下一个信号日的观察窗口定型后增量写入
+        self.assertEqual(update_accuracy_stats(self.stats, now=datetime(2025, 7, 29, 16, 0)), ['2025-07-21'])
+        self.assertEqual(self.stats.get_summary()['overall']['total'], 3)
+
+    def test_rewritten_history_replaces_date(self):
+        """历史文件被重写后重新计算该信号日，按信号类型的汇总不会重复累加"""
+        self.write_history('2025-07-15', [('600000', {'底背离'}), ('600001', {'底背离'})])
+        update_accuracy_stats(self.stats, now=self.now)
+        path = os.path.join(self.tmp_dir, 'signals_20250715.csv')
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) - 10))
+        self.write_history('2025-07-15', [('600000', {'底背离'})])
+
+        self.assertEqual(update_accuracy_stats(self.stats, now=self.now), ['2025-07-15'])
+        summary = self.stats.get_summary()
+        self.assertEqual(summary['overall']['total'], 1)
+        self.assertEqual([(item['signal'], item['total']) for item in summary['by_signal']], [('底背离', 1)])
+
+
+    def test_api_rejects_unmaterialized_window(self):
+        """只预计算了默认观察窗口，其他天数返回400而不是空的统计"""
+        import app
+        response = app.app.test_client().get('/api/accuracy?days=10')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(accuracy_stats.DEFAULT_WINDOW), response.get_json()['error'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 backfill 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import bar_cache
+import signal_store
+import stock_signals
+from backfill import backfill_history, extract_signal_history
+from market_data import OfflineProvider, set_provider
+from bar_cache import adjust_bars
+from stock_signals import compute_stock_signals, MIN_BARS
+
+
+class TestBackfill(unittest.TestCase):
+    """测试历史信号回填"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY, signal_store.HISTORY_DIR)
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        signal_store.HISTORY_DIR = os.path.join(self.tmp_dir, 'history')
+        stock_signals.FETCH_DELAY = 0
+        self.provider = OfflineProvider(universe_size=5)
+        set_provider(self.provider)
+        self.stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(5)]
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY, signal_store.HISTORY_DIR = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_matches_daily_scans(self):
+        """一次计算得到的逐日信号与逐日扫描的结果一致"""
+        df = self.provider.get_daily_bars('600000', '20240901', '20250630')
+        start, end = df.index[MIN_BARS - 1], df.index[-1]
+        records = {r['date']: r for r in extract_signal_history(('600000', 'a', df, start, end, None, 'qfq'))}
+
+        for i in range(MIN_BARS - 1, len(df)):
+            expected = compute_stock_signals('600000', 'a', df.iloc[:i + 1], lean=True)
+            if any(expected['signals'].values()):
+                self.assertEqual(records.pop(expected['date']), expected)
+        self.assertEqual(records, {})
+
+    def test_matches_daily_scans_across_ex_dividend(self):
+        """区间内有除权除息时，每天的信号按当天为基准前复权计算，与当天收盘后扫描的结果一致"""
+        raw = self.provider.get_daily_bars('600000', '20240901', '20250630')
+        factors = pd.DataFrame({'factor': [1.0, 1.8, 2.6]},
+                               index=pd.DatetimeIndex(['2020-01-01', '2025-03-14', '2025-05-20'], name='date'))
+        start, end = raw.index[MIN_BARS - 1], raw.index[-1]
+        records = {r['date']: r for r in extract_signal_history(('600000', 'a', raw, start, end, factors, 'qfq'))}
+
+        expected = {}
+        for i in range(MIN_BARS - 1, len(raw)):
+            scan = compute_stock_signals('600000', 'a', adjust_bars(raw.iloc[:i + 1], factors, 'qfq'), lean=True)
+            if any(scan['signals'].values()):
+                expected[scan['date']] = scan
+        self.assertEqual(records, expected)
+        # 以区间末尾为基准复权一次计算的信号与逐日扫描不同
+        end_based = extract_signal_history(('600000', 'a', adjust_bars(raw, factors, 'qfq'), start, end, None, 'qfq'))
+        self.assertNotEqual({r['date']: r['signals'] for r in end_based},
+                            {date: r['signals'] for date, r in expected.items()})
+
+    def test_backfill_idempotent(self):
+        """回填只补缺失的日期，重复运行结果相同"""
+        summary = backfill_history('2025-05-01', '2025-06-30', self.stock_list, max_workers=2, fetch_workers=2)
+        self.assertEqual(summary['failed'], [])
+        self.assertGreater(len(summary['dates_written']), 0)
+        first = {date: pd.read_csv(os.path.join(signal_store.HISTORY_DIR, f"signals_{date.replace('-', '')}.csv"),
+                                   dtype={'code': str})
+                 for date in summary['dates_written']}
+        for date, df in first.items():
+            self.assertTrue((df['date'] == date).all())
+
+        again = backfill_history('2025-05-01', '2025-06-30', self.stock_list, max_workers=2, fetch_workers=2)
+        self.assertEqual(again['dates_written'], [])
+        self.assertEqual(again['dates_skipped'], summary['dates_written'])
+
+        rewritten = backfill_history('2025-05-01', '2025-06-30', self.stock_list, max_workers=2, fetch_workers=2,
+                                     overwrite=True)
+        self.assertEqual(rewritten['dates_written'], summary['dates_written'])
+        for date, df in first.items():
+            path = os.path.join(signal_store.HISTORY_DIR, f"signals_{date.replace('-', '')}.csv")
+            pd.testing.assert_frame_equal(pd.read_csv(path, dtype={'code': str}), df)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import tempfile
+import shutil
+import gzip
+import json
+import threading
+import time
+from datetime import date, datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 compact_payload 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import signal_store
+from compact_payload import EncodedBody, PayloadCache, parse_accept_encoding, encode_history_columns, pack_signals
+from stock_signals import SIGNAL_NAMES
+
+
+def make_signal(code, **signals):
+    return {'code': code, 'name': f"股票{code}", 'date': '2025-07-22', 'close': 10.5,
+            'signals': {name: signals.get(name, False) for name in SIGNAL_NAMES}}
+
+
+class TestEncodedBody(unittest.TestCase):
+    """测试响应体预压缩和编码协商"""
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding('gzip, deflate;q=0.5, br;q=0'),
+                         {'gzip': 1.0, 'deflate': 0.5, 'br': 0.0})
+        self.assertEqual(parse_accept_encoding(None), {})
+
+    def test_negotiate(self):
+        body = EncodedBody.from_payload({'signals': ['顶背离'] * 100})
+        self.assertEqual(json.loads(gzip.decompress(body.negotiate('gzip, deflate')[0])),
+                         json.loads(body.identity))
+        self.assertEqual(body.negotiate('gzip;q=0')[1], None)
+        self.assertEqual(body.negotiate('*')[1], 'br' if body.br is not None else 'gzip')
+        self.assertEqual(body.negotiate(''), (body.identity, None))
+        # 中文不转义
+        self.assertIn('顶背离'.encode('utf-8'), body.identity)
+
+    def test_date_values(self):
+        # 后续行情的日期为date
+        body = EncodedBody.from_payload({'date': date(2025, 7, 23), 'time': datetime(2025, 7, 23, 15, 31)})
+        self.assertEqual(json.loads(body.identity), {'date': '2025-07-23', 'time': '2025-07-23 15:31:00'})
+
+    def test_single_flight_build(self):
+        """同一个key并发请求时只生成一次响应体"""
+        cache = PayloadCache()
+        calls = []
+        release = threading.Event()
+
+        def build():
+            calls.append(1)
+            release.wait(5)
+            return {'signals': []}, 0
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', build))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(body) for body in results}), 1)
+
+        def failing():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            cache.get('other', failing)
+        self.assertEqual(cache.get('other', build).count, 0)
+
+    def test_history_columns(self):
+        stocks = [dict(make_signal('000001', 主升=True), daily_prices=[
+                      {'day': 1, 'date': '2025-07-23', 'close': 11.0},
+                      {'day': 2, 'date': '2025-07-24', 'close': 12.0}],
+                       accumulate={'number': 14.3, 'status': True}),
+                  dict(make_signal('000002', 顶背离=True), daily_prices=[
+                      {'day': 1, 'date': '2025-07-24', 'close': 9.0}],
+                       accumulate={'number': -14.3, 'status': True}),
+                  dict(make_signal('000003'), daily_prices=None, accumulate=None)]
+        data = encode_history_columns({'2025-07-22': stocks}, 5)['signals_by_date']['2025-07-22']
+        self.assertEqual(data['window_dates'], ['2025-07-23', '2025-07-24'])
+        self.assertEqual(data['daily_closes'], [[11.0, 12.0], [None, 9.0], None])
+        self.assertEqual(data['signals'], [1 << SIGNAL_NAMES.index('主升'), 1 << SIGNAL_NAMES.index('顶背离'), 0])
+        self.assertEqual(data['correct'], [True, True, None])
+
+
+class TestCompactSignalsApi(unittest.TestCase):
+    """测试 /api/signals 的列格式和预压缩响应"""
+
+    def setUp(self):
+        import app
+        self.app = app
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, app.WEB_REFRESH_ENABLED,
+                             app.global_signals, app.last_update_time, app.snapshot_mtime, app.snapshot_version)
+        signal_store.HISTORY_DIR = self.tmp_dir
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        app.WEB_REFRESH_ENABLED = False
+        self.client = app.app.test_client()
+        self.signals = [make_signal('000001', 主升=True), make_signal('000002'),
+                        make_signal('000003', 顶背离=True, 顶结构=True)]
+        signal_store.save_snapshot(self.signals, datetime(2025, 7, 22, 15, 31))
+
+    def tearDown(self):
+        (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, self.app.WEB_REFRESH_ENABLED,
+         self.app.global_signals, self.app.last_update_time, self.app.snapshot_mtime,
+         self.app.snapshot_version) = self.old_settings
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_gzip_response(self):
+        response = self.client.get('/api/signals', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        data = json.loads(gzip.decompress(response.get_data()))
+        self.assertEqual([s['code'] for s in data['signals']], ['000001', '000003'])
+
+        plain = self.client.get('/api/signals')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.get_json(), data)
+
+    def test_columns_format(self):
+        rows = self.client.get('/api/signals').get_json()
+        columns = self.client.get('/api/signals?format=columns').get_json()
+        self.assertEqual(columns['format'], 'columns')
+        self.assertEqual(columns['version'], rows['version'])
+        self.assertEqual(columns['codes'], [s['code'] for s in rows['signals']])
+        self.assertEqual(columns['signals'], [pack_signals(s['signals']) for s in rows['signals']])
+        decoded = {name: bool(columns['signals'][1] >> k & 1) for k, name in enumerate(columns['signal_names'])}
+        self.assertEqual(decoded, rows['signals'][1]['signals'])
+        self.assertEqual(self.client.get('/api/signals?format=xml').status_code, 400)
+
+    def test_body_encoded_once_per_snapshot(self):
+        self.client.get('/api/signals?format=columns')
+        cached = list(self.app.payload_cache._entries.values())
+        self.client.get('/api/signals?format=columns', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(list(self.app.payload_cache._entries.values()), cached)
+
+        # 发布新快照后重新编码
+        signal_store.save_snapshot(self.signals[:1], datetime(2025, 7, 23, 15, 31))
+        data = self.client.get('/api/signals?format=columns').get_json()
+        self.assertEqual(data['codes'], ['000001'])
+        self.assertEqual(data['version'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
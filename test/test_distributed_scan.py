@@ -0,0 +1,125 @@
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+import sys
+import os
+from datetime import datetime
+
+# 添加当前目录到路径，以便导入 distributed_scan 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import accuracy_stats
+import bar_cache
+import distributed_scan
+import metrics
+import signal_store
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from distributed_scan import ShardQueue, run_worker, run_coordinator, publish_results
+from trading_calendar import set_calendar, weekday_calendar
+
+
+class TestDistributedScan(unittest.TestCase):
+    """测试分片工作队列与分布式扫描"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY,
+                             signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, accuracy_stats.DEFAULT_STATS_PATH,
+                             metrics.METRICS_DIR)
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        signal_store.HISTORY_DIR = os.path.join(self.tmp_dir, 'history')
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'history', 'stock_signals.json')
+        accuracy_stats.DEFAULT_STATS_PATH = os.path.join(self.tmp_dir, 'accuracy_stats.db')
+        metrics.METRICS_DIR = os.path.join(self.tmp_dir, 'metrics')
+        stock_signals.FETCH_DELAY = 0
+        self.queue = ShardQueue(os.path.join(self.tmp_dir, 'queue.db'))
+        self.stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(10)]
+
+    def tearDown(self):
+        set_provider(None)
+        (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY,
+         signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, accuracy_stats.DEFAULT_STATS_PATH,
+         metrics.METRICS_DIR) = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shard_claimed_once(self):
+        """同一分片在租约有效期内只会被一个节点领取"""
+        job_id = self.queue.create_job(self.stock_list, shard_size=4)
+        claims = [self.queue.claim(f'worker-{i}') for i in range(4)]
+        self.assertEqual([claim[1] for claim in claims[:3]], [0, 1, 2])
+        self.assertEqual(len(claims[2][2]), 2)
+        self.assertIsNone(claims[3])
+        self.assertEqual(self.queue.get_progress(job_id)['by_status'], {'leased': 3})
+
+    def test_expired_shard_reassigned(self):
+        """节点失联后分片被重新分配，失联节点迟到的结果被丢弃"""
+        job_id = self.queue.create_job(self.stock_list[:2], shard_size=2)
+        _, shard_id, _ = self.queue.claim('dead', lease_seconds=0.1)
+        self.assertIsNone(self.queue.claim('alive'))
+        time.sleep(0.2)
+        self.assertEqual(self.queue.claim('alive')[1], shard_id)
+
+        self.assertFalse(self.queue.complete(job_id, shard_id, 'dead', [{'code': 'stale'}], []))
+        self.assertTrue(self.queue.complete(job_id, shard_id, 'alive', [{'code': '600000'}], []))
+        self.assertEqual(self.queue.collect(job_id)[0], [{'code': '600000'}])
+
+    def test_workers_share_job(self):
+        """多个工作节点协作完成同一任务，结果顺序与股票池一致"""
+        set_provider(OfflineProvider(universe_size=10))
+        workers = [threading.Thread(target=run_worker, args=(self.queue, f'worker-{i}'),
+                                    kwargs={'max_workers': 1, 'fetch_workers': 2, 'poll_interval': 0.05,
+                                            'idle_timeout': 2})
+                   for i in range(2)]
+        for worker in workers:
+            worker.start()
+        signals, outcomes = run_coordinator(self.queue, self.stock_list, shard_size=3, poll_interval=0.05,
+                                            timeout=60)
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([o['code'] for o in outcomes], [code for code, _ in self.stock_list])
+        self.assertEqual([s['code'] for s in signals], [code for code, _ in self.stock_list])
+        self.assertIsNone(self.queue.claim('late'))
+        # 汇总的结果发布为快照
+        self.assertEqual([s['code'] for s in signal_store.load_snapshot()[0]],
+                         [code for code, _ in self.stock_list])
+
+    def test_publish_history_only_when_finalized(self):
+        """收盘定型之后才写当日历史信号，盘中和非交易日只替换快照"""
+        set_provider(OfflineProvider(universe_size=10))
+        set_calendar(weekday_calendar())
+        self.addCleanup(set_calendar, None)
+        signals = [{'code': '600000', 'name': '模拟股票1', 'date': '2025-07-22', 'close': 10.0,
+                    'signals': {'底成立': True}}]
+        self.assertEqual(publish_results(signals, datetime(2025, 7, 22, 10, 0)), (None, 0))
+        self.assertEqual(publish_results(signals, datetime(2025, 7, 26, 16, 0)), (None, 0))
+        self.assertEqual(signal_store.load_snapshot()[3], 2)
+        self.assertFalse([name for name in os.listdir(signal_store.HISTORY_DIR) if name.startswith('signals_')])
+
+        path, rows = publish_results(signals, datetime(2025, 7, 22, 15, 31))
+        self.assertEqual(path, os.path.join(signal_store.HISTORY_DIR, 'signals_20250722.csv'))
+        self.assertEqual(rows, 1)
+
+    def test_timeout_not_published(self):
+        """超时的任务不发布信号"""
+        signals, outcomes = run_coordinator(self.queue, self.stock_list, shard_size=5, poll_interval=0.05,
+                                            timeout=0.1)
+        self.assertEqual((signals, outcomes), ([], []))
+        self.assertFalse(os.path.exists(signal_store.SNAPSHOT_PATH))
+
+    def test_universe_unavailable(self):
+        """获取股票池失败时不创建任务"""
+        get_all_stocks = distributed_scan.get_all_stocks
+        distributed_scan.get_all_stocks = lambda: None
+        try:
+            self.assertEqual(run_coordinator(self.queue, poll_interval=0.05, timeout=1), ([], []))
+        finally:
+            distributed_scan.get_all_stocks = get_all_stocks
+        self.assertIsNone(self.queue.claim('worker'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import tempfile
+import shutil
+import socket
+import threading
+import json
+import time
+from datetime import datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 event_stream 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import signal_store
+from event_stream import SnapshotEventServer
+
+
+def make_signal(code, **signals):
+    return {'code': code, 'name': f'股票{code}', 'date': '2025-07-22', 'close': 10.0,
+            'signals': {'macd_golden_cross': False, 'kdj_golden_cross': False, **signals}}
+
+
+class TestSnapshotEventServer(unittest.TestCase):
+    """测试快照推送服务"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_paths = (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH)
+        signal_store.HISTORY_DIR = self.tmp_dir
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        self.publish([make_signal('000001')])
+        self.server = SnapshotEventServer('127.0.0.1', 0, poll_interval=0.2, heartbeat_interval=0.5).start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+        signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH = self.old_paths
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def publish(self, signals):
+        signal_store.save_snapshot(signals, datetime(2025, 7, 22, 15, 31))
+
+    def connect(self, path='/api/events', headers=''):
+        client = socket.create_connection(('127.0.0.1', self.server.port), timeout=5)
+        client.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode())
+        self.clients.append(client)
+        return client
+
+    def read_until(self, client, marker):
+        data = b''
+        deadline = time.time() + 5
+        while marker not in data and time.time() < deadline:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode('utf-8')
+
+    def parse_events(self, text):
+        return [json.loads(line[len('data: '):]) for line in text.split('\n') if line.startswith('data: ')]
+
+    def wait_for_clients(self, count):
+        deadline = time.time() + 5
+        while self.server.client_count < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.client_count, count)
+
+    def test_new_connection_receives_current_version(self):
+        """新连接立即收到当前快照版本"""
+        text = self.read_until(self.connect(), b'"version": 1')
+        self.assertIn('text/event-stream', text)
+        self.assertEqual(self.parse_events(text)[0]['version'], 1)
+
+    def test_publish_is_pushed_with_summary(self):
+        """发布新快照后推送版本号和变化摘要"""
+        client = self.connect()
+        self.read_until(client, b'"version": 1')
+        self.publish([make_signal('000001', macd_golden_cross=True), make_signal('000002', kdj_golden_cross=True)])
+        self.server.notify()
+        event = self.parse_events(self.read_until(client, b'"version": 2'))[-1]
+        self.assertEqual(event['version'], 2)
+        self.assertEqual(event['changed'], 2)
+        self.assertEqual(event['signals'], {'macd_golden_cross': 1, 'kdj_golden_cross': 1})
+
+    def test_reconnect_with_current_id_skips_replay(self):
+        """重连时Last-Event-ID已是最新版本则不重复推送，只收到心跳"""
+        client = self.connect(headers='Last-Event-ID: 1\r\n')
+        text = self.read_until(client, b': ping')
+        self.assertEqual(self.parse_events(text), [])
+
+    def test_unknown_path_returns_404(self):
+        text = self.read_until(self.connect('/other'), b'\r\n\r\n')
+        self.assertTrue(text.startswith('HTTP/1.1 404'))
+
+    def test_idle_connections_share_one_thread(self):
+        """大量空闲连接不增加线程，发布时全部收到推送"""
+        threads_before = threading.active_count()
+        clients = [self.connect() for _ in range(100)]
+        self.wait_for_clients(100)
+        self.assertEqual(threading.active_count(), threads_before)
+
+        self.publish([make_signal('000001', macd_golden_cross=True)])
+        self.server.notify()
+        for client in clients:
+            self.assertIn('"version": 2', self.read_until(client, b'"version": 2'))
+
+        for client in clients[:50]:
+            client.close()
+        self.clients = self.clients[50:]
+        deadline = time.time() + 5
+        while self.server.client_count > 50 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.client_count, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 fetch_limiter 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import stock_signals
+from fetch_limiter import AdaptiveLimiter, LIMIT_CHANGES, set_fetch_limiter
+from market_data import OfflineProvider, set_provider
+from stock_signals import fetch_stock_data, STATUS_OK
+
+
+class ThrottlingProvider(OfflineProvider):
+    """同时处理的请求（日线和复权因子）超过capacity时返回429的数据源"""
+
+    def __init__(self, capacity, latency=0.01):
+        super().__init__(universe_size=6)
+        self.capacity = capacity
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.calls = 0
+        self.throttled = 0
+
+    def serve(self, request, *args):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            overloaded = self.active > self.capacity
+            if overloaded:
+                self.throttled += 1
+        try:
+            time.sleep(self.latency)
+            if overloaded:
+                raise ConnectionError('429 Too Many Requests')
+            return request(*args)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        return self.serve(super().get_daily_bars, stock_code, start_date, end_date)
+
+    def get_adjust_factors(self, stock_code):
+        return self.serve(super().get_adjust_factors, stock_code)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """测试AIMD并发上限的调整"""
+
+    def test_additive_increase_when_saturated(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        first, second = limiter.acquire(), limiter.acquire()
+        limiter.release(first)
+        self.assertEqual(limiter.limit, 2.5)
+        limiter.release(second)
+        # 只剩一个在途请求时并发没有用满，不再增加
+        self.assertEqual(limiter.limit, 2.5)
+
+    def test_errors_in_one_window_halve_once(self):
+        limiter = AdaptiveLimiter(initial=8, max_limit=8)
+        started = [limiter.acquire() for _ in range(8)]
+        for token in started:
+            limiter.release(token, ok=False)
+        self.assertEqual(limiter.current_limit, 4)
+        limiter.release(limiter.acquire(), ok=False)
+        self.assertEqual(limiter.current_limit, 2)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), ok=False)
+        self.assertEqual(limiter.current_limit, 1)
+
+    def test_slow_requests_back_off(self):
+        limiter = AdaptiveLimiter(initial=4, max_limit=8, slow_latency=0.5)
+        for _ in range(5):
+            limiter.release(limiter.acquire())
+        limiter.release(limiter.acquire() - 1.0)
+        self.assertEqual(limiter.current_limit, 2)
+
+    def test_slot_releases_on_exception(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        with self.assertRaises(ConnectionError):
+            with limiter.slot():
+                raise ConnectionError('timeout')
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.current_limit, 1)
+
+
+class TestAdaptiveFetch(unittest.TestCase):
+    """测试行情请求在限流的数据源下收敛到数据源的容量"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.cache_dir
+        stock_signals.FETCH_DELAY = 0
+        self.codes = [f"{600000 + i:06d}" for i in range(120)]
+
+    def tearDown(self):
+        set_provider(None)
+        set_fetch_limiter(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.cache_dir)
+
+    def fetch_all(self, provider, limiter):
+        set_provider(provider)
+        set_fetch_limiter(limiter)
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            return [outcome for _, outcome in pool.map(fetch_stock_data, self.codes)]
+
+    def test_backs_off_when_throttled(self):
+        provider = ThrottlingProvider(capacity=3)
+        limiter = AdaptiveLimiter(initial=8, max_limit=12)
+        decreases = LIMIT_CHANGES.get(direction='decrease', reason='error')
+        outcomes = self.fetch_all(provider, limiter)
+
+        self.assertGreater(LIMIT_CHANGES.get(direction='decrease', reason='error'), decreases)
+        self.assertLessEqual(limiter.current_limit, provider.capacity + 1)
+        # 固定12个并发时大部分请求会被限流
+        self.assertLess(provider.throttled, provider.calls * 0.4)
+        ok = sum(1 for outcome in outcomes if outcome['status'] == STATUS_OK)
+        self.assertGreaterEqual(ok, len(self.codes) * 0.95)
+
+    def test_grows_when_healthy(self):
+        provider = ThrottlingProvider(capacity=100)
+        limiter = AdaptiveLimiter(initial=4, max_limit=12)
+        outcomes = self.fetch_all(provider, limiter)
+
+        self.assertEqual(provider.throttled, 0)
+        self.assertGreaterEqual(limiter.current_limit, 8)
+        self.assertTrue(all(outcome['status'] == STATUS_OK for outcome in outcomes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 fetch_resilience 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import fetch_resilience
+import stock_signals
+from fetch_resilience import (CircuitBreaker, CircuitOpenError, FetchTimeoutError, call_endpoint,
+                              get_breaker, get_latency_tracker, HEDGE_WINS, HEDGE_SKIPPED, CLOSED, OPEN,
+                              HALF_OPEN)
+from fetch_limiter import AdaptiveLimiter, set_fetch_limiter
+from market_data import OfflineProvider, set_provider
+from stock_signals import (fetch_stock_data, run_stock_scan, summarize_outcomes, STATUS_FETCH_ERROR, STATUS_STALE,
+                           RETRYABLE_STATUSES)
+from scan_checkpoint import ScanCheckpoint
+from trading_calendar import get_calendar
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DownProvider(OfflineProvider):
+    """所有请求都失败的数据源"""
+
+    def __init__(self):
+        super().__init__(universe_size=6)
+        self.calls = 0
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.calls += 1
+        raise ConnectionError('502 Bad Gateway')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """测试熔断器状态转换"""
+
+    def test_opens_on_consecutive_failures_and_probes(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker('test', consecutive_failures=3, reset_timeout=30, clock=clock)
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.retry_in(), 30)
+
+        clock.now = 31
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # 半开时只放行一个探测请求
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        clock.now = 62
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_opens_on_failure_ratio(self):
+        breaker = CircuitBreaker('test', window=10, failure_ratio=0.5, consecutive_failures=100)
+        for i in range(9):
+            breaker.record_success() if i % 2 else breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+
+class TestCallEndpoint(unittest.TestCase):
+    """测试对冲请求和调用超时"""
+
+    def setUp(self):
+        fetch_resilience.reset_breakers()
+        self.limiter = AdaptiveLimiter(initial=2, max_limit=2)
+        set_fetch_limiter(self.limiter)
+
+    def tearDown(self):
+        set_fetch_limiter(None)
+        fetch_resilience.reset_breakers()
+
+    def wait_in_flight(self, expected, timeout=1.0):
+        deadline = time.perf_counter() + timeout
+        while self.limiter.in_flight != expected and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        return self.limiter.in_flight
+
+    def test_hedged_request_wins(self):
+        """第一个请求卡住时，对冲请求先返回"""
+        # 原请求的名额由调用方占用
+        self.limiter.acquire()
+        tracker = get_latency_tracker('hedge')
+        for _ in range(fetch_resilience.HEDGE_MIN_SAMPLES):
+            tracker.record(0.01)
+        calls = []
+        lock = threading.Lock()
+
+        def slow_first():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            time.sleep(2 if first else 0.01)
+            return 'first' if first else 'hedge'
+
+        wins = HEDGE_WINS.get(endpoint='hedge')
+        start = time.perf_counter()
+        self.assertEqual(call_endpoint('hedge', slow_first, hedge=True), 'hedge')
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(HEDGE_WINS.get(endpoint='hedge'), wins + 1)
+        # 对冲请求结束后释放它占用的名额
+        self.assertEqual(self.wait_in_flight(1), 1)
+        self.limiter.cancel()
+
+    def test_no_hedge_without_free_slot(self):
+        """并发名额用满时不发出对冲请求"""
+        for _ in range(2):
+            self.limiter.acquire()
+        tracker = get_latency_tracker('busy')
+        for _ in range(fetch_resilience.HEDGE_MIN_SAMPLES):
+            tracker.record(0.01)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.4)
+            return 'ok'
+
+        skipped = HEDGE_SKIPPED.get(endpoint='busy')
+        self.assertEqual(call_endpoint('busy', slow, hedge=True), 'ok')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(HEDGE_SKIPPED.get(endpoint='busy'), skipped + 1)
+        self.assertEqual(self.limiter.in_flight, 2)
+
+    def test_no_hedge_without_samples(self):
+        calls = []
+        self.assertEqual(call_endpoint('cold', lambda: calls.append(1) or 'ok', hedge=True), 'ok')
+        self.assertEqual(len(calls), 1)
+
+    def test_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(FetchTimeoutError):
+            call_endpoint('stuck', time.sleep, 1, timeout=0.1, hedge=False)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(get_breaker('stuck')._results[-1], False)
+
+
+class TestFetchFallback(unittest.TestCase):
+    """测试数据源不可用时快速失败并使用本地日线缓存"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.cache_dir
+        stock_signals.FETCH_DELAY = 0
+        self.codes = [f"{600000 + i:06d}" for i in range(30)]
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.cache_dir)
+
+    def warm_cache(self, codes):
+        """写入盘中的日线缓存：最近一个定型交易日的K线还是临时K线，与运行测试的时刻无关"""
+        provider = OfflineProvider(universe_size=len(self.codes))
+        day = get_calendar().latest_finalized_day()
+        for code in codes:
+            bar_cache.save_bars(code, provider.get_daily_bars(code, '20240901', day.strftime('%Y%m%d')),
+                                provisional_date=day)
+
+    def test_open_circuit_falls_back_to_cache(self):
+        set_provider(OfflineProvider(universe_size=30))
+        # 缓存的当日K线未定型，下次扫描仍会请求数据源
+        self.warm_cache(self.codes[:20])
+        provider = DownProvider()
+        set_provider(provider)
+
+        start = time.perf_counter()
+        results = [fetch_stock_data(code) for code in self.codes]
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(get_breaker('daily_bars').state, OPEN)
+        # 熔断后不再请求数据源
+        self.assertEqual(provider.calls, fetch_resilience.CONSECUTIVE_FAILURES)
+        self.assertLess(elapsed, 5)
+        # 前3只股票各失败3次，第4只股票请求1次后熔断，改用缓存
+        self.assertTrue(all(outcome['status'] == STATUS_FETCH_ERROR for _, outcome in results[:3]))
+        for (df, outcome), code in zip(results[3:20], self.codes[3:20]):
+            # 缓存的K线可能过期，按失败处理（可重试），不含盘中临时K线
+            self.assertEqual(outcome['status'], STATUS_STALE)
+            self.assertIn(STATUS_STALE, RETRYABLE_STATUSES)
+            self.assertGreaterEqual(len(df), stock_signals.MIN_BARS)
+            cached = bar_cache.load_bars(code)
+            self.assertFalse(df.index.isin(cached.index[cached['provisional']]).any())
+        self.assertEqual(results[3][1]['attempts'], 1)
+        self.assertEqual(results[4][1]['attempts'], 0)
+        # 没有缓存的股票直接失败
+        for df, outcome in results[20:]:
+            self.assertIsNone(df)
+            self.assertEqual(outcome['status'], STATUS_FETCH_ERROR)
+            self.assertIn('CircuitOpenError', outcome['error'])
+
+
+    def test_stale_results_not_published(self):
+        """熔断时只有缓存K线的股票不发布信号，按失败统计，续跑时重新处理"""
+        set_provider(OfflineProvider(universe_size=12))
+        stocks = [(code, f"股票{code}") for code in self.codes[:12]]
+        self.warm_cache(self.codes[:12])
+        set_provider(DownProvider())
+
+        checkpoint = ScanCheckpoint(os.path.join(self.cache_dir, 'checkpoint.db'))
+        run_id = checkpoint.start_run('2025-07-22', len(stocks))
+        signals, outcomes = run_stock_scan(stocks, max_workers=1, fetch_workers=1,
+                                           checkpoint=checkpoint, run_id=run_id)
+        self.assertEqual(signals, [])
+        stale = {outcome['code'] for outcome in outcomes if outcome['status'] == STATUS_STALE}
+        self.assertTrue(stale)
+        self.assertEqual({item['code'] for item in summarize_outcomes(outcomes)['failed']}, set(self.codes[:12]))
+        self.assertEqual(checkpoint.load_results(run_id, final_only=True), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
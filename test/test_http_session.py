@@ -0,0 +1,129 @@
+import unittest
+import threading
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 http_session 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from http_session import (DEFAULT_POOL_SIZE, PooledSession, get_session, set_pool_size, close_pooled_session,
+                          reset_http_stats, get_http_stats)
+from market_data import AkshareProvider
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """支持keep-alive的模拟行情接口，记录客户端连接"""
+
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            StubHandler.connections.add(self.client_address)
+        body = json.dumps({'data': {'klines': ['2025-07-22,10.0,10.5,10.8,9.9,12345']}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPooledSession(unittest.TestCase):
+    """使用本地模拟服务器验证连接复用"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/api/qt/stock/kline/get'
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.connections = set()
+        reset_http_stats()
+
+    def tearDown(self):
+        close_pooled_session()
+        set_pool_size(DEFAULT_POOL_SIZE)
+
+    def test_baseline_opens_connection_per_request(self):
+        """未启用连接池时，每次请求都新建连接"""
+        for _ in range(10):
+            requests.get(self.url, timeout=5)
+        self.assertEqual(len(StubHandler.connections), 10)
+
+    def provider(self, pool_size):
+        set_pool_size(pool_size)
+        provider = AkshareProvider()
+        provider.kline_url = self.url
+        return provider
+
+    def test_sequential_requests_reuse_connection(self):
+        """数据源经由共享会话顺序请求，只建立一次连接"""
+        provider = self.provider(pool_size=1)
+        for _ in range(20):
+            df = provider.get_daily_bars('600000', '20250722', '20250722')
+            self.assertEqual(df['close'].iloc[-1], 10.5)
+
+        stats = get_http_stats()
+        self.assertEqual(len(StubHandler.connections), 1)
+        self.assertEqual(stats['requests'], 20)
+        self.assertEqual(stats['new_connections'], 1)
+        self.assertAlmostEqual(stats['reuse_ratio'], 0.95)
+        self.assertIsNotNone(stats['latency_ms'])
+
+    def test_concurrent_requests_bounded_by_pool_size(self):
+        """并发请求的连接数不超过连接池大小"""
+        provider = self.provider(pool_size=4)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: provider.get_daily_bars('600000', '20250722', '20250722'), range(40)))
+
+        stats = get_http_stats()
+        self.assertLessEqual(len(StubHandler.connections), 4)
+        self.assertEqual(stats['requests'], 40)
+        self.assertLessEqual(stats['new_connections'], 4)
+        self.assertGreaterEqual(stats['reuse_ratio'], 0.9)
+
+    def test_requests_module_untouched(self):
+        """共享会话不替换 requests.get，其他代码的请求不经过连接池、不计入统计"""
+        original_get = requests.get
+        self.provider(pool_size=2).get_daily_bars('600000', '20250722', '20250722')
+        self.assertIs(requests.get, original_get)
+        requests.get(self.url, timeout=5)
+        self.assertEqual(get_http_stats()['requests'], 1)
+        self.assertEqual(len(StubHandler.connections), 2)
+
+    def test_pool_size_change_recreates_session(self):
+        """连接池大小变化时创建新的会话，大小不变时复用"""
+        set_pool_size(2)
+        session = get_session()
+        set_pool_size(2)
+        self.assertIs(get_session(), session)
+        set_pool_size(3)
+        self.assertIsNot(get_session(), session)
+        self.assertEqual(get_session().pool_size, 3)
+
+    def test_explicit_session(self):
+        """传入的会话优先于共享会话"""
+        session = PooledSession(pool_size=1)
+        provider = AkshareProvider(session=session)
+        self.assertIs(provider.session, session)
+        self.assertIsNot(AkshareProvider().session, session)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
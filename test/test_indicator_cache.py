@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+import numpy as np
+
+# 添加当前目录到路径，以便导入 indicator_cache 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+from market_data import OfflineProvider
+from stock_signals import calculate_macd_indicators
+from indicator_cache import IndicatorCache
+
+
+class TestIndicatorCache(unittest.TestCase):
+    """测试个股指标序列缓存"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_dir = bar_cache.BAR_CACHE_DIR
+        bar_cache.BAR_CACHE_DIR = self.tmp_dir
+        self.provider = OfflineProvider()
+        for code in ('600000', '600001', '600002'):
+            bar_cache.save_bars(code, self.provider.get_daily_bars(code, '20240101', '20250722'))
+
+    def tearDown(self):
+        bar_cache.BAR_CACHE_DIR = self.old_dir
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_series_match_full_indicators(self):
+        """序列与完整模式计算的指标一致"""
+        series = IndicatorCache().get('600000')
+        full = calculate_macd_indicators(bar_cache.load_bars('600000'))
+        result = series.select(columns=['DIF', 'MACD', '底背离'])
+        self.assertEqual(len(result['dates']), len(full))
+        self.assertEqual(result['dates'][-1], full.index[-1].strftime('%Y-%m-%d'))
+        np.testing.assert_allclose(result['columns']['DIF'], full['DIF'].to_numpy(), rtol=1e-4, atol=1e-3)
+        np.testing.assert_allclose(result['columns']['MACD'], full['MACD'].to_numpy(), rtol=1e-4, atol=1e-3)
+        self.assertEqual(result['columns']['底背离'], full['底背离'].astype(bool).tolist())
+
+    def test_date_range_and_downsampling(self):
+        series = IndicatorCache().get('600000')
+        result = series.select(start='2025-06-01', end='2025-06-30', columns=['close'])
+        self.assertTrue(all('2025-06-01' <= d <= '2025-06-30' for d in result['dates']))
+        self.assertEqual(len(result['dates']), len(result['columns']['close']))
+
+        full = series.select(columns=['close', '底背离', '顶背离'])
+        sampled = series.select(columns=['close', '底背离', '顶背离'], max_points=50)
+        self.assertTrue(sampled['downsampled'])
+        self.assertEqual(len(sampled['dates']), 50)
+        # 每段取最后一个值，最后一个点保持不变；信号在降采样后不会丢失
+        self.assertEqual(sampled['dates'][-1], full['dates'][-1])
+        self.assertEqual(sampled['columns']['close'][-1], full['columns']['close'][-1])
+        self.assertEqual(sum(sampled['columns']['底背离']) > 0, sum(full['columns']['底背离']) > 0)
+
+    def test_lru_eviction_and_invalidation(self):
+        """超过容量时淘汰最久未使用的股票，日线缓存更新后重新计算"""
+        cache = IndicatorCache(max_entries=2)
+        first = cache.get('600000')
+        cache.get('600001')
+        self.assertIs(cache.get('600000'), first)
+        cache.get('600002')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(list(cache._entries), ['600000', '600002'])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        time.sleep(0.01)
+        df = self.provider.get_daily_bars('600000', '20240101', '20250723')
+        bar_cache.save_bars('600000', df)
+        os.utime(bar_cache._bar_path('600000'), (time.time() + 5, time.time() + 5))
+        refreshed = cache.get('600000')
+        self.assertIsNot(refreshed, first)
+        self.assertEqual(str(refreshed.dates[-1]), df.index[-1].strftime('%Y-%m-%d'))
+
+    def test_missing_stock(self):
+        self.assertIsNone(IndicatorCache().get('999999'))
+
+    def test_api(self):
+        """接口返回列式JSON，参数错误返回400，没有本地数据返回404"""
+        import app
+        client = app.app.test_client()
+        data = client.get('/api/stock/600001/indicators?columns=DIF,DEA&start=2025-07-01&max_points=5').get_json()
+        self.assertEqual(sorted(data['columns']), ['DEA', 'DIF'])
+        self.assertLessEqual(len(data['dates']), 5)
+        self.assertEqual(client.get('/api/stock/600001/indicators?columns=XYZ').status_code, 400)
+        self.assertEqual(client.get('/api/stock/600001/indicators?start=bad').status_code, 400)
+        for max_points in ('0', '-3', 'abc'):
+            self.assertEqual(client.get(f'/api/stock/600001/indicators?max_points={max_points}').status_code, 400)
+        self.assertEqual(client.get('/api/stock/999999/indicators').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+import tempfile
+import shutil
+import pandas as pd
+from datetime import datetime
+import sys
+import os
+from unittest import mock
+
+# 添加当前目录到路径，以便导入 stock_signals 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+from market_data import OfflineProvider, set_provider
+from stock_signals import (get_intraday_signals, get_all_stocks, compute_stock_signals, SIGNAL_NAMES, STATUS_OK,
+                           STATUS_COMPUTE_ERROR)
+
+
+class StubSpotProvider(OfflineProvider):
+    """固定实时行情的模拟数据源，记录快照请求次数"""
+
+    def __init__(self):
+        super().__init__(universe_size=20)
+        self.snapshot_calls = 0
+
+    def get_spot_snapshot(self):
+        self.snapshot_calls += 1
+        codes = self.get_index_constituents('000300')['code']
+        return pd.DataFrame({
+            'name': 'stub',
+            'open': 10.0,
+            'high': 11.0,
+            'low': 9.5,
+            'close': 10.5,
+            'volume': 12345.0
+        }, index=pd.Index(codes, name='code'))
+
+
+class TestIntradayRefresh(unittest.TestCase):
+    """测试盘中增量刷新"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = bar_cache.BAR_CACHE_DIR
+        bar_cache.BAR_CACHE_DIR = self.cache_dir
+        self.provider = StubSpotProvider()
+        set_provider(self.provider)
+        # 2025-07-22 为周二
+        self.now = datetime(2025, 7, 22, 10, 30)
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def warm_cache(self, stocks):
+        for code in stocks['code']:
+            bars = self.provider.get_daily_bars(code, '20240901', '20250721')
+            bar_cache.save_bars(code, bars)
+
+    def test_patch_last_bar(self):
+        """当日K线存在时覆盖，不存在时追加临时K线"""
+        bars = self.provider.get_daily_bars('600000', '20250701', '20250722')
+        quote = {'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 100.0}
+
+        replaced = bar_cache.patch_last_bar(bars, quote, '2025-07-22')
+        self.assertEqual(len(replaced), len(bars))
+        self.assertEqual(replaced['close'].iloc[-1], 1.5)
+        self.assertTrue(replaced['provisional'].iloc[-1])
+        self.assertFalse(replaced['provisional'].iloc[:-1].any())
+
+        appended = bar_cache.patch_last_bar(bars, quote, '2025-07-23')
+        self.assertEqual(len(appended), len(bars) + 1)
+        self.assertEqual(appended.index[-1], pd.Timestamp('2025-07-23'))
+
+        # 之前交易日遗留的临时K线不保留
+        stale = bars.assign(provisional=bars.index == pd.Timestamp('2025-07-22'))
+        patched = bar_cache.patch_last_bar(stale, quote, '2025-07-23')
+        self.assertNotIn(pd.Timestamp('2025-07-22'), patched.index)
+        self.assertEqual(list(patched['provisional']), [False] * (len(bars) - 1) + [True])
+
+    def test_intraday_refresh_uses_one_snapshot(self):
+        """一次快照请求即可刷新整个股票池"""
+        stocks = get_all_stocks()
+        self.warm_cache(stocks)
+
+        signals = get_intraday_signals(now=self.now)
+
+        self.assertEqual(self.provider.snapshot_calls, 1)
+        self.assertEqual(len(signals), len(stocks))
+        # 快照中没有的股票（如补充股票）沿用缓存中的最后一根K线
+        snapshot_codes = set(self.provider.get_index_constituents('000300')['code'])
+        for item in signals:
+            expected_date = '2025-07-22' if item['code'] in snapshot_codes else '2025-07-21'
+            self.assertEqual(item['date'], expected_date)
+            self.assertEqual(set(item['signals']), set(SIGNAL_NAMES))
+
+        cached = bar_cache.load_bars(stocks['code'].iloc[0])
+        self.assertEqual(cached.index[-1], pd.Timestamp('2025-07-22'))
+        self.assertEqual(cached['close'].iloc[-1], 10.5)
+        self.assertTrue(cached['provisional'].iloc[-1])
+
+    def test_factors_checked_once_per_day(self):
+        """盘中刷新前核对当天的复权因子，同一交易日只请求一次"""
+        stocks = get_all_stocks()
+        self.warm_cache(stocks)
+        requested = []
+        get_adjust_factors = self.provider.get_adjust_factors
+
+        def recording(code):
+            requested.append(code)
+            return get_adjust_factors(code)
+
+        self.provider.get_adjust_factors = recording
+        get_intraday_signals(now=self.now)
+        self.assertEqual(sorted(requested), sorted(stocks['code']))
+        get_intraday_signals(now=self.now)
+        self.assertEqual(len(requested), len(stocks))
+
+    def test_lagging_cache_skipped(self):
+        """缓存没有更新到上一交易日（或只有遗留的临时K线）的股票不参与盘中刷新"""
+        stocks = get_all_stocks()
+        self.warm_cache(stocks)
+        lagging, provisional = stocks['code'].iloc[0], stocks['code'].iloc[1]
+        bar_cache.save_bars(lagging, self.provider.get_daily_bars(lagging, '20240901', '20250718'))
+        bar_cache.save_bars(provisional, self.provider.get_daily_bars(provisional, '20240901', '20250721'),
+                            provisional_date='2025-07-21')
+
+        signals = get_intraday_signals(min_coverage=0.5, now=self.now)
+        codes = {item['code'] for item in signals}
+        self.assertEqual(len(signals), len(stocks) - 2)
+        self.assertNotIn(lagging, codes)
+        self.assertNotIn(provisional, codes)
+        # 覆盖率要求更高时退回完整扫描
+        self.assertIsNone(get_intraday_signals(min_coverage=1.0, now=self.now))
+
+    def test_compute_error_recorded(self):
+        """计算出错的股票记录日志和 STATUS_COMPUTE_ERROR 处理结果，不影响其他股票"""
+        stocks = get_all_stocks()
+        self.warm_cache(stocks)
+        broken = stocks['code'].iloc[0]
+
+        def failing(code, *args, **kwargs):
+            if code == broken:
+                raise ValueError('bad bars')
+            return compute_stock_signals(code, *args, **kwargs)
+
+        outcomes = []
+        with mock.patch('stock_signals.compute_stock_signals', failing), \
+                self.assertLogs('stock_analysis', 'WARNING') as logs:
+            signals = get_intraday_signals(now=self.now, outcomes=outcomes)
+        self.assertEqual(len(signals), len(stocks) - 1)
+        self.assertEqual(len(outcomes), len(stocks))
+        failed = [outcome for outcome in outcomes if outcome['status'] != STATUS_OK]
+        self.assertEqual([(o['code'], o['status'], o['error']) for o in failed],
+                         [(broken, STATUS_COMPUTE_ERROR, 'ValueError: bad bars')])
+        self.assertTrue(any(broken in line for line in logs.output))
+
+    def test_cold_cache_falls_back(self):
+        """本地缓存为空时返回None，由调用方执行完整扫描"""
+        self.assertIsNone(get_intraday_signals(now=self.now))
+        self.assertEqual(self.provider.snapshot_calls, 0)
+
+    def test_weekend_skipped(self):
+        """周末不做盘中刷新"""
+        self.assertIsNone(get_intraday_signals(now=datetime(2025, 7, 26, 10, 30)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import pandas as pd
+import numpy as np
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 stock_signals 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from stock_signals import (calculate_macd_indicators, calculate_lean_signals, pack_signal_bits,
+                           unpack_signal_bits, SIGNAL_NAMES)
+
+
+def make_bars(n, seed):
+    """生成确定性的模拟日线数据"""
+    rng = np.random.default_rng(seed)
+    close = (10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))).round(2)
+    index = pd.bdate_range('2024-09-02', periods=n, name='date')
+    return pd.DataFrame({
+        'open': close,
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': rng.integers(100000, 1000000, n).astype(float)
+    }, index=index)
+
+
+class TestLeanSignals(unittest.TestCase):
+    """测试精简模式与完整模式的信号一致性"""
+
+    def test_signals_match_full_mode(self):
+        """精简模式的九个信号应与完整模式逐日一致"""
+        # 种子12同时包含主升和顶成立信号
+        for n, seed in [(130, 1), (300, 12), (400, 7)]:
+            with self.subTest(n=n, seed=seed):
+                bars = make_bars(n, seed)
+                full = calculate_macd_indicators(bars.copy())
+                lean = calculate_lean_signals(bars)
+                for name in SIGNAL_NAMES:
+                    np.testing.assert_array_equal(full[name].astype(bool).to_numpy(),
+                                                  lean[name].to_numpy(), err_msg=name)
+
+    def test_compact_dtypes(self):
+        """精简模式只输出请求的列，且使用紧凑类型"""
+        bars = make_bars(200, 3)
+        lean = calculate_lean_signals(bars, outputs=['close', 'M1', '底背离'])
+
+        self.assertEqual(list(lean.columns), ['close', 'M1', '底背离'])
+        self.assertEqual(lean['close'].dtype, np.float32)
+        self.assertEqual(lean['M1'].dtype, np.int16)
+        self.assertEqual(lean['底背离'].dtype, bool)
+        self.assertTrue(lean.index.equals(bars.index))
+
+    def test_unknown_output(self):
+        """请求未知列时报错"""
+        with self.assertRaises(ValueError):
+            calculate_lean_signals(make_bars(150, 0), outputs=['CH2'])
+
+    def test_signal_bits_roundtrip(self):
+        """信号位图可以还原为信号字典"""
+        lean = calculate_lean_signals(make_bars(300, 12))
+        bits = pack_signal_bits(lean)
+
+        self.assertEqual(bits.dtype, np.uint16)
+        for i in range(len(lean)):
+            expected = {name: bool(lean[name].iloc[i]) for name in SIGNAL_NAMES}
+            self.assertEqual(unpack_signal_bits(bits[i]), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import tempfile
+import shutil
+import logging
+import subprocess
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 logger_config 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logger_config
+from logger_config import (DailyFileHandler, log_stock_analysis, flush_logging, stop_logging, get_log_queue,
+                           init_worker_logging)
+
+
+def log_from_worker(marker):
+    """在工作进程中记录日志"""
+    log_stock_analysis(f"工作进程日志 {marker}")
+    # 工作进程不能停止主进程的监听线程
+    stop_logging()
+    return os.getpid()
+
+
+class TestDailyFileHandler(unittest.TestCase):
+    """测试按日期切换日志文件"""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def make_record(self, when, message):
+        record = logging.LogRecord('stock_analysis', logging.INFO, __file__, 1, message, None, None)
+        record.created = when.timestamp()
+        return record
+
+    def test_rollover_at_midnight(self):
+        handler = DailyFileHandler(self.log_dir)
+        handler.setFormatter(logging.Formatter(logger_config.LOG_FORMAT, datefmt=logger_config.LOG_DATE_FORMAT))
+        handler.emit(self.make_record(datetime(2025, 7, 21, 23, 59, 59), '前一天'))
+        handler.emit(self.make_record(datetime(2025, 7, 22, 0, 0, 1), '第二天'))
+        handler.close()
+
+        with open(os.path.join(self.log_dir, '2025-07-21.log'), encoding='utf-8') as f:
+            first = f.read()
+        with open(os.path.join(self.log_dir, '2025-07-22.log'), encoding='utf-8') as f:
+            second = f.read()
+        self.assertIn('2025-07-21 23:59:59 - stock_analysis - INFO - 前一天', first)
+        self.assertNotIn('第二天', first)
+        self.assertIn('2025-07-22 00:00:01 - stock_analysis - INFO - 第二天', second)
+
+
+class TestQueueLogging(unittest.TestCase):
+    """测试日志经由队列写入"""
+
+    def read_today_log(self):
+        flush_logging()
+        path = logger_config._listener.handlers[0].baseFilename
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_loggers_use_queue_handler(self):
+        logger = logger_config.get_unified_logger('stock_analysis')
+        self.assertEqual([type(handler) for handler in logger.handlers], [logging.handlers.QueueHandler])
+
+    def test_worker_processes_log_through_main_listener(self):
+        """进程池工作进程的日志由主进程的监听线程写入同一个文件"""
+        log_stock_analysis('初始化日志队列')
+        markers = [uuid.uuid4().hex for _ in range(4)]
+        with ProcessPoolExecutor(max_workers=2, initializer=init_worker_logging,
+                                 initargs=(get_log_queue(),)) as executor:
+            list(executor.map(log_from_worker, markers))
+        log_stock_analysis(f"主进程日志 {markers[0]}")
+
+        content = self.read_today_log()
+        for marker in markers:
+            self.assertIn(f"stock_analysis - INFO - 工作进程日志 {marker}", content)
+        self.assertIn(f"主进程日志 {markers[0]}", content)
+
+    def test_spawned_workers_use_main_queue(self):
+        """spawn启动的工作进程重新导入模块，经由initializer同样写入主进程的队列"""
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        markers = [uuid.uuid4().hex for _ in range(4)]
+        # 主进程的日志目录为 main/；工作进程自行启动监听线程时会写到默认的 log/
+        script = '\n'.join([
+            'import multiprocessing, sys',
+            'from concurrent.futures import ProcessPoolExecutor',
+            'import logger_config',
+            'from logger_config import get_log_queue, init_worker_logging, log_stock_analysis',
+            "if __name__ == '__main__':",
+            "    logger_config.LOG_DIR = 'main'",
+            "    multiprocessing.set_start_method('spawn')",
+            '    with ProcessPoolExecutor(max_workers=2, initializer=init_worker_logging,',
+            '                             initargs=(get_log_queue(),)) as executor:',
+            '        list(executor.map(log_stock_analysis, sys.argv[1:]))',
+        ])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+        with open(os.path.join(work_dir, 'spawn_pool.py'), 'w', encoding='utf-8') as f:
+            f.write(script)
+        subprocess.run([sys.executable, 'spawn_pool.py'] + markers, cwd=work_dir, env=env, check=True,
+                       capture_output=True, timeout=120)
+
+        self.assertFalse(os.path.exists(os.path.join(work_dir, 'log')))
+        content = ''.join(open(os.path.join(work_dir, 'main', name), encoding='utf-8').read()
+                          for name in os.listdir(os.path.join(work_dir, 'main')))
+        for marker in markers:
+            self.assertIn(f"stock_analysis - INFO - {marker}", content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 metrics 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import metrics
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from metrics import MetricsRegistry, REGISTRY, counter, histogram, export_metrics, render_metrics
+from stock_signals import run_stock_scan, STATUS_OK
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """测试指标注册表"""
+
+    def test_render_prometheus_text(self):
+        registry = MetricsRegistry()
+        requests = registry.counter('app_requests_total', '请求次数', labels=('route',))
+        latency = registry.histogram('app_latency_seconds', '耗时', buckets=(0.1, 1))
+        registry.gauge('app_age_seconds', '快照时间').set_function(lambda: 12.5)
+        requests.inc(route='/api/signals')
+        requests.inc(2, route='/api/"x"')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(3)
+
+        text = registry.render()
+        self.assertIn('# TYPE app_requests_total counter', text)
+        self.assertIn('app_requests_total{route="/api/signals"} 1', text)
+        self.assertIn('app_requests_total{route="/api/\\"x\\""} 2', text)
+        self.assertIn('app_latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('app_latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('app_latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('app_latency_seconds_sum 3.55', text)
+        self.assertIn('app_latency_seconds_count 3', text)
+        self.assertIn('app_age_seconds 12.5', text)
+
+    def test_drain_and_merge(self):
+        """工作进程的增量合并到主进程后数值累加，取出后工作进程清零"""
+        worker, main = MetricsRegistry(), MetricsRegistry()
+        for registry in (worker, main):
+            registry.counter('jobs_total', '任务数', labels=('status',))
+            registry.histogram('job_seconds', '耗时', buckets=(1,))
+        main.counter('jobs_total', '任务数', labels=('status',)).inc(status='ok')
+        worker.counter('jobs_total', '任务数', labels=('status',)).inc(3, status='ok')
+        worker.histogram('job_seconds', '耗时', buckets=(1,)).observe(0.5)
+
+        main.merge(worker.drain())
+        self.assertEqual(main.get('jobs_total').get(status='ok'), 4)
+        self.assertEqual(main.get('job_seconds').get_count(), 1)
+        self.assertEqual(worker.drain(), {})
+
+    def test_forked_child_starts_from_zero(self):
+        registry = MetricsRegistry()
+        jobs = registry.counter('jobs_total', '任务数')
+        jobs.inc(5)
+        registry._pid = -1  # 模拟fork出的子进程
+        jobs.inc()
+        self.assertEqual(jobs.get(), 1)
+
+    def test_label_mismatch(self):
+        registry = MetricsRegistry()
+        jobs = registry.counter('jobs_total', '任务数', labels=('status',))
+        with self.assertRaises(ValueError):
+            jobs.inc(route='x')
+        with self.assertRaises(ValueError):
+            registry.histogram('jobs_total', '任务数')
+
+
+class TestExportedMetrics(unittest.TestCase):
+    """测试扫描进程通过共享目录导出指标"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_dir = metrics.METRICS_DIR
+        metrics.METRICS_DIR = self.tmp_dir
+
+    def tearDown(self):
+        metrics.METRICS_DIR = self.old_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_export_accumulates(self):
+        """导出的增量累加到文件中，/metrics 输出本进程的数值加上导出的累计值"""
+        jobs = counter('test_exported_jobs_total', '任务数', labels=('status',))
+        latency = histogram('test_exported_seconds', '耗时', buckets=(1,))
+        jobs.inc(2, status='ok')
+        latency.observe(0.5)
+        export_metrics('scan')
+        # 导出后本进程清零，再次导出只累加新的增量
+        self.assertEqual(jobs.get(status='ok'), 0)
+        jobs.inc(3, status='ok')
+        export_metrics('scan')
+        jobs.inc(status='ok')
+
+        text = render_metrics()
+        self.assertIn('test_exported_jobs_total{status="ok"} 6', text)
+        self.assertIn('test_exported_seconds_count 1', text)
+        self.assertIn('test_exported_jobs_total{status="ok"} 1', render_metrics(include_exported=False))
+        self.assertEqual(jobs.get(status='ok'), 1)
+
+        # 损坏的文件跳过
+        with open(os.path.join(self.tmp_dir, 'broken.json'), 'w') as f:
+            f.write('{')
+        self.assertIn('test_exported_jobs_total{status="ok"} 6', render_metrics())
+
+
+class TestScanMetrics(unittest.TestCase):
+    """测试扫描过程中的指标在进程池之间汇总"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.cache_dir
+        stock_signals.FETCH_DELAY = 0
+        set_provider(OfflineProvider(universe_size=6))
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.cache_dir)
+
+    def test_compute_metrics_aggregated_across_workers(self):
+        compute = REGISTRY.get('stock_compute_seconds')
+        fetch = REGISTRY.get('stock_fetch_latency_seconds')
+        computed_before = compute.get_count(mode='lean')
+        fetched_before = fetch.get_count(status='ok')
+
+        stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(6)]
+        _, outcomes = run_stock_scan(stock_list, max_workers=2, fetch_workers=2)
+        ok = sum(1 for outcome in outcomes if outcome['status'] == STATUS_OK)
+
+        self.assertEqual(compute.get_count(mode='lean') - computed_before, ok)
+        self.assertEqual(fetch.get_count(status='ok') - fetched_before, 6)
+
+    def test_metrics_endpoint(self):
+        import app
+        client = app.app.test_client()
+        client.get('/api/refresh/status')
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{route="/api/refresh/status",method="GET",status="200"}',
+                      text)
+        self.assertIn('# TYPE stock_fetch_latency_seconds histogram', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
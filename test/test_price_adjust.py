@@ -0,0 +1,168 @@
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到路径，以便导入 bar_cache 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import stock_signals
+from bar_cache import adjust_bars, merge_factors, load_bars, save_bars
+from market_data import OfflineProvider, set_provider
+from stock_signals import fetch_stock_data, STATUS_OK
+from trading_calendar import TradingCalendar, get_calendar, set_calendar
+
+SPLIT_DATE = pd.Timestamp('2025-06-02')
+
+
+def factor_table(rows):
+    return pd.DataFrame({'factor': [factor for _, factor in rows]},
+                        index=pd.DatetimeIndex([pd.Timestamp(day) for day, _ in rows], name='date'))
+
+
+class SplitProvider(OfflineProvider):
+    """SPLIT_DATE 10送10的模拟数据源：不复权价格在该日减半，前复权价格与离线数据源一致"""
+
+    def __init__(self):
+        super().__init__(universe_size=3)
+        self.bar_requests = []
+        self.factor_requests = 0
+        self.factors = [('2020-01-01', 1.0), (SPLIT_DATE, 2.0)]
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.bar_requests.append((start_date, end_date))
+        df = super().get_daily_bars(stock_code, start_date, end_date)
+        df.loc[df.index < SPLIT_DATE, bar_cache.PRICE_COLUMNS] *= 2
+        return df
+
+    def get_adjust_factors(self, stock_code):
+        self.factor_requests += 1
+        return factor_table(self.factors)
+
+
+class TestAdjustBars(unittest.TestCase):
+    """测试读取时复权"""
+
+    def setUp(self):
+        dates = pd.DatetimeIndex(['2025-05-29', '2025-05-30', '2025-06-02', '2025-06-03'], name='date')
+        self.raw = pd.DataFrame({'open': [20.0, 20.4, 10.1, 10.3], 'high': [20.6, 20.8, 10.5, 10.6],
+                                 'low': [19.8, 20.0, 10.0, 10.1], 'close': [20.2, 20.4, 10.3, 10.5],
+                                 'volume': [1e5, 2e5, 4e5, 3e5]}, index=dates)
+        self.factors = factor_table([('2020-01-01', 1.0), ('2025-06-02', 2.0)])
+
+    def test_qfq_hfq_none(self):
+        qfq = adjust_bars(self.raw, self.factors, 'qfq')
+        np.testing.assert_allclose(qfq['close'], [10.1, 10.2, 10.3, 10.5])
+        # 成交量不复权，原数据不变
+        np.testing.assert_array_equal(qfq['volume'], self.raw['volume'])
+        self.assertEqual(self.raw['close'].iloc[0], 20.2)
+
+        hfq = adjust_bars(self.raw, self.factors, 'hfq')
+        np.testing.assert_allclose(hfq['close'], [20.2, 20.4, 20.6, 21.0])
+        self.assertIs(adjust_bars(self.raw, self.factors, 'none'), self.raw)
+        self.assertIs(adjust_bars(self.raw, None, 'qfq'), self.raw)
+
+    def test_qfq_base_date(self):
+        """以指定日期为基准前复权，该日价格与不复权价格相同"""
+        qfq = adjust_bars(self.raw, self.factors, 'qfq', base_date='2025-05-30')
+        np.testing.assert_allclose(qfq['close'], [20.2, 20.4, 20.6, 21.0])
+
+    def test_merge_factors(self):
+        fetched = factor_table([('2020-01-01', 1.0), ('2025-06-02', 2.0), ('2025-07-01', 2.1)])
+        merged, changed = merge_factors(self.factors, fetched)
+        self.assertEqual(changed, 1)
+        self.assertEqual(list(merged['factor']), [1.0, 2.0, 2.1])
+        self.assertEqual(merge_factors(merged, fetched)[1], 0)
+
+
+class TestIncrementalFetch(unittest.TestCase):
+    """测试缓存不复权日线后的增量请求"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, bar_cache.PRICE_ADJUST, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.tmp_dir
+        bar_cache.PRICE_ADJUST = 'qfq'
+        stock_signals.FETCH_DELAY = 0
+        self.provider = SplitProvider()
+        set_provider(self.provider)
+        set_calendar(TradingCalendar(pd.bdate_range('2020-01-01', '2030-12-31').date))
+        self.today = pd.Timestamp.now().normalize()
+
+    def tearDown(self):
+        set_calendar(None)
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, bar_cache.PRICE_ADJUST, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def expected_close(self, df):
+        return OfflineProvider().get_daily_bars('600000', '20200101', self.today.strftime('%Y%m%d'))['close'] \
+            .reindex(df.index)
+
+    def test_fetch_only_new_bars(self):
+        """已有缓存时只请求缓存之后的K线，返回前复权价格，缓存中保存不复权价格"""
+        cached_until = self.today - pd.Timedelta(days=10)
+        bars = self.provider.get_daily_bars('600000', '20240901', cached_until.strftime('%Y%m%d'))
+        save_bars('600000', bars)
+        self.provider.bar_requests.clear()
+
+        df, outcome = fetch_stock_data('600000')
+        self.assertEqual(outcome['status'], STATUS_OK)
+        self.assertEqual(len(self.provider.bar_requests), 1)
+        start = pd.Timestamp(self.provider.bar_requests[0][0])
+        self.assertEqual(start, bars.index[-1] + pd.Timedelta(days=1))
+        self.assertEqual(df.index[0], bars.index[0])
+        self.assertGreater(df.index[-1], bars.index[-1])
+        np.testing.assert_allclose(df['close'], self.expected_close(df))
+
+        raw = load_bars('600000')
+        self.assertEqual(raw.loc[raw.index < SPLIT_DATE, 'close'].iloc[-1],
+                         bars.loc[bars.index < SPLIT_DATE, 'close'].iloc[-1])
+        self.assertEqual(self.provider.factor_requests, 1)
+
+    def test_factor_request_counts_as_attempt(self):
+        """日线缓存已是最新时，核对复权因子的请求仍计入尝试次数"""
+        finalized = get_calendar().latest_finalized_day()
+        save_bars('600000', self.provider.get_daily_bars('600000', '20240901', finalized.strftime('%Y%m%d')))
+        stock_signals.get_adjust_factors('600000')
+        checked_at = time.time() - 86400 * 3
+        os.utime(bar_cache._factor_path('600000'), (checked_at, checked_at))
+        self.provider.bar_requests.clear()
+
+        _, outcome = fetch_stock_data('600000')
+        self.assertEqual(self.provider.bar_requests, [])
+        self.assertEqual(self.provider.factor_requests, 2)
+        self.assertEqual(outcome['attempts'], 1)
+        # 同一天再次读取不再请求
+        self.assertEqual(fetch_stock_data('600000')[1]['attempts'], 0)
+
+    def test_new_factor_without_redownload(self):
+        """新增除权除息只请求新的复权因子行，不重新下载历史K线"""
+        df, _ = fetch_stock_data('600000')
+        self.assertEqual(self.provider.bar_requests[0][0], '20240901')
+
+        # 次日核对复权因子时多了一次分红
+        dividend_date = df.index[-5]
+        self.provider.factors.append((dividend_date, 2.2))
+        checked_at = time.time() - 86400 * 3
+        os.utime(bar_cache._factor_path('600000'), (checked_at, checked_at))
+        self.provider.bar_requests.clear()
+
+        adjusted, _ = fetch_stock_data('600000')
+        self.assertTrue(all(start > '20240901' for start, _ in self.provider.bar_requests))
+        self.assertEqual(self.provider.factor_requests, 2)
+        self.assertEqual(len(bar_cache.load_factors('600000')), 3)
+        before = adjusted.index < dividend_date
+        np.testing.assert_allclose(adjusted.loc[before, 'close'],
+                                   df.loc[before, 'close'] * 2.0 / 2.2)
+        np.testing.assert_allclose(adjusted.loc[~before, 'close'], df.loc[~before, 'close'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 profiling 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import profiling
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from profiling import StageTimer
+from stock_signals import run_stock_scan, process_single_stock
+
+
+class TestProfiling(unittest.TestCase):
+    """测试扫描剖析模式"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        stock_signals.FETCH_DELAY = 0
+        set_provider(OfflineProvider(universe_size=6))
+
+    def tearDown(self):
+        profiling.disable()
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disabled_by_default(self):
+        timer = StageTimer()
+        timer.lap('不记录')
+        self.assertNotIn('不记录', profiling.drain_stages())
+        df, _ = stock_signals.fetch_stock_data('600000')
+        computed = process_single_stock(('600000', '模拟股票1', df, True, None))
+        self.assertIsNone(computed['profile'])
+
+    def test_report_merges_workers(self):
+        """计算进程的剖析数据合并到同一份报告，主进程的行情请求阶段一并计入"""
+        profiling.enable()
+        stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(6)]
+        _, outcomes = run_stock_scan(stock_list, max_workers=2, fetch_workers=2)
+        computed = sum(1 for outcome in outcomes if outcome['status'] == stock_signals.STATUS_OK)
+
+        path, prof_path = profiling.write_report(os.path.join(self.tmp_dir, 'profile.txt'), top=10)
+        with open(path, encoding='utf-8') as f:
+            report = f.read()
+        self.assertTrue(os.path.exists(prof_path))
+        for stage in ('行情请求', '精简-基础MACD', '精简-高低点', '精简-背离与信号'):
+            self.assertIn(stage, report)
+        self.assertIn('calculate_lean_signals', report)
+        self.assertEqual(sum(profiling._collector.tasks_by_pid.values()), computed)
+        # 日线以外的周期（周线、月线）也用精简模式计算
+        self.assertEqual(profiling._collector.stages['精简-基础MACD'][0],
+                         computed * len(stock_signals.SIGNAL_TIMEFRAMES))
+        self.assertEqual(profiling._collector.stages['行情请求'][0], 6)
+        self.assertIsNotNone(profiling._collector.stages['精简-高低点'][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import tempfile
+import shutil
+import time
+import multiprocessing
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 refresh_lease 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from refresh_lease import RefreshLease
+
+
+def try_refresh(lease_path, result_path, barrier):
+    """模拟一个副本：所有进程同时尝试刷新，只有拿到租约的进程执行扫描"""
+    barrier.wait()
+    with RefreshLease(lease_path).hold() as is_leader:
+        if is_leader:
+            with open(result_path, 'a') as f:
+                f.write(f'{os.getpid()}\n')
+            # 持有租约期间其他进程都应获取失败
+            time.sleep(0.5)
+
+
+class TestRefreshLease(unittest.TestCase):
+    """测试跨进程刷新租约"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lease_path = os.path.join(self.tmp_dir, 'refresh.lease')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_only_one_holder(self):
+        """租约有效期内其他持有者获取失败，释放后可以获取"""
+        first = RefreshLease(self.lease_path, owner='a')
+        second = RefreshLease(self.lease_path, owner='b')
+        self.assertTrue(first.acquire())
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertEqual(second.holder()['owner'], 'a')
+
+        first.release()
+        self.assertIsNone(first.holder())
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.renew())
+
+    def test_expired_lease_taken_over(self):
+        """持有者崩溃未释放时，租约过期后可被接管"""
+        crashed = RefreshLease(self.lease_path, owner='a', ttl=0.2)
+        self.assertTrue(crashed.acquire())
+        other = RefreshLease(self.lease_path, owner='b')
+        self.assertFalse(other.acquire())
+        time.sleep(0.3)
+        self.assertTrue(other.acquire())
+        # 被接管后原持有者的释放不影响新的持有者
+        crashed.release()
+        self.assertEqual(other.holder()['owner'], 'b')
+
+    def test_hold_renews_lease(self):
+        """持有期间后台续约，超过ttl也不会被接管"""
+        lease = RefreshLease(self.lease_path, owner='a', ttl=0.3)
+        with lease.hold() as is_leader:
+            self.assertTrue(is_leader)
+            time.sleep(0.6)
+            self.assertFalse(RefreshLease(self.lease_path, owner='b').acquire())
+        self.assertIsNone(lease.holder())
+
+    def test_lost_lease_detected(self):
+        """租约被其他进程接管后续约失败，is_held 返回False"""
+        lease = RefreshLease(self.lease_path, owner='a', ttl=0.3)
+        with lease.hold() as is_leader:
+            self.assertTrue(is_leader)
+            self.assertTrue(lease.is_held())
+            # 模拟进程停顿期间租约过期并被接管
+            lease.release()
+            self.assertTrue(RefreshLease(self.lease_path, owner='b').acquire())
+            self.assertFalse(lease.is_held())
+            time.sleep(0.3)
+            self.assertTrue(lease._lost.is_set())
+            self.assertFalse(lease.is_held())
+        self.assertEqual(RefreshLease(self.lease_path).holder()['owner'], 'b')
+
+    def test_concurrent_processes_elect_one_leader(self):
+        """多个进程同时刷新时只有一个进程执行扫描"""
+        result_path = os.path.join(self.tmp_dir, 'leaders.txt')
+        barrier = multiprocessing.Barrier(4)
+        processes = [multiprocessing.Process(target=try_refresh, args=(self.lease_path, result_path, barrier))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=10)
+            self.assertEqual(process.exitcode, 0)
+
+        with open(result_path) as f:
+            self.assertEqual(len(f.read().split()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 stock_signals 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import scan_checkpoint
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from scan_checkpoint import ScanCheckpoint, get_checkpoint
+from stock_signals import get_all_stock_signals, get_all_stocks, retry_failed_stocks, STATUS_OK
+
+
+class CountingProvider(OfflineProvider):
+    """记录日线请求的模拟数据源"""
+
+    def __init__(self):
+        super().__init__(universe_size=8)
+        self.requested = []
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.requested.append(stock_code)
+        return super().get_daily_bars(stock_code, start_date, end_date)
+
+
+class FlakyProvider(CountingProvider):
+    """指定股票的日线请求先失败若干次"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = dict(failures)
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        if self.failures.get(stock_code, 0) > 0:
+            self.failures[stock_code] -= 1
+            raise ConnectionError('429 Too Many Requests')
+        return super().get_daily_bars(stock_code, start_date, end_date)
+
+
+class TestScanCheckpoint(unittest.TestCase):
+    """测试扫描检查点与续跑"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        stock_signals.FETCH_DELAY = 0
+        self.checkpoint = ScanCheckpoint(os.path.join(self.tmp_dir, 'checkpoint.db'))
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_and_progress(self):
+        """逐条写入的结果可以被其他读者看到"""
+        run_id = self.checkpoint.start_run('2025-07-22', 3)
+        self.checkpoint.record(run_id, {'code': '600000', 'name': 'a', 'status': 'ok', 'attempts': 1},
+                               {'code': '600000', 'close': 10.0})
+        self.checkpoint.record(run_id, {'code': '600001', 'name': 'b', 'status': 'fetch-error', 'attempts': 3,
+                                        'error': 'timeout'})
+
+        reader = ScanCheckpoint(self.checkpoint.path)
+        progress = reader.get_progress()
+        self.assertEqual(progress['run_id'], run_id)
+        self.assertEqual(progress['status'], 'running')
+        self.assertEqual(progress['done'], 2)
+        self.assertEqual(progress['by_status'], {'ok': 1, 'fetch-error': 1})
+
+        signals, outcomes = reader.load_results(run_id, final_only=True)
+        self.assertEqual(signals, [{'code': '600000', 'close': 10.0}])
+        self.assertEqual([o['code'] for o in outcomes], ['600000'])
+
+    def test_shared_instance(self):
+        """默认路径的检查点在进程内复用，路径改变时重新创建"""
+        old_path = scan_checkpoint.DEFAULT_CHECKPOINT_PATH
+        scan_checkpoint.DEFAULT_CHECKPOINT_PATH = self.checkpoint.path
+        try:
+            shared = get_checkpoint()
+            self.assertIs(get_checkpoint(), shared)
+            run_id = self.checkpoint.start_run('2025-07-22', 1)
+            self.assertEqual(shared.get_progress()['run_id'], run_id)
+
+            scan_checkpoint.DEFAULT_CHECKPOINT_PATH = os.path.join(self.tmp_dir, 'other.db')
+            self.assertIsNot(get_checkpoint(), shared)
+            self.assertIsNone(get_checkpoint().get_progress())
+        finally:
+            scan_checkpoint.DEFAULT_CHECKPOINT_PATH = old_path
+
+    def test_resume_only_unfinished_runs(self):
+        """未完成的扫描会被续跑，已完成的扫描不会"""
+        run_id = self.checkpoint.start_run('2025-07-22', 3)
+        self.assertEqual(self.checkpoint.start_run('2025-07-22', 3), run_id)
+        self.assertNotEqual(self.checkpoint.start_run('2025-07-23', 3), run_id)
+
+        self.checkpoint.finish_run(run_id)
+        self.assertNotEqual(self.checkpoint.start_run('2025-07-22', 3), run_id)
+
+    def test_interrupted_scan_resumes_remaining(self):
+        """中断的扫描续跑时只请求剩余的股票"""
+        provider = CountingProvider()
+        set_provider(provider)
+        stocks = get_all_stocks()
+        codes = list(stocks['code'])
+
+        # 模拟上一次扫描在完成前3只股票后中断
+        run_id = self.checkpoint.start_run('2025-07-22', len(codes))
+        for code in codes[:3]:
+            self.checkpoint.record(run_id, {'code': code, 'name': code, 'status': 'ok', 'attempts': 1},
+                                   {'code': code, 'name': code, 'close': 1.0, 'signals': {}})
+
+        signals, outcomes = get_all_stock_signals(return_outcomes=True, trade_date='2025-07-22',
+                                                  checkpoint=self.checkpoint, max_workers=2, fetch_workers=2)
+
+        self.assertEqual(sorted(provider.requested), sorted(codes[3:]))
+        self.assertEqual([o['code'] for o in outcomes], codes)
+        self.assertEqual([s['code'] for s in signals[:3]], codes[:3])
+        self.assertEqual(len(signals), len(codes))
+
+        progress = self.checkpoint.get_progress(run_id)
+        self.assertEqual(progress['status'], 'completed')
+        self.assertEqual(progress['done'], len(codes))
+
+    def test_retry_recorded_in_same_run(self):
+        """重试成功的股票写回原扫描，进度中不再是失败状态"""
+        # 600001 在第一次扫描中用完3次尝试，重试时成功
+        set_provider(FlakyProvider({'600001': 3}))
+        signals, outcomes, run_id = get_all_stock_signals(return_outcomes=True, return_run_id=True,
+                                                          trade_date='2025-07-22', checkpoint=self.checkpoint,
+                                                          max_workers=2, fetch_workers=2)
+        self.assertEqual(self.checkpoint.get_progress(run_id)['by_status'].get('fetch-error'), 1)
+
+        retried, outcomes = retry_failed_stocks(outcomes, max_rounds=1, backoff=0, max_workers=2, fetch_workers=2,
+                                                checkpoint=self.checkpoint, run_id=run_id, end_date='20250722')
+        self.assertEqual([item['code'] for item in retried], ['600001'])
+        progress = self.checkpoint.get_progress(run_id)
+        self.assertEqual(progress['by_status'], {STATUS_OK: len(outcomes)})
+        done_signals, _ = self.checkpoint.load_results(run_id, final_only=True)
+        self.assertIn('600001', {item['code'] for item in done_signals})
+
+    def test_retry_rounds_validated(self):
+        """/api/refresh/retry 的重试轮数超出范围时返回400"""
+        import app
+        client = app.app.test_client()
+        for rounds in ('0', '-1', '6', '1000', 'x'):
+            self.assertEqual(client.post(f'/api/refresh/retry?rounds={rounds}').status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
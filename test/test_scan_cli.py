@@ -0,0 +1,140 @@
+import unittest
+import tempfile
+import shutil
+import json
+import io
+import contextlib
+from datetime import datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 scan 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import refresh_lease
+import scan_checkpoint
+import accuracy_stats
+import metrics
+import trading_calendar
+import signal_store
+import stock_signals
+import scan
+from market_data import OfflineProvider, set_provider
+from refresh_lease import RefreshLease
+from scan_checkpoint import ScanCheckpoint
+from trading_calendar import get_calendar
+
+
+class TestScanCli(unittest.TestCase):
+    """测试收盘后批量扫描命令行入口"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY,
+                             refresh_lease.DEFAULT_LEASE_PATH, scan_checkpoint.DEFAULT_CHECKPOINT_PATH,
+                             signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH,
+                             accuracy_stats.DEFAULT_STATS_PATH, trading_calendar.CALENDAR_DIR, metrics.METRICS_DIR)
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        refresh_lease.DEFAULT_LEASE_PATH = os.path.join(self.tmp_dir, 'refresh.lease')
+        scan_checkpoint.DEFAULT_CHECKPOINT_PATH = os.path.join(self.tmp_dir, 'checkpoint.db')
+        signal_store.HISTORY_DIR = os.path.join(self.tmp_dir, 'history')
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'history', 'stock_signals.json')
+        accuracy_stats.DEFAULT_STATS_PATH = os.path.join(self.tmp_dir, 'accuracy_stats.db')
+        trading_calendar.CALENDAR_DIR = self.tmp_dir
+        metrics.METRICS_DIR = os.path.join(self.tmp_dir, 'metrics')
+        set_provider(OfflineProvider(universe_size=6))
+        self.codes = ','.join(f"{600000 + i:06d}" for i in range(6))
+
+    def tearDown(self):
+        set_provider(None)
+        (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY,
+         refresh_lease.DEFAULT_LEASE_PATH, scan_checkpoint.DEFAULT_CHECKPOINT_PATH,
+         signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH,
+         accuracy_stats.DEFAULT_STATS_PATH, trading_calendar.CALENDAR_DIR, metrics.METRICS_DIR) = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            code = scan.main(['--universe', self.codes, '--fetch-delay', '0',
+                              '--workers', '2', '--fetch-workers', '2'] + list(argv))
+        return code, (json.loads(output.getvalue()) if output.getvalue() else None)
+
+    def test_scan_today_publishes_snapshot(self):
+        """扫描当天时发布快照和历史信号，并输出统计"""
+        code, report = self.run_cli()
+        self.assertEqual(code, scan.EXIT_OK)
+        self.assertEqual(report['total'], 6)
+        self.assertEqual(report['signals'], 6)
+        self.assertGreater(report['stocks_per_second'], 0)
+
+        signals, _, _, version = signal_store.load_snapshot()
+        self.assertEqual(version, 1)
+        self.assertEqual(len(signals), 6)
+        # 默认扫描收盘数据已定型的最近一个交易日
+        day = get_calendar().latest_finalized_day().strftime('%Y%m%d')
+        self.assertEqual(report['trade_date'], get_calendar().latest_finalized_day().strftime('%Y-%m-%d'))
+        self.assertEqual(report['history'], os.path.join(signal_store.HISTORY_DIR, f'signals_{day}.csv'))
+        self.assertTrue(os.path.exists(report['history']))
+        # 扫描的指标导出到共享目录，由Web进程的 /metrics 汇总输出
+        self.assertIn('stock_scan_outcomes_total{status="ok"} 6', metrics.render_metrics())
+
+    def test_scan_past_date(self):
+        """扫描历史日期时行情截止到该日，不覆盖当前快照"""
+        code, report = self.run_cli('--date', '2024-12-31')
+        self.assertEqual(code, scan.EXIT_OK)
+        self.assertNotIn('snapshot', report)
+        self.assertFalse(os.path.exists(signal_store.SNAPSHOT_PATH))
+        self.assertTrue(report['history'].endswith('signals_20241231.csv'))
+        progress = ScanCheckpoint().get_progress()
+        signals, _ = ScanCheckpoint().load_results(progress['run_id'])
+        self.assertEqual(progress['trade_date'], '2024-12-31')
+        self.assertEqual({signal['date'] for signal in signals}, {'2024-12-31'})
+        # 历史日期的截断数据不写入日线缓存（复权因子与截止日期无关，照常缓存）
+        self.assertFalse(os.path.exists(bar_cache.BAR_CACHE_DIR) and
+                         [f for f in os.listdir(bar_cache.BAR_CACHE_DIR) if f.endswith('.csv')])
+
+    def test_non_trading_day_not_saved(self):
+        """非交易日不写历史信号"""
+        code, report = self.run_cli('--date', '2024-12-28')
+        self.assertEqual(code, scan.EXIT_OK)
+        self.assertIsNone(report['history'])
+        self.assertEqual(report['history_rows'], 0)
+        self.assertFalse(os.path.exists(signal_store.HISTORY_DIR) and os.listdir(signal_store.HISTORY_DIR))
+
+    def test_profile_report(self):
+        """--profile 写出剖析报告，报告路径记录在统计中"""
+        path = os.path.join(self.tmp_dir, 'profile.txt')
+        code, report = self.run_cli('--no-snapshot', '--profile', path)
+        self.assertEqual(code, scan.EXIT_OK)
+        self.assertEqual(report['profile'], path)
+        self.assertTrue(os.path.exists(report['profile_stats']))
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('6 只股票，精简模式', content)
+        self.assertIn('精简-基础MACD', content)
+
+    def test_lease_lost_not_published(self):
+        """发布前发现租约已被其他进程接管时不发布结果"""
+        lease = RefreshLease()
+        self.assertTrue(lease.acquire())
+        lease.release()
+        self.assertTrue(RefreshLease(owner='other').acquire())
+        args = scan.parse_args(['--universe', self.codes, '--workers', '2', '--fetch-workers', '2'])
+        report = scan.run_scan(args, datetime.now().date(), True, lease=lease)
+        self.assertTrue(report['lease_lost'])
+        self.assertGreater(report['signals'], 0)
+        self.assertFalse(os.path.exists(signal_store.SNAPSHOT_PATH))
+        self.assertNotIn('history', report)
+
+    def test_busy_when_other_process_refreshing(self):
+        """其他进程持有刷新租约时跳过本次扫描"""
+        RefreshLease(owner='web').acquire()
+        code, report = self.run_cli()
+        self.assertEqual(code, scan.EXIT_BUSY)
+        self.assertIsNone(report)
+
+
+if __name__ == "__main__":
+    unittest.main()
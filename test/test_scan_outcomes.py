@@ -0,0 +1,138 @@
+import unittest
+import tempfile
+import shutil
+import threading
+import pandas as pd
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 stock_signals 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from stock_signals import (run_stock_scan, retry_failed_stocks, merge_signals, summarize_outcomes,
+                           STATUS_OK, STATUS_EMPTY, STATUS_TOO_SHORT, STATUS_FETCH_ERROR)
+
+
+class FlakyProvider(OfflineProvider):
+    """模拟限流、空数据和数据不足的数据源"""
+
+    def __init__(self, failures):
+        super().__init__(universe_size=6)
+        # 每只股票剩余的失败次数
+        self.failures = dict(failures)
+        self.calls = {}
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.calls[stock_code] = self.calls.get(stock_code, 0) + 1
+        if self.failures.get(stock_code, 0) > 0:
+            self.failures[stock_code] -= 1
+            raise ConnectionError('429 Too Many Requests')
+        if stock_code == '600004':
+            return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
+        bars = super().get_daily_bars(stock_code, start_date, end_date)
+        if stock_code == '600005':
+            return bars.iloc[-30:]
+        return bars
+
+
+class TestScanOutcomes(unittest.TestCase):
+    """测试逐只股票的处理结果记录与失败重试"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.cache_dir
+        stock_signals.FETCH_DELAY = 0
+        self.stock_list = [(f"{600000 + i:06d}", f"模拟股票{i + 1}") for i in range(6)]
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.cache_dir)
+
+    def test_outcome_records(self):
+        """每只股票都有对应的处理结果"""
+        # 600001 连续失败超过重试次数，600002 第二次请求成功
+        provider = FlakyProvider({'600001': 5, '600002': 1})
+        set_provider(provider)
+
+        signals, outcomes = run_stock_scan(self.stock_list, max_workers=2, fetch_workers=2)
+        by_code = {outcome['code']: outcome for outcome in outcomes}
+
+        self.assertEqual([o['code'] for o in outcomes], [code for code, _ in self.stock_list])
+        self.assertEqual(by_code['600000']['status'], STATUS_OK)
+        # 日线请求之外还有一次复权因子请求
+        self.assertEqual(by_code['600000']['attempts'], 2)
+        self.assertEqual(by_code['600001']['status'], STATUS_FETCH_ERROR)
+        self.assertEqual(by_code['600001']['attempts'], 3)
+        self.assertIn('429', by_code['600001']['error'])
+        self.assertEqual(by_code['600002']['status'], STATUS_OK)
+        self.assertEqual(by_code['600002']['attempts'], 3)
+        self.assertEqual(by_code['600004']['status'], STATUS_EMPTY)
+        self.assertEqual(by_code['600005']['status'], STATUS_TOO_SHORT)
+        for outcome in outcomes:
+            self.assertGreaterEqual(outcome['latency'], 0)
+        self.assertEqual(len(signals), 3)
+
+        summary = summarize_outcomes(outcomes)
+        self.assertEqual(summary['by_status'][STATUS_OK], 3)
+        self.assertEqual([item['code'] for item in summary['failed']], ['600001'])
+
+    def test_slow_fetch_does_not_block_others(self):
+        """某只股票的行情迟迟不返回时，其他股票照常完成计算，结果仍按股票列表顺序"""
+        others_done = threading.Event()
+        recorded = []
+        others = len(self.stock_list) - 1
+
+        class SlowProvider(OfflineProvider):
+            def get_daily_bars(self, stock_code, start_date, end_date):
+                if stock_code == '600000':
+                    others_done.wait(timeout=30)
+                return super().get_daily_bars(stock_code, start_date, end_date)
+
+        class RecordingCheckpoint:
+            def record(self, run_id, outcome, signal=None):
+                recorded.append(outcome['code'])
+                if len(recorded) == others:
+                    others_done.set()
+
+        set_provider(SlowProvider(universe_size=6))
+        signals, outcomes = run_stock_scan(self.stock_list, max_workers=2, fetch_workers=2,
+                                           checkpoint=RecordingCheckpoint(), run_id=1)
+
+        self.assertEqual(recorded[-1], '600000')
+        self.assertEqual([o['code'] for o in outcomes], [code for code, _ in self.stock_list])
+        self.assertEqual([s['code'] for s in signals], [code for code, _ in self.stock_list])
+
+    def test_retry_only_failed(self):
+        """重试只请求失败的股票，并合并到已有快照"""
+        provider = FlakyProvider({'600001': 3})
+        set_provider(provider)
+        signals, outcomes = run_stock_scan(self.stock_list, max_workers=2, fetch_workers=2)
+        calls_before = dict(provider.calls)
+
+        retried, outcomes = retry_failed_stocks(outcomes, max_rounds=2, backoff=0, max_workers=2, fetch_workers=2)
+
+        retried_codes = {code for code in provider.calls if provider.calls[code] != calls_before.get(code)}
+        self.assertEqual(retried_codes, {'600001'})
+        self.assertEqual([item['code'] for item in retried], ['600001'])
+        by_code = {outcome['code']: outcome for outcome in outcomes}
+        self.assertEqual(by_code['600001']['status'], STATUS_OK)
+        self.assertEqual(by_code['600001']['attempts'], 5)
+
+        merged = merge_signals(signals, retried)
+        self.assertEqual(len(merged), len(signals) + 1)
+        self.assertEqual(merged[:len(signals)], signals)
+
+    def test_merge_replaces_by_code(self):
+        """合并时按code替换已有记录"""
+        snapshot = [{'code': 'a', 'close': 1}, {'code': 'b', 'close': 2}]
+        merged = merge_signals(snapshot, [{'code': 'b', 'close': 3}, {'code': 'c', 'close': 4}])
+        self.assertEqual(merged, [{'code': 'a', 'close': 1}, {'code': 'b', 'close': 3}, {'code': 'c', 'close': 4}])
+
+
+if __name__ == "__main__":
+    unittest.main()
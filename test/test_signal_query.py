@@ -0,0 +1,156 @@
+import unittest
+import tempfile
+import shutil
+import random
+import time
+from datetime import datetime
+import sys
+import os
+
+import pandas as pd
+
+# 添加当前目录到路径，以便导入 signal_query 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import signal_store
+from stock_signals import SIGNAL_NAMES
+from signal_query import SignalIndex, QueryError, build_signal_index
+from trading_calendar import set_calendar, weekday_calendar
+
+
+def make_stock(code, close, date='2025-07-22', **signals):
+    return {'code': code, 'name': f'股票{code}', 'date': date, 'close': close,
+            'signals': {name: signals.get(name, False) for name in SIGNAL_NAMES}}
+
+
+class TestSignalQuery(unittest.TestCase):
+    """测试组合条件选股"""
+
+    def setUp(self):
+        self.stocks = [
+            make_stock('000001', 12.0, 底背离=True, 底结构=True),
+            make_stock('000002', 60.0, 底背离=True, 底结构=True),
+            make_stock('000003', 20.0, 底背离=True, 底结构=True, 顶钝化=True),
+            make_stock('000004', 8.0, 主升=True),
+            make_stock('000005', 30.0),
+        ]
+        self.index = SignalIndex(self.stocks)
+
+    def codes(self, expression, index=None):
+        return [stock['code'] for stock in (index or self.index).query(expression)]
+
+    def test_boolean_and_numeric(self):
+        self.assertEqual(self.codes('底背离 AND 底结构 AND NOT 顶钝化 AND close < 50'), ['000001'])
+        self.assertEqual(self.codes('底背离 and (close >= 50 or 顶钝化)'), ['000002', '000003'])
+        self.assertEqual(self.codes('NOT 底背离'), ['000004', '000005'])
+        self.assertEqual(self.codes('NOT NOT 主升 OR close = 30'), ['000004', '000005'])
+        # NOT 优先于 AND，AND 优先于 OR
+        self.assertEqual(self.codes('主升 OR 底背离 AND close > 50'), ['000002', '000004'])
+        self.assertEqual(self.index.count('close != 8'), 4)
+        self.assertEqual(len(self.index.query('close > 0', limit=2)), 2)
+
+    def test_any_of_recent_days(self):
+        """ANY(信号, N) 包含快照当天和之前N-1个历史交易日"""
+        history = [
+            ('2025-07-21', _frame([('000001', {'主升': True})])),
+            ('2025-07-18', _frame([('000002', {'主升': True}), ('999999', {'主升': True})])),
+        ]
+        index = SignalIndex(self.stocks, history_frames=history)
+        self.assertEqual(index.dates, ['2025-07-22', '2025-07-21', '2025-07-18'])
+        self.assertEqual(self.codes('ANY(主升, 1)', index), ['000004'])
+        self.assertEqual(self.codes('ANY(主升, 2)', index), ['000001', '000004'])
+        self.assertEqual(self.codes('ANY(主升, 3) AND NOT 主升', index), ['000001', '000002'])
+
+    def test_errors(self):
+        for expression in ['', '底背离 AND', '未知信号', 'close < ', '(底背离', 'ANY(主升, 0)', 'volume > 1', '底背离 $']:
+            with self.assertRaises(QueryError, msg=expression):
+                self.index.query(expression)
+
+    def test_full_market_speed(self):
+        """全市场规模的查询在亚毫秒级完成"""
+        rng = random.Random(1)
+        stocks = [make_stock(f'{i:06d}', rng.uniform(2, 100), **{name: rng.random() < 0.1 for name in SIGNAL_NAMES})
+                  for i in range(5000)]
+        index = SignalIndex(stocks)
+        expression = '底背离 AND 底结构 AND NOT 顶钝化 AND close < 50'
+        expected = [s['code'] for s in stocks if s['signals']['底背离'] and s['signals']['底结构']
+                    and not s['signals']['顶钝化'] and s['close'] < 50]
+        self.assertEqual(self.codes(expression, index), expected)
+
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            index.query(expression)
+        self.assertLess((time.perf_counter() - start) / runs, 0.001)
+
+
+def _frame(rows):
+    return pd.DataFrame([{'code': code, **{name: signals.get(name, False) for name in SIGNAL_NAMES}}
+                         for code, signals in rows])
+
+
+class TestHistoryIndex(unittest.TestCase):
+    """测试从历史信号文件构建索引"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_dir = signal_store.HISTORY_DIR
+        signal_store.HISTORY_DIR = self.tmp_dir
+        set_calendar(weekday_calendar())
+
+    def tearDown(self):
+        set_calendar(None)
+        signal_store.HISTORY_DIR = self.old_dir
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_build_from_history_files(self):
+        stocks = [make_stock('000001', 10.0), make_stock('000002', 10.0, 底成立=True)]
+        signal_store.save_history_csv([make_stock('000001', 9.0, date='2025-07-21', 底成立=True)],
+                                      datetime(2025, 7, 21))
+        # 快照当天的历史文件以快照为准
+        signal_store.save_history_csv([make_stock('000001', 9.0, 底成立=True)], datetime(2025, 7, 22))
+        index = build_signal_index(stocks, version=3, lookback_days=2)
+        self.assertEqual(index.dates, ['2025-07-22', '2025-07-21'])
+        self.assertEqual(index.missing_dates, [])
+        self.assertEqual([s['code'] for s in index.query('底成立')], ['000002'])
+        self.assertEqual([s['code'] for s in index.query('ANY(底成立, 2)')], ['000001', '000002'])
+
+    def test_lookback_by_trading_days(self):
+        """ANY(信号, N) 按交易日回看：缺少文件的交易日不会让窗口延伸到更早的日期"""
+        stocks = [make_stock('000001', 10.0), make_stock('000002', 10.0), make_stock('000003', 10.0)]
+        # 07-21、07-18 没有历史文件，07-17 和更早的 07-10 有
+        signal_store.save_history_csv([make_stock('000001', 9.0, date='2025-07-17', 主升=True)],
+                                      datetime(2025, 7, 17))
+        signal_store.save_history_csv([make_stock('000002', 9.0, date='2025-07-10', 主升=True)],
+                                      datetime(2025, 7, 10))
+        index = build_signal_index(stocks)
+        self.assertEqual(index.dates[:4], ['2025-07-22', '2025-07-21', '2025-07-18', '2025-07-17'])
+        self.assertIn('2025-07-21', index.missing_dates)
+        self.assertNotIn('2025-07-17', index.missing_dates)
+        self.assertEqual([s['code'] for s in index.query('ANY(主升, 3)')], [])
+        self.assertEqual([s['code'] for s in index.query('ANY(主升, 4)')], ['000001'])
+        # 07-10 是快照之前的第8个交易日
+        self.assertEqual([s['code'] for s in index.query('ANY(主升, 8)')], ['000001'])
+        self.assertEqual([s['code'] for s in index.query('ANY(主升, 9)')], ['000001', '000002'])
+
+    def test_api(self):
+        import app
+        old = (app.global_signals, app.snapshot_version, signal_store.SNAPSHOT_PATH)
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        try:
+            app.global_signals = [make_stock('000001', 10.0, 底成立=True), make_stock('000002', 99.0, 底成立=True)]
+            app.snapshot_version = 7
+            client = app.app.test_client()
+            data = client.get('/api/query', query_string={'q': '底成立 AND close < 50'}).get_json()
+            self.assertEqual([s['code'] for s in data['signals']], ['000001'])
+            self.assertEqual(data['version'], 7)
+            self.assertEqual(client.get('/api/query', query_string={'q': '底成立 AND'}).status_code, 400)
+            for limit in ('0', '-1', 'abc'):
+                self.assertEqual(client.get('/api/query', query_string={'q': 'close > 0', 'limit': limit})
+                                 .status_code, 400)
+        finally:
+            app.global_signals, app.snapshot_version, signal_store.SNAPSHOT_PATH = old
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import tempfile
+import shutil
+import json
+from datetime import datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 signal_store 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import signal_store
+from market_data import OfflineProvider, set_provider
+from trading_calendar import set_calendar, weekday_calendar
+
+
+def make_signal(code, close=10.0, **signals):
+    return {'code': code, 'name': f'股票{code}', 'date': '2025-07-22', 'close': close,
+            'signals': {'macd_golden_cross': False, 'kdj_golden_cross': False, **signals}}
+
+
+class TestSnapshotVersions(unittest.TestCase):
+    """测试信号快照版本号和增量变化日志"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_paths = (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, signal_store.MAX_DELTAS)
+        signal_store.HISTORY_DIR = self.tmp_dir
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        self.update_time = datetime(2025, 7, 22, 15, 31)
+
+    def tearDown(self):
+        signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, signal_store.MAX_DELTAS = self.old_paths
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_diff_signals(self):
+        """新增、删除和内容变化的股票都算作变化"""
+        old = [make_signal('000001'), make_signal('000002'), make_signal('000003')]
+        new = [make_signal('000001'), make_signal('000002', macd_golden_cross=True), make_signal('000004')]
+        self.assertEqual(signal_store.diff_signals(old, new), ['000002', '000003', '000004'])
+
+    def test_versions_and_changed_codes(self):
+        """每次发布版本号加1，可以查询任意两个版本之间变化的股票"""
+        _, v1 = signal_store.save_snapshot([make_signal('000001'), make_signal('000002')], self.update_time)
+        _, v2 = signal_store.save_snapshot([make_signal('000001', close=11.0), make_signal('000002')],
+                                           self.update_time)
+        _, v3 = signal_store.save_snapshot([make_signal('000001', close=11.0)], self.update_time)
+        self.assertEqual((v1, v2, v3), (1, 2, 3))
+        self.assertEqual(signal_store.load_snapshot()[3], 3)
+
+        self.assertEqual(signal_store.get_changed_codes(3, 3), set())
+        self.assertEqual(signal_store.get_changed_codes(2, 3), {'000002'})
+        self.assertEqual(signal_store.get_changed_codes(1, 3), {'000001', '000002'})
+        self.assertEqual(signal_store.get_changed_codes(0, 3), {'000001', '000002'})
+        # 客户端版本比服务器新（例如快照被重置）时需要全量重新加载
+        self.assertIsNone(signal_store.get_changed_codes(5, 3))
+
+    def test_trimmed_deltas_require_reload(self):
+        """变化日志只保留最近的版本，更早的客户端需要全量重新加载"""
+        signal_store.MAX_DELTAS = 3
+        for i in range(5):
+            signal_store.save_snapshot([make_signal('000001', close=10.0 + i)], self.update_time)
+        self.assertEqual([delta['version'] for delta in signal_store.load_deltas()], [3, 4, 5])
+        self.assertEqual(signal_store.get_changed_codes(2, 5), {'000001'})
+        self.assertIsNone(signal_store.get_changed_codes(1, 5))
+
+    def test_legacy_snapshot_has_version_zero(self):
+        """没有版本号的旧格式快照按版本0读取，下一次发布从版本1开始"""
+        with open(signal_store.SNAPSHOT_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'signals': [make_signal('000001')], 'update_time': '2025-07-22 15:31:00'}, f)
+        self.assertEqual(signal_store.load_snapshot()[3], 0)
+        _, version = signal_store.save_snapshot([make_signal('000001')], self.update_time)
+        self.assertEqual(version, 1)
+        self.assertEqual(signal_store.get_changed_codes(0, 1), set())
+
+
+class TestSignalsDeltaApi(unittest.TestCase):
+    """测试 /api/signals 的增量查询"""
+
+    def setUp(self):
+        import app
+        self.app = app
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, app.WEB_REFRESH_ENABLED,
+                             app.global_signals, app.last_update_time, app.snapshot_mtime, app.snapshot_version)
+        signal_store.HISTORY_DIR = self.tmp_dir
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        app.WEB_REFRESH_ENABLED = False
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, self.app.WEB_REFRESH_ENABLED,
+         self.app.global_signals, self.app.last_update_time, self.app.snapshot_mtime,
+         self.app.snapshot_version) = self.old_settings
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def publish(self, signals):
+        signal_store.save_snapshot(signals, datetime(2025, 7, 22, 15, 31))
+
+    def test_delta_since_version(self):
+        """只返回变化的股票，不再符合筛选条件的股票放在removed中"""
+        self.publish([make_signal('000001', macd_golden_cross=True), make_signal('000002', macd_golden_cross=True),
+                      make_signal('000003')])
+        full = self.client.get('/api/signals?signal_type=macd_golden_cross').get_json()
+        self.assertEqual(full['version'], 1)
+        self.assertEqual([s['code'] for s in full['signals']], ['000001', '000002'])
+
+        self.publish([make_signal('000001', macd_golden_cross=True), make_signal('000002'),
+                      make_signal('000003', macd_golden_cross=True)])
+        data = self.client.get('/api/signals?signal_type=macd_golden_cross&since=1').get_json()
+        self.assertEqual(data['version'], 2)
+        self.assertNotIn('signals', data)
+        self.assertEqual([s['code'] for s in data['delta']['upserts']], ['000003'])
+        self.assertEqual(data['delta']['removed'], ['000002'])
+
+        unchanged = self.client.get('/api/signals?signal_type=macd_golden_cross&since=2').get_json()
+        self.assertEqual(unchanged['delta'], {'upserts': [], 'removed': []})
+
+    def test_unknown_version_returns_full_reload(self):
+        """版本号无法增量更新时返回全量数据并标记reload"""
+        self.publish([make_signal('000001', macd_golden_cross=True)])
+        data = self.client.get('/api/signals?since=7').get_json()
+        self.assertTrue(data['reload'])
+        self.assertEqual([s['code'] for s in data['signals']], ['000001'])
+
+
+if __name__ == '__main__':
+    unittest.main()
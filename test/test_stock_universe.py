@@ -0,0 +1,126 @@
+import unittest
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+from datetime import timedelta
+
+import pandas as pd
+
+# 添加当前目录到路径，以便导入 stock_universe 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fetch_resilience
+import stock_universe
+from market_data import OfflineProvider
+from stock_universe import get_universe, diff_constituents, wait_for_refresh
+
+
+class ConstituentsProvider(OfflineProvider):
+    """成分股可以修改、可以模拟故障的数据源"""
+
+    def __init__(self, codes):
+        super().__init__(universe_size=len(codes))
+        self.codes = list(codes)
+        self.calls = 0
+        self.down = False
+
+    def universe_cache_key(self):
+        return 'stub'
+
+    def get_index_constituents(self, index_code):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError('502 Bad Gateway')
+        return pd.DataFrame({'code': self.codes, 'name': [f"股票{code}" for code in self.codes]})
+
+
+class TestStockUniverse(unittest.TestCase):
+    """测试股票池缓存"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (stock_universe.UNIVERSE_DIR, stock_universe.SUPPLEMENT_PATH)
+        stock_universe.UNIVERSE_DIR = self.tmp_dir
+        stock_universe.SUPPLEMENT_PATH = os.path.join(self.tmp_dir, 'supplement.csv')
+        self.write_supplement(['600900', '600000'])
+        stock_universe.reset()
+        fetch_resilience.reset_breakers()
+        self.provider = ConstituentsProvider(['600000', '600001', '600002'])
+
+    def tearDown(self):
+        stock_universe.reset()
+        fetch_resilience.reset_breakers()
+        stock_universe.UNIVERSE_DIR, stock_universe.SUPPLEMENT_PATH = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def write_supplement(self, codes):
+        pd.DataFrame({'code': codes, 'name': [f"补充{code}" for code in codes]}).to_csv(
+            os.path.join(self.tmp_dir, 'supplement.csv'), index=False)
+
+    def test_cached_universe_skips_provider(self):
+        """有缓存时不再请求成分股，新进程从本地文件加载"""
+        stocks = get_universe(self.provider)
+        self.assertEqual(list(stocks['code']), ['600000', '600001', '600002', '600900'])
+        # 重复的代码保留成分股中的名称
+        self.assertEqual(stocks['name'].iloc[0], '股票600000')
+
+        get_universe(self.provider)
+        stock_universe.reset()
+        self.assertEqual(list(get_universe(self.provider)['code']), list(stocks['code']))
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_supplement_reread_on_change(self):
+        """补充文件修改后重新合并，不请求成分股"""
+        get_universe(self.provider)
+        self.write_supplement(['000001'])
+        path = stock_universe.SUPPLEMENT_PATH
+        os.utime(path, (time.time() + 10, time.time() + 10))
+
+        stocks = get_universe(self.provider)
+        self.assertEqual(list(stocks['code']), ['600000', '600001', '600002', '000001'])
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_stale_cache_refreshes_in_background(self):
+        """缓存过期时立即返回旧股票池，后台更新并记录成分股变化"""
+        get_universe(self.provider)
+        self.provider.codes = ['600000', '600002', '600003']
+
+        stocks = get_universe(self.provider, max_age=timedelta(0))
+        self.assertNotIn('600003', list(stocks['code']))
+        wait_for_refresh(timeout=10)
+
+        self.assertEqual(self.provider.calls, 2)
+        self.assertIn('600003', list(get_universe(self.provider)['code']))
+        with open(os.path.join(self.tmp_dir, 'universe_changes_stub.jsonl'), encoding='utf-8') as f:
+            changes = [json.loads(line) for line in f]
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]['added'], [{'code': '600003', 'name': '股票600003'}])
+        self.assertEqual(changes[0]['removed'], [{'code': '600001', 'name': '股票600001'}])
+
+    def test_outage_keeps_cached_universe(self):
+        """数据源故障时沿用过期缓存，没有缓存时只使用补充股票"""
+        self.provider.down = True
+        stocks = get_universe(self.provider)
+        self.assertEqual(list(stocks['code']), ['600900', '600000'])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'universe_stub.json')))
+
+        self.provider.down = False
+        get_universe(self.provider)
+        self.provider.down = True
+        stocks = get_universe(self.provider, max_age=timedelta(0))
+        wait_for_refresh(timeout=10)
+        self.assertEqual(list(stocks['code']), ['600000', '600001', '600002', '600900'])
+        self.assertEqual(list(get_universe(self.provider)['code']), list(stocks['code']))
+
+    def test_diff_constituents(self):
+        old = pd.DataFrame({'code': ['1', '2'], 'name': ['a', 'b']})
+        new = pd.DataFrame({'code': ['2', '3'], 'name': ['b', 'c']})
+        self.assertEqual(diff_constituents(old, new), {'added': [{'code': '3', 'name': 'c'}],
+                                                       'removed': [{'code': '1', 'name': 'a'}]})
+
+
+if __name__ == "__main__":
+    unittest.main()
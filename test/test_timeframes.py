@@ -0,0 +1,208 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到路径，以便导入 timeframes 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bar_cache
+import signal_store
+import stock_signals
+from market_data import OfflineProvider, set_provider
+from trading_calendar import TradingCalendar
+from stock_signals import (compute_stock_signals, fetch_minute_bars, run_stock_scan, SIGNAL_NAMES,
+                           STATUS_OK)
+from timeframes import (WEEKLY, MONTHLY, MINUTE_60, DAILY, parse_timeframes, select_timeframe, resample,
+                        resample_daily, update_resampled, ResampleCache)
+
+
+def daily_bars(start, end):
+    return OfflineProvider().get_daily_bars('600000', start, end)
+
+
+class TestResample(unittest.TestCase):
+    """测试周线、月线、60分钟线的重采样"""
+
+    def setUp(self):
+        # 离线数据源的交易日历为工作日
+        set_provider(OfflineProvider())
+
+    def tearDown(self):
+        set_provider(None)
+
+    def test_weekly(self):
+        df = daily_bars('20250707', '20250716')
+        weekly = resample_daily(df, WEEKLY)
+        # 日期为该周最后一根日线的日期，本周还没走完
+        self.assertEqual(list(weekly.index.strftime('%Y-%m-%d')), ['2025-07-11', '2025-07-16'])
+        self.assertEqual(list(weekly['partial']), [False, True])
+        first = df.loc['2025-07-07':'2025-07-11']
+        self.assertEqual(weekly['open'].iloc[0], first['open'].iloc[0])
+        self.assertEqual(weekly['high'].iloc[0], first['high'].max())
+        self.assertEqual(weekly['low'].iloc[0], first['low'].min())
+        self.assertEqual(weekly['close'].iloc[0], first['close'].iloc[-1])
+        self.assertEqual(weekly['volume'].iloc[0], first['volume'].sum())
+
+    def test_monthly_partial(self):
+        df = daily_bars('20250501', '20250630')
+        monthly = resample_daily(df, MONTHLY)
+        self.assertEqual(list(monthly.index.strftime('%Y-%m-%d')), ['2025-05-30', '2025-06-30'])
+        self.assertFalse(monthly['partial'].any())
+        # 包含盘中临时K线的月份没有走完
+        df['provisional'] = False
+        df.iloc[-1, df.columns.get_loc('provisional')] = True
+        self.assertEqual(list(resample_daily(df, MONTHLY)['partial']), [False, True])
+
+    def test_partial_uses_calendar(self):
+        """节前最后一个交易日所在的周期已经走完"""
+        df = daily_bars('20250915', '20250930')
+        holidays = TradingCalendar([day for day in pd.bdate_range('2025-09-01', '2025-10-31').date
+                                    if not (day.month == 10 and day.day <= 8)])
+        self.assertEqual(list(resample_daily(df, WEEKLY, calendar=holidays)['partial']), [False, False, False])
+        # 按工作日判断时国庆假期的10月1日至3日还有交易
+        self.assertTrue(resample_daily(df, WEEKLY, calendar=TradingCalendar([]))['partial'].iloc[-1])
+
+    def test_sixty_minutes(self):
+        minutes = OfflineProvider().get_minute_bars('600000', '2025-07-16 00:00:00', '2025-07-16 15:00:00')
+        hourly = resample(minutes, MINUTE_60)
+        self.assertEqual(list(hourly.index.strftime('%H:%M')), ['10:30', '11:30', '14:00', '15:00'])
+        self.assertEqual(list(hourly['partial']), [False] * 4)
+        self.assertEqual(hourly['volume'].sum(), minutes['volume'].sum())
+        # 收盘价与日线一致
+        self.assertEqual(hourly['close'].iloc[-1], daily_bars('20250716', '20250716')['close'].iloc[-1])
+        self.assertEqual(hourly['open'].iloc[2], minutes.loc['2025-07-16 13:05', 'open'])
+
+        # 盘中：13:20 时第三根还没有走完
+        intraday = resample(minutes[minutes.index <= '2025-07-16 13:20'], MINUTE_60)
+        self.assertEqual(list(intraday['partial']), [False, False, True])
+
+    def test_update_resampled_matches_full(self):
+        """增量重采样与完整重采样结果相同，之前的K线有变化时完整重算"""
+        df = daily_bars('20250101', '20250716')
+        cache = ResampleCache()
+        cache.resample('600000', df.iloc[:-3], WEEKLY)
+        pd.testing.assert_frame_equal(cache.resample('600000', df, WEEKLY), resample(df, WEEKLY))
+
+        previous = resample(df.iloc[:-1], MONTHLY)
+        changed = df.copy()
+        changed.iloc[-1, changed.columns.get_loc('close')] += 1
+        pd.testing.assert_frame_equal(update_resampled(previous, df.iloc[:-1], changed, MONTHLY),
+                                      resample(changed, MONTHLY))
+        adjusted = df * 0.5
+        pd.testing.assert_frame_equal(update_resampled(previous, df.iloc[:-1], adjusted, MONTHLY),
+                                      resample(adjusted, MONTHLY))
+
+        minutes = OfflineProvider().get_minute_bars('600000', '2025-07-14 00:00:00', '2025-07-16 15:00:00')
+        morning = minutes[minutes.index <= '2025-07-16 10:50']
+        pd.testing.assert_frame_equal(update_resampled(resample(morning, MINUTE_60), morning, minutes, MINUTE_60),
+                                      resample(minutes, MINUTE_60))
+
+    def test_parse_and_select(self):
+        self.assertEqual(parse_timeframes('daily, weekly,'), (DAILY, WEEKLY))
+        with self.assertRaises(ValueError):
+            parse_timeframes('daily,yearly')
+        record = {'code': '600000', 'name': '浦发银行', 'date': '2025-07-16', 'close': 10.0, 'signals': {},
+                  'timeframes': {WEEKLY: {'date': '2025-07-16', 'close': 10.0, 'partial': True, 'signals': {}}}}
+        self.assertNotIn('timeframes', select_timeframe(record, DAILY))
+        self.assertEqual(select_timeframe(record, WEEKLY)['timeframe'], WEEKLY)
+        self.assertIsNone(select_timeframe(record, MONTHLY))
+
+
+class TestTimeframeSignals(unittest.TestCase):
+    """测试多周期信号的计算和接口"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        bar_cache.BAR_CACHE_DIR = self.tmp_dir
+        stock_signals.FETCH_DELAY = 0
+        self.provider = OfflineProvider(universe_size=3)
+        set_provider(self.provider)
+
+    def tearDown(self):
+        set_provider(None)
+        bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compute_timeframes(self):
+        df = daily_bars('20230101', '20250716')
+        minutes = OfflineProvider().get_minute_bars('600000', '2025-06-01 00:00:00', '2025-07-16 15:00:00')
+        result = compute_stock_signals('600000', '浦发银行', df, lean=True,
+                                       timeframes=(DAILY, WEEKLY, MONTHLY, MINUTE_60), minute_bars=minutes)
+        self.assertEqual(set(result['timeframes']), {WEEKLY, MONTHLY, MINUTE_60})
+        weekly = result['timeframes'][WEEKLY]
+        self.assertEqual(weekly['date'], '2025-07-16')
+        self.assertTrue(weekly['partial'])
+        self.assertEqual(set(weekly['signals']), set(SIGNAL_NAMES))
+        self.assertEqual(result['timeframes'][MINUTE_60]['date'], '2025-07-16 15:00')
+
+        daily_only = compute_stock_signals('600000', '浦发银行', df, lean=True, timeframes=(DAILY,))
+        self.assertNotIn('timeframes', daily_only)
+        self.assertEqual(daily_only['signals'], result['signals'])
+
+    def test_full_scan_sixty_minutes(self):
+        """完整扫描在请求线程中获取5分钟线，计算60分钟线信号"""
+        old_timeframes = stock_signals.SIGNAL_TIMEFRAMES
+        stock_signals.SIGNAL_TIMEFRAMES = (DAILY, MINUTE_60)
+        try:
+            signals, outcomes = run_stock_scan([('600000', '浦发银行')], max_workers=1, fetch_workers=2)
+        finally:
+            stock_signals.SIGNAL_TIMEFRAMES = old_timeframes
+        self.assertEqual(outcomes[0]['status'], STATUS_OK)
+        self.assertEqual(set(signals[0]['timeframes']), {MINUTE_60})
+        self.assertIsNotNone(bar_cache.load_minute_bars('600000'))
+
+    def test_minute_bars_incremental(self):
+        """5分钟线只请求缓存之后的部分"""
+        requests = []
+        get_minute_bars = self.provider.get_minute_bars
+
+        def recording(code, start, end):
+            requests.append(start)
+            return get_minute_bars(code, start, end)
+
+        self.provider.get_minute_bars = recording
+        first = fetch_minute_bars('600000', now=datetime(2025, 7, 15, 15, 30))
+        second = fetch_minute_bars('600000', now=datetime(2025, 7, 16, 11, 0))
+        self.assertEqual(requests, ['2025-05-16 00:00:00', '2025-07-15 15:00:00'])
+        self.assertEqual(second.index[-1], pd.Timestamp('2025-07-16 11:00'))
+        # 窗口随日期后移，缓存的最后一根重新请求，之前的部分沿用缓存
+        kept = first.loc[second.index[0]:].iloc[:-1]
+        pd.testing.assert_frame_equal(second.loc[:kept.index[-1]], kept)
+
+    def test_signals_api_timeframe(self):
+        import app
+        old_app = (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, app.WEB_REFRESH_ENABLED,
+                   app.global_signals, app.last_update_time, app.snapshot_mtime, app.snapshot_version)
+        signal_store.HISTORY_DIR = self.tmp_dir
+        signal_store.SNAPSHOT_PATH = os.path.join(self.tmp_dir, 'stock_signals.json')
+        app.WEB_REFRESH_ENABLED = False
+        try:
+            flags = {name: name == '主升' for name in SIGNAL_NAMES}
+            signals = [{'code': '600000', 'name': '浦发银行', 'date': '2025-07-16', 'close': 10.0, 'signals': flags,
+                        'timeframes': {WEEKLY: {'date': '2025-07-16', 'close': 10.0, 'partial': True,
+                                                'signals': flags}}},
+                       {'code': '600001', 'name': '股票600001', 'date': '2025-07-16', 'close': 9.0, 'signals': flags}]
+            signal_store.save_snapshot(signals, datetime(2025, 7, 16, 15, 31))
+            client = app.app.test_client()
+
+            daily = client.get('/api/signals').get_json()['signals']
+            self.assertEqual([s['code'] for s in daily], ['600000', '600001'])
+            self.assertNotIn('timeframes', daily[0])
+            weekly = client.get('/api/signals?timeframe=weekly').get_json()['signals']
+            self.assertEqual(weekly, [{'code': '600000', 'name': '浦发银行', 'timeframe': WEEKLY,
+                                       'date': '2025-07-16', 'close': 10.0, 'partial': True, 'signals': flags}])
+            self.assertEqual(client.get('/api/signals?timeframe=yearly').status_code, 400)
+        finally:
+            (signal_store.HISTORY_DIR, signal_store.SNAPSHOT_PATH, app.WEB_REFRESH_ENABLED, app.global_signals,
+             app.last_update_time, app.snapshot_mtime, app.snapshot_version) = old_app
+
+
+if __name__ == "__main__":
+    unittest.main()
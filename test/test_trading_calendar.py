@@ -0,0 +1,115 @@
+import unittest
+import tempfile
+import shutil
+from datetime import date, datetime
+import sys
+import os
+
+# 添加当前目录到路径，以便导入 trading_calendar 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import bar_cache
+import stock_signals
+import trading_calendar
+from market_data import OfflineProvider, set_provider
+from trading_calendar import TradingCalendar, load_calendar, set_calendar
+from stock_signals import fetch_stock_data
+
+
+# 2025年10月：1-8日国庆假期，11日（周六）调休上班但股市休市
+HOLIDAY_CALENDAR = TradingCalendar(
+    [d for d in pd.bdate_range('2025-09-01', '2025-12-31').date if not date(2025, 10, 1) <= d <= date(2025, 10, 8)]
+)
+
+
+class CalendarProvider(OfflineProvider):
+    """记录交易日历和日线请求次数的模拟数据源"""
+
+    def __init__(self, fail=False):
+        super().__init__(universe_size=3)
+        self.fail = fail
+        self.calendar_calls = 0
+        self.bar_calls = 0
+
+    def get_trade_dates(self):
+        self.calendar_calls += 1
+        if self.fail:
+            raise ConnectionError('calendar unavailable')
+        return super().get_trade_dates()
+
+    def get_daily_bars(self, stock_code, start_date, end_date):
+        self.bar_calls += 1
+        return super().get_daily_bars(stock_code, start_date, end_date)
+
+
+class TestTradingCalendar(unittest.TestCase):
+    """测试交易日历"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_settings = (trading_calendar.CALENDAR_DIR, bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY)
+        trading_calendar.CALENDAR_DIR = self.tmp_dir
+        bar_cache.BAR_CACHE_DIR = os.path.join(self.tmp_dir, 'bars')
+        stock_signals.FETCH_DELAY = 0
+
+    def tearDown(self):
+        set_calendar(None)
+        set_provider(None)
+        trading_calendar.CALENDAR_DIR, bar_cache.BAR_CACHE_DIR, stock_signals.FETCH_DELAY = self.old_settings
+        shutil.rmtree(self.tmp_dir)
+
+    def test_holiday_windows(self):
+        """节假日不计入交易日，后续N个交易日跨过假期"""
+        cal = HOLIDAY_CALENDAR
+        self.assertFalse(cal.is_trading_day(date(2025, 10, 6)))
+        self.assertEqual(cal.previous_trading_day(date(2025, 10, 9)), date(2025, 9, 30))
+        self.assertEqual(cal.trading_days_after(date(2025, 9, 29), 3),
+                         [date(2025, 9, 30), date(2025, 10, 9), date(2025, 10, 10)])
+        self.assertEqual(len(cal.trading_days_between(date(2025, 9, 29), date(2025, 10, 12))), 4)
+
+    def test_finalized_day(self):
+        """收盘数据定型时间前后的最近定型交易日"""
+        cal = HOLIDAY_CALENDAR
+        self.assertEqual(cal.latest_finalized_day(datetime(2025, 10, 9, 15, 0)), date(2025, 9, 30))
+        self.assertEqual(cal.latest_finalized_day(datetime(2025, 10, 9, 15, 31)), date(2025, 10, 9))
+        self.assertEqual(cal.latest_available_day(datetime(2025, 10, 9, 9, 31)), date(2025, 10, 9))
+        # 假期中不需要刷新：定型时刻停留在节前最后一个交易日
+        self.assertEqual(cal.finalized_time(datetime(2025, 10, 5, 12, 0)), datetime(2025, 9, 30, 15, 31))
+        self.assertTrue(cal.is_window_final(date(2025, 9, 29), 3, datetime(2025, 10, 10, 16, 0)))
+        self.assertFalse(cal.is_window_final(date(2025, 9, 29), 3, datetime(2025, 10, 10, 14, 0)))
+
+    def test_calendar_cached_to_file(self):
+        """交易日历写入本地文件，之后不再请求数据源；请求失败时退回本地文件"""
+        provider = CalendarProvider()
+        first = load_calendar(provider)
+        second = load_calendar(provider)
+        self.assertEqual(provider.calendar_calls, 1)
+        self.assertEqual(first.dates, second.dates)
+
+        failing = CalendarProvider(fail=True)
+        self.assertEqual(load_calendar(failing, max_age=pd.Timedelta(0).to_pytimedelta()).dates, first.dates)
+        self.assertEqual(failing.calendar_calls, 1)
+
+    def test_fetch_skips_finalized_cache(self):
+        """本地缓存已有最近定型交易日的K线时不发起请求"""
+        provider = CalendarProvider()
+        set_provider(provider)
+        set_calendar(TradingCalendar(pd.bdate_range('2020-01-01', '2030-12-31').date))
+        finalized = trading_calendar.get_calendar().latest_finalized_day()
+        bars = provider.get_daily_bars('600000', '20240901', finalized.strftime('%Y%m%d'))
+        provider.bar_calls = 0
+
+        bar_cache.save_bars('600000', bars.iloc[:-1])
+        fetch_stock_data('600000')
+        self.assertEqual(provider.bar_calls, 1)
+
+        bar_cache.save_bars('600000', bars)
+        df, outcome = fetch_stock_data('600000')
+        self.assertEqual(provider.bar_calls, 1)
+        self.assertEqual(outcome['attempts'], 0)
+        self.assertEqual(df.index[-1].date(), finalized)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+多周期K线：由本地K线重采样得到周线、月线和60分钟线，不额外请求数据源
+
+- 周线/月线：由（复权后的）日线按自然周/自然月聚合，日期为该周期最后一根日线的日期
+- 60分钟线：由5分钟线按A股交易时段聚合，四根分别截止于 10:30、11:30、14:00、15:00
+- 聚合按周期边界切分后用 numpy reduceat 一次算出开高低收量，不逐组调用pandas
+- 最后一个周期尚未走完（按交易日历本周/本月还有交易日、本小时还没结束或包含盘中临时K线）时 partial 为True
+- 增量更新：update_resampled 只重新聚合最后一个（未走完的）周期及其后的新K线，
+  之前已经走完的周期直接沿用（盘中刷新时每次只有当日K线变化）
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from market_data import BAR_COLUMNS
+from trading_calendar import get_calendar
+
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+MINUTE_60 = '60min'
+TIMEFRAMES = (DAILY, WEEKLY, MONTHLY, MINUTE_60)
+# 由日线重采样得到的周期
+DAILY_DERIVED = {WEEKLY: 'W', MONTHLY: 'M'}
+
+# 60分钟线每根的截止时刻（分钟数）：上午两根、下午两根
+HOUR_BAR_ENDS = np.array([10 * 60 + 30, 11 * 60 + 30, 14 * 60, 15 * 60])
+MORNING_OPEN = 9 * 60 + 30
+AFTERNOON_OPEN = 13 * 60
+
+# 计算各周期信号所需的最少K线数量（日线见 stock_signals.MIN_BARS）
+TIMEFRAME_MIN_BARS = {WEEKLY: 60, MONTHLY: 24, MINUTE_60: 120}
+
+
+def parse_timeframes(value):
+    """逗号分隔的周期列表 -> 元组，忽略空项，未知周期抛出ValueError"""
+    items = tuple(item.strip() for item in (value or '').split(',') if item.strip())
+    unknown = [item for item in items if item not in TIMEFRAMES]
+    if unknown:
+        raise ValueError(f"未知的周期: {', '.join(unknown)}，可选 {', '.join(TIMEFRAMES)}")
+    return items
+
+
+def select_timeframe(record, timeframe):
+    """
+    从扫描结果中取出一个周期的信号记录
+
+    Returns:
+        日线为去掉 timeframes 字段的原记录；其他周期为 code/name/timeframe/date/close/partial/signals，
+        该股票没有这个周期的结果（K线不足等）时返回None
+    """
+    if timeframe == DAILY:
+        if 'timeframes' not in record:
+            return record
+        return {key: value for key, value in record.items() if key != 'timeframes'}
+    data = record.get('timeframes', {}).get(timeframe)
+    if data is None:
+        return None
+    return dict(code=record['code'], name=record['name'], timeframe=timeframe, **data)
+
+
+def _aggregate(df, codes, index):
+    """按已排序的分组编号聚合开高低收量；index 为每组的标签（与分组数相同）"""
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)] - 1
+    out = pd.DataFrame({
+        'open': df['open'].to_numpy(dtype=float)[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(dtype=float), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(dtype=float), starts),
+        'close': df['close'].to_numpy(dtype=float)[ends],
+        'volume': np.add.reduceat(df['volume'].to_numpy(dtype=float), starts)
+    }, index=index(starts, ends))
+    if 'provisional' in df.columns:
+        out['provisional'] = np.logical_or.reduceat(df['provisional'].to_numpy(dtype=bool), starts)
+    else:
+        out['provisional'] = False
+    return out
+
+
+def resample_daily(df, timeframe, calendar=None):
+    """
+    日线 -> 周线/月线
+
+    Args:
+        df: 以date为索引的日线（可以包含provisional列）
+        timeframe: WEEKLY 或 MONTHLY
+        calendar: 判断周期是否走完的交易日历，默认为当前数据源的日历
+
+    Returns:
+        以该周期最后一个交易日为索引的K线，provisional 为包含临时K线的周期，partial 为尚未走完的周期
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS + ['provisional', 'partial'])
+    periods = df.index.to_period(DAILY_DERIVED[timeframe])
+    codes = periods.asi8
+    out = _aggregate(df, codes, lambda starts, ends: df.index[ends])
+    # 只有最后一个周期可能没有走完：该周期在最后一根K线之后还有交易日（节前最后一个交易日所在的周期已经走完）
+    out['partial'] = out['provisional']
+    last_day = df.index[-1].date()
+    period_end = periods[-1].end_time.date()
+    calendar = calendar or get_calendar()
+    if last_day < period_end and calendar.trading_days_between(last_day + timedelta(days=1), period_end):
+        out.iloc[-1, out.columns.get_loc('partial')] = True
+    return out
+
+
+def resample_minutes(df):
+    """
+    5分钟线（或1分钟线） -> 60分钟线
+
+    Args:
+        df: 以每根K线的截止时刻为索引的分钟线
+
+    Returns:
+        以 10:30/11:30/14:00/15:00 为索引的60分钟线，最后一根没有走到截止时刻时 partial 为True
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS + ['provisional', 'partial'])
+    index = df.index
+    minutes = (index.hour * 60 + index.minute).to_numpy()
+    morning = np.clip(np.ceil((minutes - MORNING_OPEN) / 60), 1, 2)
+    afternoon = np.clip(2 + np.ceil((minutes - AFTERNOON_OPEN) / 60), 3, 4)
+    buckets = np.where(minutes <= 12 * 60, morning, afternoon).astype(np.int64)
+    days = index.normalize()
+    codes = days.asi8 // (60 * 10 ** 9) + buckets
+    out = _aggregate(df, codes, lambda starts, ends: days[starts] + pd.to_timedelta(
+        HOUR_BAR_ENDS[buckets[starts] - 1], unit='min'))
+    out.index.name = 'time'
+    out['partial'] = out['provisional']
+    if index[-1] < out.index[-1]:
+        out.iloc[-1, out.columns.get_loc('partial')] = True
+    return out
+
+
+def resample(df, timeframe):
+    """按周期重采样；DAILY 原样返回"""
+    if timeframe == DAILY:
+        return df
+    if timeframe == MINUTE_60:
+        return resample_minutes(df)
+    return resample_daily(df, timeframe)
+
+
+def _period_start(df, timeframe, label):
+    """label 所在周期在df中的第一根K线的位置"""
+    if timeframe == MINUTE_60:
+        bucket_ends = label.normalize() + pd.to_timedelta(HOUR_BAR_ENDS, unit='min')
+        position = int(np.searchsorted(bucket_ends, label))
+        start = bucket_ends[position - 1] if position > 0 else label.normalize()
+        return int(df.index.searchsorted(start, side='right'))
+    period = label.to_period(DAILY_DERIVED[timeframe])
+    return int(df.index.searchsorted(period.start_time))
+
+
+def update_resampled(previous, source, df, timeframe):
+    """
+    增量重采样：沿用 previous 中已经走完的周期，只重新聚合最后一个周期及之后的K线
+
+    Args:
+        previous: 上次的重采样结果
+        source: 上次重采样时的原始K线
+        df: 新的原始K线
+
+    Returns:
+        与 resample(df, timeframe) 相同的结果；之前的K线有变化（如复权因子更新）时完整重算
+    """
+    if previous is None or source is None or len(previous) < 2 or len(df) == 0:
+        return resample(df, timeframe)
+    start = _period_start(source, timeframe, previous.index[-1])
+    if start == 0 or start > len(df) or not df.index[:start].equals(source.index[:start]) or \
+            not np.array_equal(df['close'].to_numpy()[:start], source['close'].to_numpy()[:start]):
+        return resample(df, timeframe)
+    return pd.concat([previous.iloc[:-1], resample(df.iloc[start:], timeframe)])
+
+
+class ResampleCache:
+    """按 (股票代码, 周期) 缓存重采样结果，供盘中刷新增量更新（有界LRU）"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resample(self, stock_code, df, timeframe):
+        key = (stock_code, timeframe)
+        with self._lock:
+            previous, source = self._entries.get(key, (None, None))
+        result = update_resampled(previous, source, df, timeframe)
+        with self._lock:
+            self._entries[key] = (result, df)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,178 @@
+import bisect
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+
+from market_data import get_provider
+from logger_config import log_stock_analysis
+
+
+# 交易日历缓存在本地文件中，很少变化，过期后才重新请求
+CALENDAR_DIR = os.environ.get(
+    'TRADE_CALENDAR_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datas', 'cache')
+)
+CALENDAR_MAX_AGE = timedelta(days=30)
+
+# 开盘时间：交易日此后才有当日K线
+MARKET_OPEN = time(9, 30)
+# 收盘数据定型时间：交易日此后当日K线不再变化（与历史信号的保存时间一致）
+FINALIZE_TIME = time(15, 31)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+class TradingCalendar:
+    """
+    交易日历
+
+    回答哪些日期有K线、某个日期之后的N个交易日、最近一个已定型的交易日等问题。
+    超出日历范围的日期按工作日估算。
+    """
+
+    def __init__(self, dates):
+        self.dates = sorted({_to_date(d) for d in dates})
+        self._date_set = set(self.dates)
+
+    def covers(self, day):
+        """日期是否在日历范围内"""
+        day = _to_date(day)
+        return bool(self.dates) and self.dates[0] <= day <= self.dates[-1]
+
+    def is_trading_day(self, day):
+        day = _to_date(day)
+        if self.covers(day):
+            return day in self._date_set
+        return day.weekday() < 5
+
+    def previous_trading_day(self, day):
+        """严格早于day的最近一个交易日"""
+        day = _to_date(day) - timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def latest_trading_day(self, day):
+        """不晚于day的最近一个交易日"""
+        day = _to_date(day)
+        return day if self.is_trading_day(day) else self.previous_trading_day(day)
+
+    def trading_days_between(self, start, end):
+        """[start, end] 区间内的交易日列表"""
+        start, end = _to_date(start), _to_date(end)
+        if self.covers(start) and self.covers(end):
+            return self.dates[bisect.bisect_left(self.dates, start):bisect.bisect_right(self.dates, end)]
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)
+                if self.is_trading_day(start + timedelta(days=i))]
+
+    def trading_days_after(self, day, count):
+        """day之后（不含day）的count个交易日"""
+        day = _to_date(day)
+        result = []
+        while len(result) < count:
+            day += timedelta(days=1)
+            if self.is_trading_day(day):
+                result.append(day)
+        return result
+
+    def latest_available_day(self, now=None):
+        """当前时刻已经有K线的最近一个交易日（开盘后当日也算，盘中K线尚未定型）"""
+        now = now or datetime.now()
+        if self.is_trading_day(now) and now.time() >= MARKET_OPEN:
+            return now.date()
+        return self.previous_trading_day(now)
+
+    def latest_finalized_day(self, now=None):
+        """当前时刻K线已经定型的最近一个交易日"""
+        now = now or datetime.now()
+        if self.is_trading_day(now) and now.time() >= FINALIZE_TIME:
+            return now.date()
+        return self.previous_trading_day(now)
+
+    def finalized_time(self, now=None):
+        """最近一个交易日收盘数据定型的时刻，在此之后更新过的数据不需要再刷新"""
+        return datetime.combine(self.latest_finalized_day(now), FINALIZE_TIME)
+
+    def is_window_final(self, day, count, now=None):
+        """day之后count个交易日的K线是否都已经定型（不会再变化）"""
+        return self.trading_days_after(day, count)[-1] <= self.latest_finalized_day(now)
+
+
+def weekday_calendar():
+    """没有可用日历时按工作日估算（不含节假日）"""
+    return TradingCalendar([])
+
+
+def _calendar_path(provider_name):
+    return os.path.join(CALENDAR_DIR, f'trade_calendar_{provider_name}.csv')
+
+
+def load_calendar(provider=None, max_age=CALENDAR_MAX_AGE, today=None):
+    """
+    加载交易日历
+
+    优先读取本地文件；文件不存在、超过max_age或不覆盖今天时从数据源重新获取并写回文件。
+    数据源请求失败时退回过期的本地文件，再退回按工作日估算。
+    """
+    provider = provider or get_provider()
+    today = today or date.today()
+    path = _calendar_path(provider.name)
+
+    stale = None
+    if os.path.exists(path):
+        try:
+            calendar = TradingCalendar(pd.read_csv(path)['date'])
+            age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(path))
+            if age <= max_age and calendar.covers(today):
+                return calendar
+            stale = calendar
+        except Exception as e:
+            log_stock_analysis(f"读取交易日历失败: {e}", 'warning')
+
+    try:
+        calendar = TradingCalendar(provider.get_trade_dates())
+        os.makedirs(CALENDAR_DIR, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        pd.DataFrame({'date': [d.strftime('%Y-%m-%d') for d in calendar.dates]}).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        log_stock_analysis(f"交易日历已更新: {calendar.dates[0]} ~ {calendar.dates[-1]}")
+        return calendar
+    except Exception as e:
+        log_stock_analysis(f"获取交易日历失败: {e}", 'warning')
+    return stale or weekday_calendar()
+
+
+_calendars = {}
+_loaded_on = {}
+_lock = threading.Lock()
+
+
+def get_calendar():
+    """获取当前数据源的交易日历，每个进程每天最多加载一次"""
+    provider = get_provider()
+    today = date.today()
+    with _lock:
+        if _loaded_on.get(provider.name) != today:
+            _calendars[provider.name] = load_calendar(provider, today=today)
+            _loaded_on[provider.name] = today
+        return _calendars[provider.name]
+
+
+def set_calendar(calendar, provider_name=None):
+    """替换当前数据源的交易日历（测试用），传入None则在下次使用时重新加载"""
+    name = provider_name or get_provider().name
+    with _lock:
+        if calendar is None:
+            _calendars.pop(name, None)
+            _loaded_on.pop(name, None)
+        else:
+            _calendars[name] = calendar
+            _loaded_on[name] = date.today()